@@ -0,0 +1,309 @@
+# -*- coding: utf-8 -*-
+"""Benchmark suite for tableschema-spss
+
+Generates synthetic .sav/.zsav files and times the Storage and Mapper operations
+on them, for each compression. Results include the size of the file read or written
+and the throughput of each timing, and are stored as JSON so runs can be compared:
+
+    python benchmarks/benchmark.py run --output before.json
+    python benchmarks/benchmark.py run --output after.json
+    python benchmarks/benchmark.py compare before.json after.json
+
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import io
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import datetime
+import savReaderWriter
+from tableschema_spss import Storage
+from tableschema_spss.mapper import Mapper
+
+
+# Module API
+
+OPERATIONS = [
+    'create', 'write', 'describe', 'iter', 'read',
+    'convert_descriptor', 'restore_descriptor',
+]
+MIXES = ['numeric', 'string', 'date', 'time', 'mixed']
+COMPRESSIONS = ['none', 'bytecode', 'zlib', 'auto']
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='tableschema-spss benchmarks')
+    subparsers = parser.add_subparsers(dest='command')
+    run_parser = subparsers.add_parser('run', help='run benchmarks')
+    run_parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000],
+                            help='numbers of rows (e.g. 1000 100000 10000000)')
+    run_parser.add_argument('--vars', type=int, nargs='+', default=[10, 100],
+                            help='numbers of variables (e.g. 10 500 5000)')
+    run_parser.add_argument('--mixes', nargs='+', default=MIXES, choices=MIXES,
+                            help='variable type mixes')
+    run_parser.add_argument('--compressions', nargs='+', default=COMPRESSIONS,
+                            choices=COMPRESSIONS, help='file compressions')
+    run_parser.add_argument('--operations', nargs='+', default=OPERATIONS,
+                            choices=OPERATIONS, help='operations to time')
+    run_parser.add_argument('--repeat', type=int, default=3,
+                            help='number of timings per operation')
+    run_parser.add_argument('--output', help='path of the JSON results file')
+    compare_parser = subparsers.add_parser('compare', help='compare two result files')
+    compare_parser.add_argument('baseline', help='baseline JSON results file')
+    compare_parser.add_argument('current', help='current JSON results file')
+    compare_parser.add_argument('--threshold', type=float, default=1.1,
+                                help='ratio above which a timing is reported as slower')
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        results = run(args.rows, args.vars, args.mixes, args.compressions,
+                      args.operations, repeat=args.repeat)
+        if args.output:
+            with io.open(args.output, 'w', encoding='utf-8') as file:
+                file.write(json.dumps(results, indent=2, sort_keys=True))
+        else:
+            print(json.dumps(results, indent=2, sort_keys=True))
+    elif args.command == 'compare':
+        with io.open(args.baseline, encoding='utf-8') as file:
+            baseline = json.load(file)
+        with io.open(args.current, encoding='utf-8') as file:
+            current = json.load(file)
+        slower = compare(baseline, current, threshold=args.threshold)
+        return 1 if slower else 0
+    else:
+        parser.print_help()
+    return 0
+
+
+def run(rows_list, vars_list, mixes, compressions, operations, repeat=3):
+    """Run benchmarks for every combination of the passed parameters
+
+    Returns a dict of `meta` data about the run and a list of `results`.
+    """
+    results = []
+    base_path = tempfile.mkdtemp(prefix='tableschema-spss-benchmark-')
+    try:
+        for rows in rows_list:
+            for vars in vars_list:
+                for mix in mixes:
+                    for compression in compressions:
+                        case = Case(base_path, rows, vars, mix, compression)
+                        for operation in operations:
+                            timings = case.time(operation, repeat)
+                            result = case.describe(operation, timings)
+                            results.append(result)
+                            print('{case} {operation}: {seconds[min]:.4f}s '
+                                  '{rows_per_second:.0f} rows/s {file_size} bytes'.format(
+                                      **result), file=sys.stderr)
+                        case.remove()
+    finally:
+        shutil.rmtree(base_path)
+    return {'meta': get_meta(), 'results': results}
+
+
+def compare(baseline, current, threshold=1.1):
+    """Print current timings relative to baseline ones
+
+    Returns the list of (case, operation) keys slower than `threshold`.
+    """
+    baseline_results = {(r['case'], r['operation']): r for r in baseline['results']}
+    slower = []
+    for result in current['results']:
+        key = (result['case'], result['operation'])
+        if key not in baseline_results:
+            continue
+        before = baseline_results[key]['seconds']['min']
+        after = result['seconds']['min']
+        ratio = after / before if before else float('inf')
+        flag = ''
+        if ratio > threshold:
+            flag = '  SLOWER'
+            slower.append(key)
+        print('{} {}: {:.4f}s -> {:.4f}s ({:.2f}x){}'.format(
+            key[0], key[1], before, after, ratio, flag))
+    return slower
+
+
+class Case(object):
+    """Synthetic bucket of `rows` cases and `vars` variables of a type `mix`
+    """
+
+    # Public
+
+    def __init__(self, base_path, rows, vars, mix, compression):
+        self.rows = rows
+        self.vars = vars
+        self.mix = mix
+        self.compression = compression
+        self.descriptor = get_descriptor(vars, mix)
+        # Resolve `auto` so results show the compression it chose
+        self.file_compression = compression
+        if compression == 'auto':
+            self.file_compression = Mapper().choose_compression(self.descriptor, rows)
+        self.name = '{}-{}x{}-{}'.format(mix, rows, vars, compression)
+        extension = 'zsav' if self.file_compression == 'zlib' else 'sav'
+        self.bucket = '{}.{}'.format(self.name, extension)
+        self.storage = Storage(base_path=base_path, compression=self.file_compression)
+        self.file_path = os.path.join(base_path, self.bucket)
+        self.write_file_path = os.path.join(base_path, 'write-' + self.bucket)
+        write_file(self.storage, self.bucket, self.descriptor, rows)
+
+    def describe(self, operation, timings):
+        timings = sorted(timings)
+        # Create and write are measured on the file they produce
+        file_path = self.file_path
+        if operation in ('create', 'write'):
+            file_path = self.write_file_path
+        file_size = os.path.getsize(file_path)
+        return {
+            'case': self.name,
+            'operation': operation,
+            'rows': self.rows,
+            'vars': self.vars,
+            'mix': self.mix,
+            'compression': self.compression,
+            'file_compression': self.file_compression,
+            'file_size': file_size,
+            'repeat': len(timings),
+            'rows_per_second': self.rows / timings[0] if timings[0] else 0,
+            'megabytes_per_second':
+                file_size / timings[0] / 10 ** 6 if timings[0] else 0,
+            'seconds': {
+                'min': timings[0],
+                'median': timings[len(timings) // 2],
+                'max': timings[-1],
+            },
+        }
+
+    def time(self, operation, repeat):
+        prepare = {
+            'create': self.__prepare_create,
+            'write': self.__prepare_write,
+            'describe': self.__prepare_describe,
+            'iter': self.__prepare_iter,
+            'read': self.__prepare_read,
+            'convert_descriptor': self.__prepare_convert_descriptor,
+            'restore_descriptor': self.__prepare_restore_descriptor,
+        }[operation]
+        timings = []
+        for _ in range(repeat):
+            func = prepare()
+            start = timer()
+            func()
+            timings.append(timer() - start)
+        return timings
+
+    def remove(self):
+        self.storage.delete(self.bucket, ignore=True)
+        self.storage.delete('write-' + self.bucket, ignore=True)
+
+    # Private
+
+    def __prepare_create(self):
+        bucket = 'write-' + self.bucket
+        return lambda: self.storage.create(bucket, self.descriptor, force=True)
+
+    def __prepare_write(self):
+        bucket = 'write-' + self.bucket
+        self.storage.create(bucket, self.descriptor, force=True)
+        rows = list(self.storage.iter(self.bucket))
+        return lambda: self.storage.write(bucket, rows)
+
+    def __prepare_describe(self):
+        storage = Storage(base_path=os.path.dirname(self.file_path))
+
+        def describe():
+            Storage.descriptor_cache.invalidate()
+            storage.describe(self.bucket)
+
+        return describe
+
+    def __prepare_iter(self):
+        storage = Storage(base_path=os.path.dirname(self.file_path))
+        return lambda: [None for _ in storage.iter(self.bucket)]
+
+    def __prepare_read(self):
+        storage = Storage(base_path=os.path.dirname(self.file_path))
+        return lambda: storage.read(self.bucket)
+
+    def __prepare_convert_descriptor(self):
+        return lambda: Mapper().convert_descriptor(self.descriptor)
+
+    def __prepare_restore_descriptor(self):
+        with savReaderWriter.SavHeaderReader(self.file_path, ioUtf8=True) as header:
+            metadata = header.all()
+        return lambda: Mapper().restore_descriptor(metadata)
+
+
+def get_descriptor(vars, mix):
+    """Return a descriptor of `vars` fields of a type `mix`
+    """
+    kinds = MIXES[:-1] if mix == 'mixed' else [mix]
+    fields = []
+    for index in range(vars):
+        kind = kinds[index % len(kinds)]
+        field = dict(FIELDS[kind], name='var{}'.format(index))
+        fields.append(field)
+    return {'fields': fields}
+
+
+def write_file(storage, bucket, descriptor, rows, seed=0):
+    """Write `rows` random cases matching `descriptor` to a bucket of `storage`
+    """
+    randoms = random.Random(seed)
+    generators = [GENERATORS[field['type']] for field in descriptor['fields']]
+    storage.create(bucket, descriptor, force=True, row_count=rows)
+    with storage.open_writer(bucket) as writer:
+        writer.append([generate(randoms) for generate in generators] for _ in range(rows))
+
+
+def get_meta():
+    """Return data about the benchmark environment
+    """
+    version_path = os.path.join(
+        os.path.dirname(__file__), '..', 'tableschema_spss', 'VERSION')
+    with io.open(version_path, encoding='utf-8') as file:
+        version = file.read().strip()
+    return {
+        'version': version,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'timestamp': datetime.datetime.utcnow().isoformat(),
+    }
+
+
+# Internal
+
+timer = getattr(time, 'perf_counter', time.time)
+
+FIELDS = {
+    'numeric': {'type': 'number', 'spss:format': 'F8.2'},
+    'string': {'type': 'string', 'spss:format': 'A20'},
+    'date': {'type': 'date', 'format': Mapper.DATE_FORMAT, 'spss:format': 'ADATE10'},
+    'time': {'type': 'time', 'format': Mapper.TIME_FORMAT, 'spss:format': 'TIME11.2'},
+}
+
+GENERATORS = {
+    'number': lambda randoms: round(randoms.uniform(0, 100000), 2),
+    'string': lambda randoms: ''.join(
+        randoms.choice('abcdefghijklmnopqrstuvwxyz ') for _ in range(20)).strip(),
+    'date': lambda randoms: datetime.date.fromordinal(randoms.randint(
+        datetime.date(1962, 1, 1).toordinal(), datetime.date(2019, 12, 31).toordinal())),
+    'time': lambda randoms: datetime.time(
+        randoms.randint(0, 23), randoms.randint(0, 59), randoms.randint(0, 59),
+        randoms.randint(0, 99) * 10000),
+}
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -23,8 +23,22 @@ INSTALL_REQUIRES = [
     'tableschema>=1.0',
     'savReaderWriter>=3.0'
 ]
+NUMPY_REQUIRE = [
+    'numpy',
+]
+ARROW_REQUIRE = [
+    'numpy',
+    'pyarrow',
+]
+PANDAS_REQUIRE = [
+    'numpy',
+    'pandas>=1.0',
+]
 TESTS_REQUIRE = [
     'mock',
+    'numpy',
+    'pandas>=1.0',
+    'pyarrow',
     'pylama',
     'pytest',
     'pytest-cov',
@@ -43,7 +57,8 @@ setup(
     include_package_data=True,
     install_requires=INSTALL_REQUIRES,
     tests_require=TESTS_REQUIRE,
-    extras_require={'develop': TESTS_REQUIRE},
+    extras_require={'develop': TESTS_REQUIRE, 'numpy': NUMPY_REQUIRE,
+                    'arrow': ARROW_REQUIRE, 'pandas': PANDAS_REQUIRE},
     zip_safe=False,
     long_description=README,
     long_description_content_type='text/markdown',
@@ -4,4 +4,7 @@ from __future__ import print_function
 from __future__ import absolute_import
 from __future__ import unicode_literals
 
-from .storage import Storage
+import sys
+from .storage import Storage, Appender
+if sys.version_info >= (3, 6):
+    from .async_storage import AsyncStorage
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import asyncio
+import functools
+import threading
+import concurrent.futures
+from .storage import Storage
+
+
+# Module API
+
+class AsyncStorage(object):
+    """Asyncio facade over SPSS storage
+
+    Blocking `Storage` calls run in a bounded pool of threads so the event loop is
+    never blocked by reading or writing .sav files. Requires Python 3.6+.
+
+    # Arguments
+        base_path (str): a valid directory path (see `Storage`)
+        workers (int): maximum number of threads running storage calls. Each
+            `iter` in progress holds one of them until it's exhausted or closed.
+        prefetch (int): number of row batches `iter` decodes ahead of its consumer
+        batch_size (int): number of rows handed over to the event loop at once
+        options (dict): other `Storage` options (e.g. `metrics`)
+
+    """
+
+    # Public
+
+    def __init__(self, base_path=None, workers=4, prefetch=4, batch_size=1024, **options):
+        if prefetch < 1:
+            raise ValueError('prefetch must be at least 1')
+        self.__base_path = base_path
+        self.__storage = Storage(base_path=base_path, **options)
+        self.__executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+        self.__prefetch = prefetch
+        self.__batch_size = batch_size
+
+    def __repr__(self):
+        return 'AsyncStorage <{}>'.format(self.__base_path)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, type, value, traceback):
+        await self.close()
+
+    @property
+    def storage(self):
+        """Wrapped storage
+
+        # Returns
+            Storage: storage running the blocking calls
+
+        """
+        return self.__storage
+
+    async def buckets(self):
+        """List buckets (see `Storage.buckets`)
+        """
+        return await self.__run(lambda: self.__storage.buckets)
+
+    async def create(self, bucket, descriptor, force=False, **options):
+        """Create buckets (see `Storage.create`)
+        """
+        return await self.__run(
+            self.__storage.create, bucket, descriptor, force=force, **options)
+
+    async def delete(self, bucket=None, ignore=False):
+        """Delete buckets (see `Storage.delete`)
+        """
+        return await self.__run(self.__storage.delete, bucket, ignore=ignore)
+
+    async def describe(self, bucket, descriptor=None):
+        """Describe bucket (see `Storage.describe`)
+        """
+        return await self.__run(self.__storage.describe, bucket, descriptor)
+
+    async def count(self, bucket):
+        """Count bucket rows (see `Storage.count`)
+        """
+        return await self.__run(self.__storage.count, bucket)
+
+    async def info(self, bucket):
+        """Get bucket file metadata (see `Storage.info`)
+        """
+        return await self.__run(self.__storage.info, bucket)
+
+    async def stats(self, bucket, **options):
+        """Get bucket column statistics (see `Storage.stats`)
+        """
+        return await self.__run(self.__storage.stats, bucket, **options)
+
+    async def get_rows(self, bucket, indices, **options):
+        """Get bucket rows by case number (see `Storage.get_rows`)
+        """
+        return await self.__run(self.__storage.get_rows, bucket, indices, **options)
+
+    async def sample(self, bucket, n, **options):
+        """Get a random sample of bucket rows (see `Storage.sample`)
+        """
+        return await self.__run(self.__storage.sample, bucket, n, **options)
+
+    async def build_index(self, bucket, **options):
+        """Build bucket case index (see `Storage.build_index`)
+        """
+        return await self.__run(self.__storage.build_index, bucket, **options)
+
+    async def read(self, bucket, **options):
+        """Read bucket rows (see `Storage.read`)
+        """
+        return await self.__run(self.__storage.read, bucket, **options)
+
+    async def write(self, bucket, rows):
+        """Write rows to bucket (see `Storage.write`)
+        """
+        return await self.__run(self.__storage.write, bucket, rows)
+
+    async def iter(self, bucket, **options):
+        """Iterate over bucket rows with `async for`
+
+        Rows are read by `Storage.iter` in a worker thread, up to `prefetch`
+        batches ahead of the consumer. Closing the iterator early stops reading.
+
+        # Arguments
+            bucket (str): bucket name
+            options (dict): `Storage.iter` options (e.g. `fields`)
+
+        # Returns
+            list[]: yields rows of cast values
+
+        """
+        loop = asyncio.get_event_loop()
+        queue = asyncio.Queue()
+        slots = threading.Semaphore(self.__prefetch)
+        stopped = threading.Event()
+        producer = loop.run_in_executor(self.__executor, functools.partial(
+            self.__produce, loop, queue, slots, stopped, bucket, options))
+        try:
+            while True:
+                rows, error = await queue.get()
+                slots.release()
+                if error is not None:
+                    raise error
+                if rows is None:
+                    break
+                for row in rows:
+                    yield row
+        finally:
+            # Wake the producer up if it waits for a slot so it notices it's stopped
+            stopped.set()
+            slots.release()
+            await producer
+
+    async def close(self):
+        """Wait for running calls and release the threads
+        """
+        await asyncio.get_event_loop().run_in_executor(
+            None, functools.partial(self.__executor.shutdown, wait=True))
+
+    # Private
+
+    def __run(self, func, *args, **kwargs):
+        return asyncio.get_event_loop().run_in_executor(
+            self.__executor, functools.partial(func, *args, **kwargs))
+
+    def __produce(self, loop, queue, slots, stopped, bucket, options):
+        """Put batches of rows to `queue` until exhausted, failed or stopped.
+        """
+        def put(rows, error=None):
+            slots.acquire()
+            if stopped.is_set():
+                return False
+            loop.call_soon_threadsafe(queue.put_nowait, (rows, error))
+            return True
+
+        try:
+            rows = []
+            for row in self.__storage.iter(bucket, **options):
+                rows.append(row)
+                if len(rows) >= self.__batch_size:
+                    if not put(rows):
+                        return
+                    rows = []
+            if put(rows):
+                put(None)
+        except Exception as exception:
+            put(None, exception)
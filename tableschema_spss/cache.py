@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import os
+import threading
+import collections
+
+
+# Module API
+
+class FileCache(object):
+    """LRU cache of values computed from files
+
+    Entries are keyed by file identity: real path, size, modification time and
+    inode. An entry is only returned while the file is unchanged, so values are
+    recomputed after the file has been rewritten or replaced.
+
+    # Arguments
+        maxsize (int): maximum number of cached files, 0 disables caching
+
+    """
+
+    # Public
+
+    def __init__(self, maxsize=128):
+        self.__maxsize = maxsize
+        self.__entries = collections.OrderedDict()
+        self.__lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.__entries)
+
+    @property
+    def maxsize(self):
+        """Maximum number of cached files
+
+        # Returns
+            int: maximum number of cached files
+
+        """
+        return self.__maxsize
+
+    @maxsize.setter
+    def maxsize(self, maxsize):
+        with self.__lock:
+            self.__maxsize = maxsize
+            self.__evict()
+
+    def get(self, file_path, compute=None):
+        """Get value for file, computing it if not cached
+
+        # Arguments
+            file_path (str): file path
+            compute (func): function returning the value for `file_path`
+
+        # Returns
+            any: cached or computed value, None if not cached and no `compute`
+
+        """
+        key, identity = get_file_identity(file_path)
+        with self.__lock:
+            entry = self.__entries.pop(key, None)
+            if entry is not None and entry[0] == identity:
+                self.__entries[key] = entry
+                return entry[1]
+        if compute is None:
+            return None
+        value = compute(file_path)
+        self.set(file_path, value)
+        return value
+
+    def set(self, file_path, value):
+        """Set value for file
+
+        # Arguments
+            file_path (str): file path
+            value (any): value computed from the current file
+
+        """
+        key, identity = get_file_identity(file_path)
+        with self.__lock:
+            self.__entries.pop(key, None)
+            self.__entries[key] = (identity, value)
+            self.__evict()
+
+    def invalidate(self, file_path=None):
+        """Invalidate cached value for file, or all values
+
+        # Arguments
+            file_path (str): file path, if None the whole cache is cleared
+
+        """
+        with self.__lock:
+            if file_path is None:
+                self.__entries.clear()
+            else:
+                self.__entries.pop(os.path.realpath(file_path), None)
+
+    # Private
+
+    def __evict(self):
+        while len(self.__entries) > max(self.__maxsize, 0):
+            self.__entries.popitem(last=False)
+
+
+def get_file_identity(file_path):
+    """Get file identity
+
+    # Arguments
+        file_path (str): file path
+
+    # Returns
+        (str, tuple): real path and (size, mtime_ns, inode) tuple
+
+    """
+    stat = os.stat(file_path)
+    mtime_ns = getattr(stat, 'st_mtime_ns', None)
+    if mtime_ns is None:
+        mtime_ns = int(stat.st_mtime * 1e9)
+    return os.path.realpath(file_path), (stat.st_size, mtime_ns, stat.st_ino)
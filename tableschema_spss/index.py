@@ -0,0 +1,502 @@
+# -*- coding: utf-8 -*-
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import io
+import os
+import sys
+import json
+import six
+import zlib
+import struct
+import collections
+import tableschema
+
+
+# Module API
+
+class CaseIndex(object):
+    """Case-offset index of a compressed .sav or .zsav file
+
+    Cases of compressed files have no fixed offset: the SPSS I/O library seeks
+    a case by decompressing every case before it. An index records checkpoints
+    every `interval` cases, the offset of the bytecode block (in the stream of
+    bytecode data, decompressed for .zsav files) and the code where the case
+    starts. Cases are then read from any case number by decoding from the
+    nearest checkpoint, yielding the same raw records as `SavReader`.
+
+    Indexes are saved as JSON sidecar files (see `get_index_path`) holding the
+    size and modification time of the indexed file, and only loaded while
+    those match. Use `build` and `load` rather than the constructor.
+
+    # Arguments
+        file_path (str): path of the indexed file
+        interval (int): number of cases between checkpoints
+        checkpoints (list[]): (offset, code) pairs of cases 0, `interval`, ...
+        case_count (int): number of cases of the file
+        identity (tuple): size and modification time of the indexed file
+
+    """
+
+    # Public
+
+    VERSION = 1
+
+    def __init__(self, file_path, interval, checkpoints, case_count, identity):
+        self.__file_path = file_path
+        self.__interval = interval
+        self.__checkpoints = checkpoints
+        self.__case_count = case_count
+        self.__identity = identity
+
+    def __repr__(self):
+        return 'CaseIndex <{}>'.format(self.__file_path)
+
+    def __len__(self):
+        return self.__case_count
+
+    @property
+    def interval(self):
+        """Number of cases between checkpoints
+
+        # Returns
+            int: number of cases
+
+        """
+        return self.__interval
+
+    @classmethod
+    def build(cls, file_path, interval=1000):
+        """Build the index of a file in one pass over its bytecode data
+
+        # Arguments
+            file_path (str): path of a compressed .sav or .zsav file
+            interval (int): number of cases between checkpoints
+
+        # Raises
+            StorageError: the file is uncompressed or its layout isn't supported
+
+        # Returns
+            CaseIndex: index of the file
+
+        """
+        if interval < 1:
+            raise ValueError('interval must be at least 1')
+        identity = _get_identity(file_path)
+        with io.open(file_path, 'rb') as file:
+            layout = _read_layout(file, file_path)
+            decoder = _CaseDecoder(_iter_chunks(file, layout, 0), 0, 0, layout)
+            checkpoints = []
+            case_count = 0
+            while True:
+                checkpoint = decoder.tell()
+                if checkpoint is None:
+                    break
+                checkpoints.append(checkpoint)
+                skipped = decoder.skip(interval)
+                case_count += skipped
+                if skipped < interval:
+                    break
+        checkpoints = checkpoints[:case_count // interval + 1]
+        return cls(file_path, interval, checkpoints, case_count, identity)
+
+    @classmethod
+    def load(cls, file_path):
+        """Load the index of a file from its sidecar file
+
+        # Arguments
+            file_path (str): path of the indexed file
+
+        # Returns
+            CaseIndex/None: index, or None if missing, unreadable or out of date
+
+        """
+        try:
+            with io.open(get_index_path(file_path), encoding='utf-8') as file:
+                data = json.load(file)
+            if data['version'] != cls.VERSION:
+                return None
+            if tuple(data['identity']) != _get_identity(file_path):
+                return None
+            return cls(file_path, data['interval'], data['checkpoints'],
+                       data['case_count'], tuple(data['identity']))
+        except (IOError, OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def save(self):
+        """Save the index to its sidecar file
+
+        # Returns
+            str: path of the sidecar file
+
+        """
+        index_path = get_index_path(self.__file_path)
+        data = {
+            'version': self.VERSION,
+            'identity': list(self.__identity),
+            'interval': self.__interval,
+            'case_count': self.__case_count,
+            'checkpoints': self.__checkpoints,
+        }
+        with io.open(index_path, 'w', encoding='utf-8') as file:
+            file.write(json.dumps(data, separators=(',', ':')))
+        return index_path
+
+    def iter_records(self, unpack, start=0, stop=None):
+        """Yield raw records of cases `start` to `stop`
+
+        # Arguments
+            unpack (func): function unpacking a case buffer, `SavReader.unpack_from`
+            start (int): number of the first case
+            stop (int): number of the case to stop before, None for the last one
+
+        # Returns
+            list[]: yields raw records like `SavReader.record`
+
+        """
+        stop = self.__case_count if stop is None else stop
+        for _, record in self.iter_ranges(unpack, [(start, stop)]):
+            yield record
+
+    def iter_ranges(self, unpack, ranges):
+        """Yield (case number, raw record) pairs of ranges of cases
+
+        Ranges are read in one pass over the file, jumping to the nearest
+        checkpoint only when it's past the current case (and, for .zsav files,
+        in another zlib block, as jumping decompresses its block from the start).
+
+        # Arguments
+            unpack (func): function unpacking a case buffer, `SavReader.unpack_from`
+            ranges ((int, int)[]): sorted (start, stop) ranges of case numbers
+
+        # Returns
+            (int, list[])[]: yields case numbers and raw records like `SavReader.record`
+
+        """
+        with io.open(self.__file_path, 'rb') as file:
+            layout = _read_layout(file, self.__file_path)
+            decoder = None
+            current = 0
+            for start, stop in ranges:
+                stop = min(stop, self.__case_count)
+                if start >= stop:
+                    continue
+                checkpoint = min(start // self.__interval, len(self.__checkpoints) - 1)
+                offset, code = self.__checkpoints[checkpoint]
+                if (decoder is None or start < current or
+                        checkpoint * self.__interval > current and
+                        not _is_same_block(layout, decoder.tell(), offset)):
+                    chunks = _iter_chunks(file, layout, offset)
+                    decoder = _CaseDecoder(chunks, offset, code, layout)
+                    current = checkpoint * self.__interval
+                decoder.skip(start - current)
+                cases = six.moves.zip(six.moves.range(start, stop), decoder.read(stop - start))
+                for case, buffer in cases:
+                    yield case, list(unpack(buffer))
+                current = stop
+
+
+def get_index_path(file_path):
+    """Get the path of the sidecar index file of a file
+
+    # Arguments
+        file_path (str): path of the indexed file
+
+    # Returns
+        str: `file_path` with an `.idx` suffix
+
+    """
+    return '{}.idx'.format(file_path)
+
+
+def remove_index(file_path):
+    """Remove the sidecar index file of a file if any
+
+    # Arguments
+        file_path (str): path of the indexed file
+
+    """
+    index_path = get_index_path(file_path)
+    if os.path.exists(index_path):
+        os.remove(index_path)
+
+
+# Internal
+
+_Layout = collections.namedtuple(
+    '_Layout', ['byte_order', 'slots', 'bias', 'data_offset', 'blocks'])
+_Block = collections.namedtuple(
+    '_Block', ['offset', 'size', 'compressed_offset', 'compressed_size'])
+_IGNORED_CODES = b'\x00\xfc'
+_RAW_CODE = b'\xfd'
+_END_CODE = b'\xfc'
+_CHUNK_SIZE = 64 * 1024
+# Bytecode blocks are 8 codes followed by up to 8 raw values
+_MAX_BLOCK_SIZE = 72
+
+
+def _get_identity(file_path):
+    stat = os.stat(file_path)
+    mtime_ns = getattr(stat, 'st_mtime_ns', None)
+    if mtime_ns is None:
+        mtime_ns = int(stat.st_mtime * 1e9)
+    return (stat.st_size, mtime_ns)
+
+
+def _read_layout(file, file_path):
+    """Read where and how the bytecode data of a compressed file is stored.
+    """
+    header = file.read(176)
+    if len(header) < 176 or header[:4] not in (b'$FL2', b'$FL3'):
+        _raise_layout_error(file_path, 'not a SPSS data file')
+    byte_order = '<' if struct.unpack('<i', header[64:68])[0] in (2, 3) else '>'
+    slots, compression = struct.unpack(byte_order + 'ii', header[68:76])
+    bias = struct.unpack(byte_order + 'd', header[84:92])[0]
+    if compression not in (1, 2):
+        _raise_layout_error(file_path, 'not compressed')
+    _skip_dictionary(file, file_path, byte_order)
+    data_offset = file.tell()
+    blocks = None
+    if compression == 2:
+        blocks = _read_zlib_blocks(file, byte_order)
+    return _Layout(byte_order, slots, bias, data_offset, blocks)
+
+
+def _skip_dictionary(file, file_path, byte_order):
+    """Skip dictionary records up to the dictionary termination record.
+    """
+    def read_ints(count):
+        return struct.unpack(byte_order + 'i' * count, file.read(4 * count))
+
+    while True:
+        record_type, = read_ints(1)
+        if record_type == 999:
+            file.seek(4, io.SEEK_CUR)
+            return
+        skip = _SKIP_RECORDS.get(record_type)
+        if skip is None:
+            _raise_layout_error(file_path, 'unknown record type {}'.format(record_type))
+        skip(file, read_ints)
+
+
+def _skip_variable(file, read_ints):
+    _, has_label, missing_count, _, _ = read_ints(5)
+    file.seek(8, io.SEEK_CUR)
+    if has_label:
+        length, = read_ints(1)
+        file.seek(-(-length // 4) * 4, io.SEEK_CUR)
+    file.seek(abs(missing_count) * 8, io.SEEK_CUR)
+
+
+def _skip_value_labels(file, read_ints):
+    count, = read_ints(1)
+    for _ in six.moves.range(count):
+        file.seek(8, io.SEEK_CUR)
+        length = bytearray(file.read(1))[0]
+        file.seek((length + 8) // 8 * 8 - 1, io.SEEK_CUR)
+
+
+def _skip_array(size):
+    def skip(file, read_ints):
+        count, = read_ints(1)
+        file.seek(size * count, io.SEEK_CUR)
+    return skip
+
+
+def _skip_extension(file, read_ints):
+    _, size, count = read_ints(3)
+    file.seek(size * count, io.SEEK_CUR)
+
+
+_SKIP_RECORDS = {
+    2: _skip_variable,
+    3: _skip_value_labels,
+    4: _skip_array(4),
+    6: _skip_array(80),
+    7: _skip_extension,
+}
+
+
+def _read_zlib_blocks(file, byte_order):
+    """Read zlib blocks of a .zsav file, offsets relative to the bytecode data.
+    """
+    _, trailer_offset, _ = struct.unpack(byte_order + 'qqq', file.read(24))
+    file.seek(trailer_offset + 16)
+    _, count = struct.unpack(byte_order + 'ii', file.read(8))
+    blocks = []
+    for _ in six.moves.range(count):
+        entry = struct.unpack(byte_order + 'qqii', file.read(24))
+        blocks.append(_Block(entry[0], entry[2], entry[1], entry[3]))
+    start = blocks[0].offset if blocks else 0
+    return [block._replace(offset=block.offset - start) for block in blocks]
+
+
+def _raise_layout_error(file_path, reason):
+    message = 'File "{}" can\'t be indexed: {}.'.format(file_path, reason)
+    raise tableschema.exceptions.StorageError(message)
+
+
+def _iter_chunks(file, layout, offset):
+    """Yield chunks of bytecode data from `offset`, decompressing zlib blocks.
+    """
+    if layout.blocks is None:
+        file.seek(layout.data_offset + offset)
+        for chunk in iter(lambda: file.read(_CHUNK_SIZE), b''):
+            yield chunk
+        return
+    for block in layout.blocks:
+        if block.offset + block.size <= offset:
+            continue
+        file.seek(block.compressed_offset)
+        data = file.read(block.compressed_size)
+        # Decompress blocks bit by bit, so reading stops early with the consumer
+        decompressor = zlib.decompressobj()
+        position = block.offset
+        while data:
+            chunk = decompressor.decompress(data, _CHUNK_SIZE)
+            data = decompressor.unconsumed_tail
+            if not data:
+                chunk += decompressor.flush()
+            if position + len(chunk) > offset:
+                yield chunk[max(offset - position, 0):]
+            position += len(chunk)
+
+
+def _is_same_block(layout, checkpoint, offset):
+    """Tell whether a checkpoint and an offset are in the same zlib block
+    """
+    if layout.blocks is None or checkpoint is None:
+        return False
+    for block in layout.blocks:
+        if block.offset <= offset < block.offset + block.size:
+            return block.offset <= checkpoint[0] < block.offset + block.size
+    return False
+
+
+class _CaseDecoder(object):
+    """Decoder of case buffers from `code` of the bytecode block at `offset` of `chunks`
+    """
+
+    # Public
+
+    def __init__(self, chunks, offset, code, layout):
+        pack = struct.Struct(layout.byte_order + 'd').pack
+        self.__values = {index: pack(index - layout.bias) for index in six.moves.range(1, 252)}
+        self.__values[254] = b' ' * 8
+        self.__values[255] = pack(-sys.float_info.max)
+        self.__slots = layout.slots
+        self.__chunks = chunks
+        self.__buffer = b''
+        self.__base = offset
+        self.__ended = False
+        # Current block: its position and end in the buffer, the index of its next
+        # code and the position of its next raw value
+        self.__position = self.__end = self.__code = self.__raw = 0
+        if self.__open_block(0):
+            self.__code = code
+            self.__raw += 8 * self.__buffer[:code].count(_RAW_CODE)
+
+    def tell(self):
+        """Return the (offset, code) checkpoint of the next case, None at the end
+        """
+        if not self.__load():
+            return None
+        return [self.__base + self.__position, self.__code]
+
+    def skip(self, count):
+        """Skip up to `count` cases and return the number of skipped cases
+        """
+        remaining = count * self.__slots
+        while remaining and self.__load():
+            buffer, position = self.__buffer, self.__position
+            codes = buffer[position + self.__code:position + 8]
+            values = len(codes.translate(None, _IGNORED_CODES))
+            if remaining >= values and _END_CODE not in codes:
+                # Skip whole blocks in the buffer without decoding them
+                remaining -= values
+                position = self.__end
+                limit = len(buffer) - _MAX_BLOCK_SIZE
+                while position <= limit:
+                    codes = buffer[position:position + 8]
+                    values = 8 - codes.count(b'\x00')
+                    if values > remaining or _END_CODE in codes:
+                        break
+                    remaining -= values
+                    position += 8 + 8 * codes.count(_RAW_CODE)
+                self.__open_block(position)
+                continue
+            for value in bytearray(codes):
+                self.__code += 1
+                if value == 252:
+                    self.__ended = True
+                    break
+                if value == 253:
+                    self.__raw += 8
+                if value:
+                    remaining -= 1
+                    if not remaining:
+                        break
+        return count - -(-remaining // self.__slots)
+
+    def read(self, count):
+        """Yield up to `count` case buffers
+        """
+        values = self.__values
+        case = []
+        while count and self.__load():
+            buffer, code, raw = self.__buffer, self.__code, self.__raw
+            codes = bytearray(buffer[self.__position:self.__position + 8])
+            while code < 8:
+                value = codes[code]
+                code += 1
+                if value == 0:
+                    continue
+                if value == 252:
+                    self.__ended = True
+                    return
+                if value == 253:
+                    case.append(buffer[raw:raw + 8])
+                    raw += 8
+                else:
+                    case.append(values[value])
+                if len(case) == self.__slots:
+                    self.__code, self.__raw = code, raw
+                    yield b''.join(case)
+                    case = []
+                    count -= 1
+                    if not count:
+                        return
+            self.__code = 8
+
+    # Private
+
+    def __load(self):
+        """Open the next block if the current one is decoded, False at the end
+        """
+        if not self.__ended and self.__code >= 8:
+            self.__open_block(self.__end)
+        return not self.__ended
+
+    def __open_block(self, position):
+        """Make the block at `position` of the buffer current, False at the end
+        """
+        buffer = self.__buffer
+        if len(buffer) < position + _MAX_BLOCK_SIZE:
+            # Drop decoded blocks and read the next chunks
+            buffer = buffer[position:]
+            self.__base += position
+            position = 0
+            while len(buffer) < _MAX_BLOCK_SIZE:
+                chunk = next(self.__chunks, None)
+                if chunk is None:
+                    break
+                buffer += chunk
+            self.__buffer = buffer
+        end = position + 8 + 8 * buffer[position:position + 8].count(_RAW_CODE)
+        if end > len(buffer):
+            self.__ended = True
+            return False
+        self.__position, self.__end, self.__code, self.__raw = position, end, 0, position + 8
+        return True
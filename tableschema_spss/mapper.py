@@ -5,8 +5,27 @@ from __future__ import absolute_import
 from __future__ import unicode_literals
 
 import re
+import six
+import json
 import logging
+import functools
+import datetime
+import collections
 import tableschema
+import savReaderWriter
+from decimal import Decimal
+try:
+    import numpy
+except ImportError:
+    numpy = None
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+try:
+    import pandas
+except ImportError:
+    pandas = None
 log = logging.getLogger(__name__)
 
 
@@ -19,6 +38,10 @@ class Mapper(object):
     DATE_FORMAT = "%Y-%m-%d"
     DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
     TIME_FORMAT = "%H:%M:%S.%f"
+    SPSS_EPOCH = datetime.datetime(1582, 10, 14)
+
+    def __init__(self):
+        self.__converted_descriptors = collections.OrderedDict()
 
     def convert_bucket(self, bucket):
         """Convert bucket to SPSS
@@ -27,52 +50,181 @@ class Mapper(object):
             bucket = '{}.sav'.format(bucket)
         return bucket
 
+    def convert_compression(self, compression, descriptor=None, row_count=None):
+        """Convert compression to SPSS
+
+        Return the `SavWriter.fileCompression` value of a compression name: `none`,
+        `bytecode` or `zlib`. `auto` is resolved by `choose_compression` from the
+        `descriptor` and the expected `row_count`. None is returned unchanged, leaving
+        the choice to the file extension (`.zsav` for zlib, else bytecode).
+
+        """
+        if compression is None:
+            return None
+        if compression == 'auto':
+            compression = self.choose_compression(descriptor, row_count)
+        if compression not in _SPSS_COMPRESSIONS:
+            message = 'Compression "{}" is not one of: {}.'.format(
+                compression, ', '.join(sorted(_SPSS_COMPRESSIONS) + ['auto']))
+            raise tableschema.exceptions.StorageError(message)
+        return _SPSS_COMPRESSIONS[compression]
+
+    def restore_compression(self, file_compression):
+        """Restore compression name (see `convert_compression`) from SPSS
+        """
+        for compression, value in _SPSS_COMPRESSIONS.items():
+            if value == file_compression:
+                return compression
+        return None
+
+    def choose_compression(self, descriptor, row_count=None):
+        """Choose a compression for the data of a descriptor
+
+        Bytecode compression stores small integers (-99 to 151) and blank 8 byte
+        string chunks in one byte, zlib compresses whole blocks of cases. Files are
+        never left uncompressed, as rows can't be appended to them later. So:
+
+        - files expected under 1 MB use `bytecode`, the cheapest to write and read
+        - records mostly made of strings use `zlib`
+        - records mostly made of short integer formats (e.g. `F3.0`) use `bytecode`
+        - other records use `zlib`
+
+        # Arguments
+            descriptor (dict): Table Schema descriptor
+            row_count (int): expected number of rows, if known
+
+        # Returns
+            str: `bytecode` or `zlib`
+
+        """
+        kwargs = self.convert_descriptor(descriptor)
+        record_size = string_size = compact_size = 0
+        for name, width in kwargs['varTypes'].items():
+            size = -(-width // 8) * 8 if width else 8
+            record_size += size
+            if width:
+                string_size += size
+            elif _SPSS_COMPACT_FORMAT.match(kwargs['formats'].get(name, '')):
+                compact_size += size
+        if row_count is not None and record_size * row_count < _SMALL_FILE_SIZE:
+            return 'bytecode'
+        if string_size * 2 >= record_size:
+            return 'zlib'
+        if compact_size * 2 >= record_size:
+            return 'bytecode'
+        return 'zlib'
+
     def convert_descriptor(self, descriptor):
         """Convert descriptor to SPSS
 
         Return a dict of method args that can be used by savReaderWriter.SavWriter(),
-        derived from the passed `descriptor`.
+        derived from the passed `descriptor`. Results are memoised on the descriptor
+        contents, so converting the same descriptor again is cheap. Descriptors with
+        values JSON can't encode (e.g. a `datetime` default) are converted every time.
 
         """
-        schema = tableschema.Schema(descriptor)
+        try:
+            key = json.dumps(descriptor, sort_keys=True)
+        except (TypeError, ValueError):
+            key = None
+        kwargs = self.__converted_descriptors.pop(key, None)
+        if kwargs is None:
+            kwargs = self.__convert_descriptor(descriptor)
+        if key is not None:
+            self.__converted_descriptors[key] = kwargs
+            while len(self.__converted_descriptors) > self.__CONVERTED_DESCRIPTORS_SIZE:
+                self.__converted_descriptors.popitem(last=False)
+        return {
+            'varNames': list(kwargs['varNames']),
+            'varTypes': dict(kwargs['varTypes']),
+            'formats': dict(kwargs['formats']),
+        }
 
-        def get_format_for_name(name):
-            return schema.get_field(name).descriptor.get('spss:format')
+    def convert_converters(self, schema):
+        """Convert row converters to SPSS
 
-        def get_spss_type_for_name(name):
-            '''Return spss number type for `name`.
+        Return a list of callables, one per `schema` field, each converting a Python
+        value to the value passed to `SavWriter.writerow`. Date, datetime and time
+        values are converted straight to seconds since the SPSS epoch (1582-10-14),
+        other values are returned unchanged.
 
-            First we try to get the spss format (A10, F8.2, etc), and derive the spss type
-            from that.
+        """
+        return [self.__convert_converter(field) for field in schema.fields]
 
-            If there's not spss format defined, we see if the type is a number and return the
-            appropriate type.
+    def convert_column(self, field, values):
+        """Convert column to SPSS
 
-            All else fails, we return a string type of width 1 (the default string format is
-            A1).
-            '''
-            spss_format = get_format_for_name(name)
-            if spss_format:
-                string_pattern = re.compile(
-                    r'(?P<printFormat>A(HEX)?)(?P<printWid>\d+)', re.IGNORECASE)
-                is_string = string_pattern.match(spss_format)
-                if is_string:
-                    # Return the 'width' discovered from the passed `format`.
-                    return int(is_string.group('printWid'))
-                else:
-                    return 0
+        Return a list of values for `field` converted as by `convert_converters`.
+        NumPy `datetime64` and `timedelta64` arrays are converted in a vectorised way,
+        with `NaT` converted to None.
+
+        """
+        if (numpy is not None and isinstance(values, numpy.ndarray) and
+                values.dtype.kind in 'mM' and field.type in _DEFAULT_FORMATS):
+            if field.type == 'date':
+                values = values.astype('datetime64[D]')
+                seconds = values - numpy.datetime64(self.SPSS_EPOCH.date(), 'D')
+            elif field.type == 'datetime':
+                # The SPSS epoch is out of the datetime64[ns] range
+                values = values.astype('datetime64[us]')
+                seconds = values - numpy.datetime64(self.SPSS_EPOCH, 'us')
             else:
-                descriptor_type = schema.get_field(name).type
-                if descriptor_type == 'integer' or descriptor_type == 'number':
-                    return 0
+                seconds = values
+            seconds = (seconds / numpy.timedelta64(1, 's')).astype(object)
+            seconds[numpy.isnat(values)] = None
+            return seconds.tolist()
+        convert = self.__convert_converter(field)
+        return [convert(value) for value in values]
 
-            message = 'Field "{}" requires a "spss:format" property.'.format(name)
-            raise tableschema.exceptions.StorageError(message)
+    def convert_text_converters(self, schema):
+        """Convert text converters to SPSS
 
-        var_names = [f['name'] for f in descriptor['fields']]
-        var_types = {n: get_spss_type_for_name(n) for n in var_names}
-        formats = {n: get_format_for_name(n) for n in var_names if get_format_for_name(n)}
-        return {'varNames': var_names, 'varTypes': var_types, 'formats': formats}
+        Return a list of callables, one per `schema` field, each converting a text
+        value (e.g. a CSV cell) straight to the value written to SPSS: numbers,
+        seconds for temporal fields (as by `convert_converters`) or strings. Missing
+        values become None, or an empty string for string fields. Dates parsed with
+        a fixed pattern are memoised as columns tend to repeat them. Fields with
+        options the fast paths don't handle are cast with `field.cast_value`.
+
+        """
+        missing_values = set(schema.descriptor.get('missingValues', ['']))
+        converters = []
+        for field in schema.fields:
+            factory = _CONVERT_TEXT_CONVERTERS.get(field.type)
+            convert = factory and factory(field, missing_values, self.SPSS_EPOCH)
+            if convert is None:
+                convert = _convert_text_any(field, missing_values, self.SPSS_EPOCH)
+            converters.append(convert)
+        return converters
+
+    def convert_records(self, schema, writer, columns, raw=False):
+        """Convert columns to SPSS records
+
+        Return a NumPy structured array of records laid out as the case buffer of
+        `writer` (a `SavWriter` opened with `ioUtf8=True`) from `columns`, one
+        sequence of values per `schema` field. Temporal values are converted as by
+        `convert_column` unless `raw` (values already converted, e.g. by
+        `convert_text_converters`), missing numeric values become system missing
+        values and strings are encoded and padded with spaces.
+
+        """
+        if numpy is None:
+            message = 'Column conversion requires "numpy" to be installed.'
+            raise tableschema.exceptions.StorageError(message)
+        dtype = _restore_record_dtype(writer.myStruct.format)
+        records = numpy.empty(len(columns[0]) if columns else 0, dtype=dtype)
+        for name, field, values in zip(dtype.names, schema.fields, columns):
+            if dtype[name].kind == 'S':
+                records[name] = _convert_string_column(values, dtype[name].itemsize)
+                continue
+            if field.type in _CONVERT_CONVERTERS and not raw:
+                values = self.convert_column(field, values)
+            try:
+                records[name] = _convert_numeric_column(values, writer.sysmis)
+            except (TypeError, ValueError):
+                message = 'Field "{}" has values not writable to a numeric variable.'
+                raise tableschema.exceptions.StorageError(message.format(field.name))
+        return records
 
     def restore_descriptor(self, header):
         """Restore descriptor from SPSS
@@ -89,13 +241,8 @@ class Mapper(object):
                 'title': header.varLabels[var],
                 'spss:format': header.formats[var]
             }
-            date_formats = {
-                'time': self.TIME_FORMAT,
-                'date': self.DATE_FORMAT,
-                'datetime': self.DATETIME_FORMAT
-            }
-            if field_type in date_formats.keys():
-                field['format'] = date_formats[field_type]
+            if field_type in _DEFAULT_FORMATS:
+                field['format'] = _DEFAULT_FORMATS[field_type]
 
             fields.append(field)
         return {'fields': fields}
@@ -105,23 +252,917 @@ class Mapper(object):
 
         Return a TableSchema type for the passed SPSS format.
         Use the SPSS_TYPE_MAPPING look up to match formats, return 'string' if unknown.
+        Results are cached per format as files repeat a handful of formats.
+
+        """
+        ts_type = _RESTORE_TYPE_CACHE.get(format)
+        if ts_type is None:
+            match = _SPSS_TYPE_PATTERN.match(format)
+            # Unknown format, return 'string'
+            ts_type = _SPSS_TYPE_MAPPING[match.lastindex - 1][0] if match else 'string'
+            if len(_RESTORE_TYPE_CACHE) >= 1024:
+                _RESTORE_TYPE_CACHE.clear()
+            _RESTORE_TYPE_CACHE[format] = ts_type
+        return ts_type
+
+    def restore_converters(self, schema, reader, var_names=None, decode=True):
+        """Restore row converters from SPSS
+
+        Return a list of callables, one per `schema` field, each casting a raw value
+        of the matching variable of `reader` (a `SavReader` opened with
+        `rawMode=True`) to the field's Python type. The list is compiled once so a
+        row can be restored by applying it to each raw record. Fields are matched
+        to `var_names` (all variables of `reader` by default) by position. If
+        `decode` is False, string fields without constraints are restored as `bytes`
+        stripped of their padding rather than decoded.
+
+        """
+        missing_values = schema.descriptor.get('missingValues', [''])
+        return [self.__restore_converter(field, var_name, reader, missing_values, decode)
+                for field, var_name in zip(schema.fields, var_names or reader.header)]
+
+    def restore_batch_converters(self, schema, reader, var_names=None, decode=True):
+        """Restore batch converters from SPSS
+
+        Return a list of callables, one per `schema` field, each casting a sequence
+        of raw values of the matching variable of `reader` to a list of values as
+        `restore_converters` would. String values of a batch are decoded at once.
+
+        """
+        missing_values = schema.descriptor.get('missingValues', [''])
+        converters = []
+        for field, var_name in zip(schema.fields, var_names or reader.header):
+            convert = self.__restore_converter(
+                field, var_name, reader, missing_values, decode)
+            if getattr(convert, 'batch', None) is not None:
+                converters.append(convert.batch)
+            else:
+                converters.append(functools.partial(_restore_batch, convert))
+        return converters
+
+    def restore_column_converters(self, schema, reader, var_names=None):
+        """Restore column converters from SPSS
+
+        Return a list of callables, one per `schema` field, each converting a sequence
+        of raw values of the matching variable of `reader` (a `SavReader` opened with
+        `rawMode=True`) to a `numpy.ma.MaskedArray` masking missing values. Numeric
+        fields are typed arrays, date and datetime fields are `datetime64` arrays and
+        time fields are `timedelta64` arrays (time of day), their `required`,
+        `minimum` and `maximum` constraints being checked on the whole array (a
+        `CastError` is raised for the first value not satisfying them). Other
+        fields, or fields with other constraints, are object arrays of values cast
+        by `restore_converters`. Fields are matched to `var_names` (all variables of
+        `reader` by default) by position.
+
+        """
+        if numpy is None:
+            message = 'Column conversion requires "numpy" to be installed.'
+            raise tableschema.exceptions.StorageError(message)
+        missing_values = schema.descriptor.get('missingValues', [''])
+        return [self.__restore_column_converter(field, var_name, reader, missing_values)
+                for field, var_name in zip(schema.fields, var_names or reader.header)]
+
+    def restore_raw_keys(self, schema, reader, var_names=None):
+        """Restore raw keys from SPSS
+
+        Return a list of callables, one per `schema` field, each mapping a raw value
+        of the matching variable of `reader` to a key ordered like the cast value,
+        or None for missing values, without decoding or casting it: strings are
+        compared as bytes in the file encoding, numbers as floats, dates as days,
+        datetimes as seconds and times as seconds of the day. The `literal`
+        attribute of a key maps a value of the field (or its text) to the same
+        domain. Keys of values in default SPSS formats also have a `column`
+        attribute mapping a sequence of raw values to a NumPy array of keys and a
+        mask of missing values (if `numpy` is installed). Other keys cast values.
+
+        """
+        missing_values = schema.descriptor.get('missingValues', [''])
+        return [self.__restore_raw_key(field, var_name, reader, missing_values)
+                for field, var_name in zip(schema.fields, var_names or reader.header)]
+
+    def restore_text_formatters(self, schema):
+        """Restore text formatters from SPSS
+
+        Return a list with, for each `schema` field, a callable formatting a cast
+        value as text in the field format (see `convert_text_converters`), or None
+        if the value's own text representation will do.
+
+        """
+        formatters = []
+        for field in schema.fields:
+            pattern = _TEXT_PATTERNS.get(field.type)
+            if pattern is not None and field.format != 'default':
+                pattern = field.format.replace('fmt:', '')
+            if pattern is None:
+                formatters.append(None)
+            elif pattern in ('any', '%Y-%m-%d'):
+                formatters.append(_restore_isoformat)
+            else:
+                formatters.append(functools.partial(_restore_strftime, pattern))
+        return formatters
+
+    def restore_arrow_schema(self, schema, dictionary=None):
+        """Restore Arrow schema from SPSS
+
+        Return a `pyarrow.Schema` for the `schema` fields: integer and number fields
+        are `int64` and `float64`, date fields `date32`, datetime fields `timestamp`,
+        time fields `time64` and other fields strings. String fields named in
+        `dictionary` (by default those with an SPSS format up to `A8`, usually codes)
+        are dictionary encoded. Fields keep their `spss:format` as metadata.
+
+        """
+        if pyarrow is None:
+            message = 'Arrow conversion requires "pyarrow" to be installed.'
+            raise tableschema.exceptions.StorageError(message)
+        arrow_fields = []
+        for field in schema.fields:
+            spss_format = field.descriptor.get('spss:format')
+            arrow_type = _ARROW_TYPES.get(field.type, pyarrow.string)()
+            if dictionary is None:
+                is_string = _SPSS_STRING_FORMAT.match(spss_format or '')
+                is_dictionary = bool(is_string) and int(is_string.group('printWid')) <= 8
+            else:
+                is_dictionary = field.name in dictionary
+            if is_dictionary and arrow_type == pyarrow.string():
+                arrow_type = pyarrow.dictionary(pyarrow.int32(), arrow_type)
+            metadata = {'spss:format': spss_format} if spss_format else None
+            arrow_fields.append(pyarrow.field(field.name, arrow_type, metadata=metadata))
+        return pyarrow.schema(arrow_fields)
+
+    def restore_arrow_array(self, column, arrow_type):
+        """Restore Arrow array from SPSS
+
+        Return a `pyarrow.Array` of `arrow_type` (see `restore_arrow_schema`) for a
+        masked column returned by a `restore_column_converters` converter.
 
         """
-        SPSS_TYPE_MAPPING = [
-            ('string', re.compile(r'\bA\d+')),
-            ('number', re.compile(r'\bF\d+\.\d+')),  # Basic decimal number
-            ('number', re.compile(r'\b[E|N]\d+\.?\d*')),  # Exponent or N format number
-            ('integer', re.compile(r'\bF\d+')),  # Integer (must come after Basic decimal in list)
-            ('date', re.compile(r'\b[A|E|J|S]?DATE\d+')),  # Various date formats
-            ('datetime', re.compile(r'\bDATETIME\d+')),
-            ('time', re.compile(r'\bTIME\d+')),
-            ('number', re.compile(r'\bDOLLAR\d+')),
-            ('number', re.compile(r'\bPCT\d+'))  # Percentage format
-        ]
+        mask = numpy.ma.getmaskarray(column)
+        data = numpy.ma.getdata(column)
+        value_type = getattr(arrow_type, 'value_type', arrow_type)
+        if data.dtype.kind == 'O':
+            coerce = _ARROW_COERCERS.get(str(value_type))
+            if coerce is not None:
+                data = numpy.array([None if value is None else coerce(value)
+                                    for value in data], dtype=object)
+        elif data.dtype.kind == 'm':
+            data = data.astype('timedelta64[us]').view('int64')
+        array = pyarrow.array(data, mask=mask).cast(value_type)
+        if value_type != arrow_type:
+            array = array.dictionary_encode()
+        return array
+
+    def restore_dataframe(self, schema, columns):
+        """Restore pandas DataFrame from SPSS
+
+        Return a `pandas.DataFrame` of `columns` returned by
+        `restore_column_converters` for `schema` fields. Integer fields are nullable
+        `Int64` columns, number fields `float64` columns, date and datetime fields
+        `datetime64` columns and time fields `timedelta64` columns, with missing
+        values as `NA`, `NaN` or `NaT`. Other fields are object columns, integer,
+        number and boolean values cast by `restore_converters` being converted to
+        `Int64`, `float64` and `boolean` columns.
+
+        """
+        if pandas is None:
+            message = 'DataFrame conversion requires "pandas" to be installed.'
+            raise tableschema.exceptions.StorageError(message)
+        data = collections.OrderedDict()
+        for field, column in zip(schema.fields, columns):
+            mask = numpy.ma.getmaskarray(column)
+            values = numpy.ma.getdata(column)
+            if values.dtype.kind == 'i':
+                values = pandas.arrays.IntegerArray(values, mask)
+            elif values.dtype.kind == 'O' and field.type in _PANDAS_DTYPES:
+                values = pandas.Series(values, dtype=object).astype(
+                    _PANDAS_DTYPES[field.type]).array
+            elif values.dtype.kind == 'O':
+                # Keep objects, pandas would infer a str dtype for strings
+                values = pandas.Series(values, dtype=object).array
+            elif values.dtype.kind in 'fmM' and mask.any():
+                values = values.copy()
+                values[mask] = numpy.array('NaT' if values.dtype.kind in 'mM' else 'nan',
+                                           dtype=values.dtype)
+            data[field.name] = values
+        return pandas.DataFrame(data, columns=list(data))
+
+    # Private
+
+    __CONVERTED_DESCRIPTORS_SIZE = 32
+
+    def __convert_descriptor(self, descriptor):
+        """Convert descriptor to SPSS in one pass over its fields (see `convert_descriptor`).
+        """
+        var_names = []
+        var_types = {}
+        formats = {}
+        for field in descriptor['fields']:
+            name = field['name']
+            var_names.append(name)
+            if name in var_types:
+                # Duplicated names are described by their first field
+                continue
+
+            # First we try to get the spss format (A10, F8.2, etc), and derive the spss
+            # type from that. If there's not spss format defined, we see if the type is
+            # a number and return the appropriate type.
+            spss_format = field.get('spss:format')
+            if spss_format:
+                formats[name] = spss_format
+                is_string = _SPSS_STRING_FORMAT.match(spss_format)
+                # Return the 'width' discovered from the passed `format`.
+                var_types[name] = int(is_string.group('printWid')) if is_string else 0
+            elif field.get('type', 'string') in ('integer', 'number'):
+                var_types[name] = 0
+            else:
+                message = 'Field "{}" requires a "spss:format" property.'.format(name)
+                raise tableschema.exceptions.StorageError(message)
+
+        return {'varNames': var_names, 'varTypes': var_types, 'formats': formats}
+
+    def __convert_converter(self, field):
+        """Return a converter for a single field (see `convert_converters`).
+        """
+        factory = _CONVERT_CONVERTERS.get(field.type, _convert_any)
+        return factory(self.SPSS_EPOCH)
+
+    def __restore_column_converter(self, field, var_name, reader, missing_values):
+        """Return a column converter for a single field (see `restore_column_converters`).
+        """
+        kind = _restore_kind(reader, var_name)
+        factory = _RESTORE_COLUMN_CONVERTERS.get((kind, field.type))
+        if factory is not None and field.format in ('default', None, _DEFAULT_FORMATS.get(kind)):
+            convert = factory(reader, missing_values, self.SPSS_EPOCH)
+            if not field.constraints:
+                return convert
+            # Constraints are checked on the typed column where they can be
+            convert = _restore_checked_column(field, convert)
+            if convert is not None:
+                return convert
+        convert = self.__restore_converter(field, var_name, reader, missing_values)
+        return _restore_object_column(convert)
+
+    def __restore_converter(self, field, var_name, reader, missing_values, decode=True):
+        """Return a converter for a single field (see `restore_converters`).
+        """
+        kind = _restore_kind(reader, var_name)
+
+        # Fallback to generic casting of the formatted value
+        factory = _RESTORE_CONVERTERS.get((kind, field.type))
+        if factory is _restore_string and not decode and not field.constraints:
+            factory = _restore_bytes
+        if factory is None or field.format not in ('default', None, _DEFAULT_FORMATS.get(kind)):
+            format_value = self.__restore_formatter(var_name, reader)
+
+            def convert(value):
+                value = format_value(value)
+                # Fix decimals that should be integers
+                if field.type == 'integer' and value is not None:
+                    value = int(float(value))
+                # Time values need a decimal, add one if missing.
+                if field.type == 'time' and value is not None and '.' not in value:
+                    value = '{}.0'.format(value)
+                return field.cast_value(value)
+
+            return convert
+
+        # Specialised converter, constraints still have to be checked
+        convert = factory(reader, missing_values, self.SPSS_EPOCH)
+        if field.constraints:
+            restore = convert
+
+            def convert(value):
+                return field.cast_value(restore(value))
+
+        return convert
+
+    def __restore_raw_key(self, field, var_name, reader, missing_values):
+        """Return a raw key for a single field (see `restore_raw_keys`).
+        """
+        kind = _restore_kind(reader, var_name)
+        factory = _RESTORE_RAW_KEYS.get((kind, field.type))
+        if factory is None or field.format not in ('default', None, _DEFAULT_FORMATS.get(kind)):
+            convert = self.__restore_converter(field, var_name, reader, missing_values)
+
+            def key(value):
+                return convert(value)
+
+            key.literal = field.cast_value
+            return key
+        key = factory(reader, missing_values, self.SPSS_EPOCH)
+        to_key = key.literal
+        key.literal = lambda value: to_key(field.cast_value(value))
+        return key
+
+    def __restore_formatter(self, var_name, reader):
+        """Return a function formatting a raw value as `rawMode=False` would.
+        """
+        var_type = reader.varTypes[var_name]
+        bare_format = reader.bareformats[var_name]
+        width = reader.varWids[var_name]
+        sysmis = reader.sysmis
+        encoding = reader.fileEncoding
+        date_format = savReaderWriter.supportedDates.get(bare_format)
+
+        def format_value(value):
+            if var_type > 0:
+                return value.rstrip().decode(encoding)
+            if value <= sysmis:
+                return None
+            if bare_format in (b'N', u'N'):
+                return '%0*d' % (width, value)
+            if date_format is not None:
+                value = reader.spss2strDate(value, date_format, None)
+                if bare_format in (b'QYR', u'QYR') and value:
+                    # Month is converted to quarter e.g. 12 Q 1990 --> 4 Q 1990
+                    value = savReaderWriter.QUARTERS[value[:2]] + value[2:]
+                if isinstance(value, six.binary_type):
+                    value = value.decode(encoding)
+            return value
+
+        return format_value
+
+
+# Internal
+
+def _convert_date(epoch):
+    epoch = epoch.date()
+
+    def convert(value):
+        if isinstance(value, datetime.datetime):
+            value = value.date()
+        if isinstance(value, datetime.date):
+            return (value - epoch).days * 86400.0
+        return value
+
+    return convert
+
+
+def _convert_datetime(epoch):
+    def convert(value):
+        if isinstance(value, datetime.datetime):
+            return (value.replace(tzinfo=None) - epoch).total_seconds()
+        return value
+
+    return convert
+
+
+def _convert_time(epoch):
+    def convert(value):
+        if isinstance(value, datetime.time):
+            return (value.hour * 3600 + value.minute * 60 + value.second +
+                    value.microsecond / 1e6)
+        return value
+
+    return convert
+
+
+def _convert_any(epoch):
+    def convert(value):
+        return value
+
+    return convert
+
+
+def _convert_string_column(values, width):
+    values = [b'' if value is None else six.text_type(value).encode('utf-8')
+              for value in values]
+    return numpy.char.ljust(numpy.array(values, dtype='S%s' % width), width)
+
+
+def _convert_numeric_column(values, sysmis):
+    try:
+        data = numpy.asarray(values, dtype='float64')
+    except (TypeError, ValueError):
+        # e.g. pandas nullable columns
+        if not hasattr(values, 'astype'):
+            raise
+        data = numpy.asarray(values.astype('float64'))
+    return numpy.where(numpy.isnan(data), sysmis, data)
+
+
+_CONVERT_CONVERTERS = {
+    'date': _convert_date,
+    'datetime': _convert_datetime,
+    'time': _convert_time,
+}
+
+
+def _convert_text_string(field, missing_values, epoch):
+    def convert(value):
+        return '' if value in missing_values else value
+
+    return convert
+
+
+def _convert_text_integer(field, missing_values, epoch):
+    if field.descriptor.get('bareNumber', True) is not True:
+        return None
+
+    def convert(value):
+        if value in missing_values:
+            return None
+        try:
+            return int(value)
+        except ValueError:
+            return _raise_text_error(field, value)
+
+    return convert
 
-        for ts_type, pattern in SPSS_TYPE_MAPPING:
-            if pattern.match(format):
-                return ts_type
 
-        # Unknown format, return 'string'
+def _convert_text_number(field, missing_values, epoch):
+    if (field.descriptor.get('bareNumber', True) is not True or
+            field.descriptor.get('decimalChar', '.') != '.' or
+            field.descriptor.get('groupChar')):
+        return None
+
+    def convert(value):
+        if value in missing_values:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            return _raise_text_error(field, value)
+
+    return convert
+
+
+def _convert_text_temporal(field, missing_values, epoch):
+    pattern = _TEXT_PATTERNS[field.type] if field.format == 'default' else field.format
+    if pattern == 'any' or pattern.startswith('fmt:'):
+        return None
+    to_seconds = _CONVERT_CONVERTERS[field.type](epoch)
+    cache = {}
+
+    def convert(value):
+        seconds = cache.get(value)
+        if seconds is None:
+            if value in missing_values:
+                return None
+            try:
+                parsed = datetime.datetime.strptime(value, pattern)
+            except ValueError:
+                return _raise_text_error(field, value)
+            if field.type == 'time':
+                parsed = parsed.time()
+            seconds = to_seconds(parsed)
+            if len(cache) >= 65536:
+                cache.clear()
+            cache[value] = seconds
+        return seconds
+
+    return convert
+
+
+def _convert_text_any(field, missing_values, epoch):
+    to_spss = _CONVERT_CONVERTERS.get(field.type, _convert_any)(epoch)
+    empty = '' if field.type == 'string' else None
+
+    def convert(value):
+        if value in missing_values:
+            return empty
+        return to_spss(field.cast_value(value))
+
+    return convert
+
+
+def _raise_text_error(field, value):
+    message = 'Field "{}" can\'t cast value "{}" for type "{}" with format "{}"'.format(
+        field.name, value, field.type, field.format)
+    raise tableschema.exceptions.CastError(message)
+
+
+_CONVERT_TEXT_CONVERTERS = {
+    'string': _convert_text_string,
+    'integer': _convert_text_integer,
+    'number': _convert_text_number,
+    'date': _convert_text_temporal,
+    'datetime': _convert_text_temporal,
+    'time': _convert_text_temporal,
+}
+_TEXT_PATTERNS = {
+    'date': '%Y-%m-%d',
+    'datetime': '%Y-%m-%dT%H:%M:%SZ',
+    'time': '%H:%M:%S',
+}
+
+
+def _restore_kind(reader, var_name):
+    """Return the kind of values a `rawMode=True` reader yields for a variable.
+    """
+    bare_format = reader.bareformats[var_name]
+    if isinstance(bare_format, six.binary_type):
+        bare_format = bare_format.decode('ascii')
+    bare_format = bare_format.upper()
+    if reader.varTypes[var_name] > 0:
         return 'string'
+    if bare_format in _SPSS_DATE_FORMATS:
+        return 'date'
+    if bare_format in ('DATETIME', 'TIME'):
+        return bare_format.lower()
+    if bare_format not in _SPSS_OTHER_DATE_FORMATS:
+        return 'numeric'
+    return None
+
+
+def _restore_string(reader, missing_values, epoch):
+    encoding = reader.fileEncoding
+    missing_values = set(missing_values)
+
+    def convert(value):
+        value = value.rstrip().decode(encoding)
+        return None if value in missing_values else value
+
+    def batch(values):
+        if not values:
+            return []
+        # A batch is decoded at once joined by NUL bytes, unless values contain some
+        values = list(map(six.binary_type.rstrip, values))
+        texts = b'\0'.join(values).decode(encoding).split('\0')
+        if len(texts) != len(values):
+            texts = [value.decode(encoding) for value in values]
+        return _restore_missing(texts, missing_values)
+
+    convert.batch = batch
+    return convert
+
+
+def _restore_bytes(reader, missing_values, epoch):
+    encoding = reader.fileEncoding
+    missing_values = set(value.encode(encoding) for value in missing_values)
+
+    def convert(value):
+        value = value.rstrip()
+        return None if value in missing_values else value
+
+    def batch(values):
+        return _restore_missing(map(six.binary_type.rstrip, values), missing_values)
+
+    convert.batch = batch
+    return convert
+
+
+def _restore_missing(values, missing_values):
+    if missing_values == {''} or missing_values == {b''}:
+        return [value or None for value in values]
+    return [None if value in missing_values else value for value in values]
+
+
+def _restore_isoformat(value):
+    return value.isoformat()
+
+
+def _restore_strftime(pattern, value):
+    return value.strftime(pattern)
+
+
+def _restore_batch(convert, values):
+    return list(map(convert, values))
+
+
+def _restore_date(reader, missing_values, epoch):
+    sysmis = reader.sysmis
+    epoch = epoch.date()
+
+    def convert(value):
+        if value <= sysmis:
+            return None
+        return epoch + datetime.timedelta(days=value // 86400)
+
+    return convert
+
+
+def _restore_datetime(reader, missing_values, epoch):
+    sysmis = reader.sysmis
+
+    def convert(value):
+        if value <= sysmis:
+            return None
+        return (epoch + datetime.timedelta(seconds=value)).replace(microsecond=0)
+
+    return convert
+
+
+def _restore_time(reader, missing_values, epoch):
+    sysmis = reader.sysmis
+
+    def convert(value):
+        if value <= sysmis:
+            return None
+        return (epoch + datetime.timedelta(seconds=value % 86400)).time()
+
+    return convert
+
+
+def _restore_integer(reader, missing_values, epoch):
+    sysmis = reader.sysmis
+
+    def convert(value):
+        return None if value <= sysmis else int(value)
+
+    return convert
+
+
+def _restore_number(reader, missing_values, epoch):
+    sysmis = reader.sysmis
+
+    def convert(value):
+        return None if value <= sysmis else Decimal(str(value))
+
+    return convert
+
+
+_RESTORE_CONVERTERS = {
+    ('string', 'string'): _restore_string,
+    ('date', 'date'): _restore_date,
+    ('datetime', 'datetime'): _restore_datetime,
+    ('time', 'time'): _restore_time,
+    ('numeric', 'integer'): _restore_integer,
+    ('numeric', 'number'): _restore_number,
+}
+
+
+def _restore_string_column(reader, missing_values, epoch):
+    encoding = reader.fileEncoding
+
+    def convert(values):
+        data = numpy.array([value.rstrip().decode(encoding) for value in values],
+                           dtype=object)
+        mask = numpy.array([value in missing_values for value in data], dtype=bool)
+        data[mask] = None
+        return numpy.ma.masked_array(data, mask=mask)
+
+    return convert
+
+
+def _restore_seconds_column(reader, dtype, unit, scale):
+    """Return a converter of SPSS seconds (scaled and floored) to `dtype`.
+    """
+    sysmis = reader.sysmis
+
+    def convert(values):
+        seconds = numpy.array(values, dtype='float64')
+        mask = seconds <= sysmis
+        seconds[mask] = 0
+        data = numpy.floor(scale(seconds)).astype('int64').astype(dtype)
+        return numpy.ma.masked_array(data + unit, mask=mask)
+
+    return convert
+
+
+def _restore_date_column(reader, missing_values, epoch):
+    return _restore_seconds_column(
+        reader, 'timedelta64[D]', numpy.datetime64(epoch.date(), 'D'),
+        lambda seconds: seconds / 86400)
+
+
+def _restore_datetime_column(reader, missing_values, epoch):
+    return _restore_seconds_column(
+        reader, 'timedelta64[s]', numpy.datetime64(epoch, 's'),
+        lambda seconds: seconds)
+
+
+def _restore_time_column(reader, missing_values, epoch):
+    return _restore_seconds_column(
+        reader, 'timedelta64[us]', numpy.timedelta64(0, 'us'),
+        lambda seconds: numpy.round(numpy.mod(seconds, 86400) * 1e6))
+
+
+def _restore_numeric_column(dtype):
+    def factory(reader, missing_values, epoch):
+        sysmis = reader.sysmis
+
+        def convert(values):
+            data = numpy.array(values, dtype='float64')
+            mask = data <= sysmis
+            data[mask] = 0
+            return numpy.ma.masked_array(data.astype(dtype), mask=mask)
+
+        return convert
+
+    return factory
+
+
+def _restore_object_column(restore):
+    def convert(values):
+        data = numpy.empty(len(values), dtype=object)
+        data[:] = [restore(value) for value in values]
+        mask = numpy.array([value is None for value in data], dtype=bool)
+        return numpy.ma.masked_array(data, mask=mask)
+
+    return convert
+
+
+def _restore_checked_column(field, restore):
+    """Return a column converter checking the constraints of a field on the restored
+    masked array, or None if some constraints can't be checked a column at a time.
+    """
+    checks = []
+    for name, constraint in field.constraints.items():
+        if name == 'required':
+            if constraint:
+                checks.append((name, _check_column_required))
+        elif name in ('minimum', 'maximum') and field.type in _RESTORE_COLUMN_BOUNDS:
+            bound = field.cast_value(constraint, constraints=False)
+            bound = _RESTORE_COLUMN_BOUNDS[field.type](bound)
+            checks.append((name, _check_column_bound(name, bound)))
+        else:
+            return None
+
+    def convert(values):
+        column = restore(values)
+        data = numpy.ma.getdata(column)
+        mask = numpy.ma.getmaskarray(column)
+        for name, check in checks:
+            failed = check(data, mask)
+            if failed.any():
+                index = int(numpy.argmax(failed))
+                value = None if mask[index] else data[index].tolist()
+                message = ('Field "{}" has constraint "{}" which is not satisfied '
+                           'for value "{}"').format(field.name, name, value)
+                raise tableschema.exceptions.CastError(message)
+        return column
+
+    return convert
+
+
+def _check_column_required(data, mask):
+    return mask
+
+
+def _check_column_bound(name, bound):
+    def check(data, mask):
+        failed = data < bound if name == 'minimum' else data > bound
+        return failed & ~mask
+
+    return check
+
+
+_RESTORE_COLUMN_BOUNDS = {
+    'integer': int,
+    'number': float,
+    'date': lambda value: numpy.datetime64(value, 'D'),
+    'datetime': lambda value: numpy.datetime64(value, 'us'),
+    'time': lambda value: numpy.timedelta64(
+        ((value.hour * 60 + value.minute) * 60 + value.second) * 10 ** 6 +
+        value.microsecond, 'us'),
+}
+_RESTORE_COLUMN_CONVERTERS = {
+    ('string', 'string'): _restore_string_column,
+    ('date', 'date'): _restore_date_column,
+    ('datetime', 'datetime'): _restore_datetime_column,
+    ('time', 'time'): _restore_time_column,
+    ('numeric', 'integer'): _restore_numeric_column('int64'),
+    ('numeric', 'number'): _restore_numeric_column('float64'),
+}
+
+
+def _restore_string_key(reader, missing_values, epoch):
+    encoding = reader.fileEncoding
+    missing_values = set(value.encode(encoding) for value in missing_values)
+
+    def key(value):
+        value = value.rstrip()
+        return None if value in missing_values else value
+
+    def column(values):
+        data = numpy.array([value.rstrip() for value in values], dtype=bytes)
+        return data, numpy.isin(data, list(missing_values))
+
+    key.literal = lambda value: value.encode(encoding)
+    if numpy is not None:
+        key.column = column
+    return key
+
+
+def _restore_numeric_key(scale, literal):
+    """Return a factory of keys of SPSS numbers mapped by `scale` to the cast precision.
+    """
+    def factory(reader, missing_values, epoch):
+        sysmis = reader.sysmis
+
+        def key(value):
+            return None if value <= sysmis else scale(value)
+
+        def column(values):
+            data = numpy.array(values, dtype='float64')
+            mask = data <= sysmis
+            data[mask] = 0
+            return scale(data), mask
+
+        key.literal = functools.partial(literal, epoch)
+        if numpy is not None:
+            key.column = column
+        return key
+
+    return factory
+
+
+def _restore_truncated(value):
+    if numpy is not None and isinstance(value, numpy.ndarray):
+        return numpy.trunc(value)
+    return float(int(value))
+
+
+def _restore_whole_seconds(seconds):
+    # Seconds are rounded to microseconds by `timedelta` before dropping them
+    if numpy is not None and isinstance(seconds, numpy.ndarray):
+        return numpy.floor(numpy.round(seconds, 6))
+    return round(seconds, 6) // 1
+
+
+def _restore_seconds_of_day(seconds):
+    if numpy is not None and isinstance(seconds, numpy.ndarray):
+        return numpy.round(numpy.mod(seconds, 86400), 6)
+    return round(seconds % 86400, 6)
+
+
+def _restore_float_literal(epoch, value):
+    return float(value)
+
+
+def _restore_date_literal(epoch, value):
+    return (value - epoch.date()).days
+
+
+def _restore_datetime_literal(epoch, value):
+    return (value.replace(tzinfo=None) - epoch).total_seconds()
+
+
+def _restore_time_literal(epoch, value):
+    seconds = value.hour * 3600 + value.minute * 60 + value.second
+    return round(seconds + value.microsecond / 1e6, 6)
+
+
+_RESTORE_RAW_KEYS = {
+    ('string', 'string'): _restore_string_key,
+    ('date', 'date'): _restore_numeric_key(
+        lambda seconds: seconds // 86400, _restore_date_literal),
+    ('datetime', 'datetime'): _restore_numeric_key(
+        _restore_whole_seconds, _restore_datetime_literal),
+    ('time', 'time'): _restore_numeric_key(
+        _restore_seconds_of_day, _restore_time_literal),
+    ('numeric', 'integer'): _restore_numeric_key(_restore_truncated, _restore_float_literal),
+    ('numeric', 'number'): _restore_numeric_key(lambda value: value, _restore_float_literal),
+}
+
+
+_DEFAULT_FORMATS = {
+    'date': Mapper.DATE_FORMAT,
+    'datetime': Mapper.DATETIME_FORMAT,
+    'time': Mapper.TIME_FORMAT,
+}
+_SPSS_TYPE_MAPPING = [
+    ('string', r'A\d+'),
+    ('number', r'F\d+\.\d+'),  # Basic decimal number
+    ('number', r'[E|N]\d+\.?\d*'),  # Exponent or N format number
+    ('integer', r'F\d+'),  # Integer (must come after Basic decimal in list)
+    ('date', r'[A|E|J|S]?DATE\d+'),  # Various date formats
+    ('datetime', r'DATETIME\d+'),
+    ('time', r'TIME\d+'),
+    ('number', r'DOLLAR\d+'),
+    ('number', r'PCT\d+'),  # Percentage format
+]
+# Alternatives are tried in order, the matched one is given by `match.lastindex`
+_SPSS_TYPE_PATTERN = re.compile(r'\b(?:{})'.format(
+    '|'.join('({})'.format(pattern) for _, pattern in _SPSS_TYPE_MAPPING)))
+_RESTORE_TYPE_CACHE = {}
+
+
+def _restore_record_dtype(struct_format):
+    """Return a NumPy dtype matching a SavReader/SavWriter struct format.
+    """
+    if isinstance(struct_format, bytes):
+        struct_format = struct_format.decode('ascii')
+    byteorder = {'<': '<', '>': '>'}.get(struct_format[0], '=')
+    formats = [byteorder + 'f8' if code == 'd' else 'S' + size
+               for size, code in re.findall(r'(\d*)([ds])', struct_format[1:])]
+    return numpy.dtype([('f%s' % index, format) for index, format in enumerate(formats)])
+
+
+_PANDAS_DTYPES = {
+    'integer': 'Int64',
+    'number': 'float64',
+    'boolean': 'boolean',
+}
+_ARROW_TYPES = {
+    'integer': lambda: pyarrow.int64(),
+    'number': lambda: pyarrow.float64(),
+    'boolean': lambda: pyarrow.bool_(),
+    'date': lambda: pyarrow.date32(),
+    'datetime': lambda: pyarrow.timestamp('s'),
+    'time': lambda: pyarrow.time64('us'),
+}
+_ARROW_COERCERS = {
+    'double': float,
+    'string': six.text_type,
+}
+_SPSS_STRING_FORMAT = re.compile(r'(?P<printFormat>A(HEX)?)(?P<printWid>\d+)', re.IGNORECASE)
+_SPSS_COMPACT_FORMAT = re.compile(r'^[FN][1-3](\.0)?$', re.IGNORECASE)
+_SPSS_COMPRESSIONS = {
+    'none': b'uncompressed',
+    'bytecode': b'standard',
+    'zlib': b'zlib',
+}
+_SMALL_FILE_SIZE = 1024 * 1024
+_SPSS_DATE_FORMATS = {'DATE', 'ADATE', 'EDATE', 'JDATE', 'SDATE'}
+_SPSS_OTHER_DATE_FORMATS = {'WKDAY', 'MONTH', 'MOYR', 'WKYR', 'QYR', 'DTIME'}
@@ -0,0 +1,323 @@
+# -*- coding: utf-8 -*-
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import re
+import operator
+import itertools
+import tableschema
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# Module API
+
+class Predicate(object):
+    """Row filter parsed from a `where` expression
+
+    Expressions compare fields to literals with `=`, `!=` (or `<>`), `<`, `<=`,
+    `>`, `>=`, `in (...)` and `not in (...)`, test missing values with
+    `is null` and `is not null`, and combine tests with `and`, `or`, `not` and
+    parentheses, e.g. `salary >= 30000 and (jobcat in (1, 2) or bdate is null)`.
+    Literals are numbers or quoted text ('single' or "double", doubling quotes
+    to escape them), cast to the type of the compared field. Keywords are case
+    insensitive and field names may be quoted with backticks.
+
+    Comparisons and `in` are false for missing values, so their negations with
+    `not` are true for them. Tests are evaluated on raw values of the file (see
+    `Mapper.restore_raw_keys`), a column at a time for a batch of records if
+    `numpy` is installed.
+
+    # Arguments
+        expression (str): predicate expression
+
+    # Raises
+        StorageError: the expression is invalid
+
+    """
+
+    # Public
+
+    def __init__(self, expression):
+        self.__expression = expression
+        self.__tree = _Parser(expression).parse()
+
+    def __repr__(self):
+        return 'Predicate <{}>'.format(self.__expression)
+
+    @property
+    def fields(self):
+        """Names of the fields tested by the predicate
+
+        # Returns
+            str[]: field names, in order of appearance
+
+        """
+        names = []
+        for node in _iter_tests(self.__tree):
+            if node[1] not in names:
+                names.append(node[1])
+        return names
+
+    def compile(self, positions, keys):
+        """Return a function selecting the records of a batch matching the predicate
+
+        # Arguments
+            positions (int[]): positions of the variables of `fields` in a record
+            keys (func[]): raw keys of the variables of `fields`
+                (see `Mapper.restore_raw_keys`)
+
+        # Raises
+            StorageError: a literal doesn't match the type of its field
+
+        # Returns
+            func: function mapping a list of raw records to the list of matching ones
+
+        """
+        tests = {}
+        for name, position, key in zip(self.fields, positions, keys):
+            tests[name] = (position, key)
+        if numpy is not None and all(hasattr(key, 'column') for key in keys):
+            return _compile_columns(self.__tree, tests)
+        return _compile_rows(self.__tree, tests)
+
+
+# Internal
+
+_TOKEN_PATTERN = re.compile(r'''\s*(?:
+    (?P<number>-?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?) |
+    (?P<text>'(?:[^']|'')*'|"(?:[^"]|"")*") |
+    (?P<operator><=|>=|!=|<>|==|=|<|>|[(),]) |
+    (?P<name>[^\W\d][\w.@#$]*|`[^`]+`)
+)''', re.VERBOSE | re.UNICODE)
+_KEYWORDS = {'and', 'or', 'not', 'in', 'is', 'null'}
+_EXPECTED_TOKENS = {'name': 'a field name', 'operator': 'a comparison operator'}
+_OPERATORS = {
+    '=': operator.eq,
+    '==': operator.eq,
+    '!=': operator.ne,
+    '<>': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+}
+
+
+class _Parser(object):
+    """Recursive descent parser of predicate expressions into tuple trees:
+    ('or', node, ...), ('and', node, ...), ('not', node), ('compare', name, op, value),
+    ('in', name, values) and ('null', name).
+    """
+
+    def __init__(self, expression):
+        self.__expression = expression
+        self.__tokens = list(_tokenize(expression))
+        self.__position = 0
+
+    def parse(self):
+        node = self.__parse_or()
+        if self.__peek() is not None:
+            self.__fail('unexpected "{}"'.format(self.__peek()[1]))
+        return node
+
+    def __parse_or(self):
+        nodes = [self.__parse_and()]
+        while self.__accept('keyword', 'or'):
+            nodes.append(self.__parse_and())
+        return nodes[0] if len(nodes) == 1 else ('or',) + tuple(nodes)
+
+    def __parse_and(self):
+        nodes = [self.__parse_not()]
+        while self.__accept('keyword', 'and'):
+            nodes.append(self.__parse_not())
+        return nodes[0] if len(nodes) == 1 else ('and',) + tuple(nodes)
+
+    def __parse_not(self):
+        if self.__accept('keyword', 'not'):
+            return ('not', self.__parse_not())
+        if self.__accept('operator', '('):
+            node = self.__parse_or()
+            self.__expect('operator', ')')
+            return node
+        return self.__parse_test()
+
+    def __parse_test(self):
+        name = self.__expect('name')
+        if self.__accept('keyword', 'is'):
+            negate = self.__accept('keyword', 'not')
+            self.__expect('keyword', 'null')
+            return ('not', ('null', name)) if negate else ('null', name)
+        negate = self.__accept('keyword', 'not')
+        if negate or self.__accept('keyword', 'in'):
+            if negate:
+                self.__expect('keyword', 'in')
+            self.__expect('operator', '(')
+            values = [self.__expect_literal()]
+            while self.__accept('operator', ','):
+                values.append(self.__expect_literal())
+            self.__expect('operator', ')')
+            return ('not', ('in', name, values)) if negate else ('in', name, values)
+        op = self.__expect('operator')
+        if op not in _OPERATORS:
+            self.__fail('unexpected "{}"'.format(op))
+        return ('compare', name, op, self.__expect_literal())
+
+    def __expect_literal(self):
+        token = self.__peek()
+        if token is None or token[0] not in ('number', 'text'):
+            self.__fail('expected a number or a quoted text')
+        self.__position += 1
+        return token[1]
+
+    def __expect(self, kind, value=None):
+        token = self.__peek()
+        if token is None or token[0] != kind or value not in (None, token[1]):
+            expected = '"{}"'.format(value) if value else _EXPECTED_TOKENS[kind]
+            self.__fail('expected {}'.format(expected))
+        self.__position += 1
+        return token[1]
+
+    def __accept(self, kind, value):
+        token = self.__peek()
+        if token is not None and token == (kind, value):
+            self.__position += 1
+            return True
+        return False
+
+    def __peek(self):
+        if self.__position < len(self.__tokens):
+            return self.__tokens[self.__position]
+        return None
+
+    def __fail(self, reason):
+        message = 'Invalid where expression "{}": {}.'.format(self.__expression, reason)
+        raise tableschema.exceptions.StorageError(message)
+
+
+def _tokenize(expression):
+    """Yield (kind, value) tokens of a predicate expression.
+    """
+    position = 0
+    expression = expression.rstrip()
+    while position < len(expression):
+        match = _TOKEN_PATTERN.match(expression, position)
+        if match is None:
+            message = 'Invalid where expression "{}": unexpected "{}".'.format(
+                expression, expression[position:].strip())
+            raise tableschema.exceptions.StorageError(message)
+        position = match.end()
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == 'number':
+            value = float(value) if any(char in value for char in '.eE') else int(value)
+        elif kind == 'text':
+            value = value[1:-1].replace(value[0] * 2, value[0])
+        elif kind == 'name' and value.startswith('`'):
+            value = value[1:-1]
+        elif kind == 'name' and value.lower() in _KEYWORDS:
+            kind, value = 'keyword', value.lower()
+        yield kind, value
+
+
+def _iter_tests(node):
+    """Yield the leaf ('compare', 'in' and 'null') nodes of a tree.
+    """
+    if node[0] in ('or', 'and', 'not'):
+        for child in node[1:]:
+            for test in _iter_tests(child):
+                yield test
+    else:
+        yield node
+
+
+def _convert_literal(key, name, value):
+    """Return a literal mapped to the raw key domain of a field.
+    """
+    try:
+        return key.literal(value)
+    except (tableschema.exceptions.CastError, TypeError, ValueError):
+        message = 'Value {!r} doesn\'t match the type of field "{}".'.format(value, name)
+        raise tableschema.exceptions.StorageError(message)
+
+
+def _compile_rows(tree, tests):
+    """Return a function selecting matching records tested one at a time.
+    """
+    test = _compile_row_test(tree, tests)
+
+    def select(records):
+        return [record for record in records if test(record)]
+
+    return select
+
+
+def _compile_row_test(node, tests):
+    kind = node[0]
+    if kind in ('or', 'and'):
+        children = [_compile_row_test(child, tests) for child in node[1:]]
+        combine = any if kind == 'or' else all
+        return lambda record: combine(child(record) for child in children)
+    if kind == 'not':
+        child = _compile_row_test(node[1], tests)
+        return lambda record: not child(record)
+    position, key = tests[node[1]]
+    if kind == 'null':
+        return lambda record: key(record[position]) is None
+    if kind == 'in':
+        values = set(_convert_literal(key, node[1], value) for value in node[2])
+
+        def test(record):
+            value = key(record[position])
+            return value is not None and value in values
+
+        return test
+    compare = _OPERATORS[node[2]]
+    literal = _convert_literal(key, node[1], node[3])
+
+    def test(record):
+        value = key(record[position])
+        return value is not None and compare(value, literal)
+
+    return test
+
+
+def _compile_columns(tree, tests):
+    """Return a function selecting matching records tested a column at a time.
+    """
+    test = _compile_column_test(tree, tests)
+
+    def select(records):
+        if not records:
+            return []
+        columns = {}
+        for name, (position, key) in tests.items():
+            columns[name] = key.column([record[position] for record in records])
+        return list(itertools.compress(records, test(columns).tolist()))
+
+    return select
+
+
+def _compile_column_test(node, tests):
+    kind = node[0]
+    if kind in ('or', 'and'):
+        children = [_compile_column_test(child, tests) for child in node[1:]]
+        combine = numpy.logical_or if kind == 'or' else numpy.logical_and
+        return lambda columns: combine.reduce([child(columns) for child in children])
+    if kind == 'not':
+        child = _compile_column_test(node[1], tests)
+        return lambda columns: ~child(columns)
+    name = node[1]
+    key = tests[name][1]
+    if kind == 'null':
+        return lambda columns: columns[name][1]
+    if kind == 'in':
+        values = [_convert_literal(key, name, value) for value in node[2]]
+        return lambda columns: numpy.isin(columns[name][0], values) & ~columns[name][1]
+    compare = _OPERATORS[node[2]]
+    literal = _convert_literal(key, name, node[3])
+    return lambda columns: compare(columns[name][0], literal) & ~columns[name][1]
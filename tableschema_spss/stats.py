@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+from __future__ import division
+from __future__ import print_function
+from __future__ import absolute_import
+from __future__ import unicode_literals
+
+import six
+import math
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# Module API
+
+class ColumnStats(object):
+    """Statistics of a column of raw values, updated a chunk at a time
+
+    Values are compared and counted by their raw key (see
+    `Mapper.restore_raw_keys`), so chunks are summarised with NumPy without
+    casting values: only the minimum and maximum are cast when the result is
+    read. Requires `numpy` to be installed.
+
+    # Arguments
+        field (tableschema.Field): field of the column
+        key (func): raw key of the column variable
+        convert (func): converter of the column variable
+            (see `Mapper.restore_converters`)
+
+    """
+
+    # Public
+
+    def __init__(self, field, key, convert):
+        self.__field = field
+        self.__key = key
+        self.__convert = convert
+        self.__count = 0
+        self.__nulls = 0
+        self.__total = 0.0
+        self.__min = None
+        self.__max = None
+        self.__distinct = HyperLogLog()
+
+    def update(self, values):
+        """Update statistics with a chunk of raw values
+
+        # Arguments
+            values (list): raw values of the column
+
+        """
+        data, mask = self.__get_keys(values)
+        valid = data[~mask]
+        self.__nulls += len(values) - len(valid)
+        self.__count += len(valid)
+        if not len(valid):
+            return
+        if valid.dtype.kind == 'f':
+            indices = numpy.flatnonzero(~mask)
+            self.__update_extremes(
+                (valid.min(), values[indices[valid.argmin()]]),
+                (valid.max(), values[indices[valid.argmax()]]))
+            self.__total += float(valid.sum())
+            self.__distinct.update(valid)
+            return
+        keys = valid.tolist()
+        minimum, maximum = min(keys), max(keys)
+        self.__update_extremes((minimum, minimum), (maximum, maximum))
+        if not hasattr(self.__key, 'column'):
+            # Fallback keys are cast values, hashed by their text
+            valid = numpy.array([six.text_type(key).encode('utf-8') for key in keys],
+                                dtype=bytes)
+        self.__distinct.update(valid)
+
+    def result(self):
+        """Return statistics of the values seen
+
+        # Returns
+            dict: `count` (non missing values), `nulls` (missing values), `min`,
+                `max`, `mean` (integer and number fields, else None) and
+                `distinct` (estimated number of distinct values)
+
+        """
+        restore = self.__convert if hasattr(self.__key, 'column') else _identity
+        mean = None
+        if self.__count and self.__field.type in ('integer', 'number'):
+            mean = self.__total / self.__count
+        return {
+            'count': self.__count,
+            'nulls': self.__nulls,
+            'min': None if self.__min is None else restore(self.__min[1]),
+            'max': None if self.__max is None else restore(self.__max[1]),
+            'mean': mean,
+            'distinct': self.__distinct.estimate(),
+        }
+
+    # Private
+
+    def __get_keys(self, values):
+        column = getattr(self.__key, 'column', None)
+        if column is not None:
+            return column(values)
+        data = numpy.empty(len(values), dtype=object)
+        data[:] = [self.__key(value) for value in values]
+        return data, numpy.array([value is None for value in data], dtype=bool)
+
+    def __update_extremes(self, minimum, maximum):
+        if self.__min is None or minimum[0] < self.__min[0]:
+            self.__min = minimum
+        if self.__max is None or maximum[0] > self.__max[0]:
+            self.__max = maximum
+
+
+class HyperLogLog(object):
+    """HyperLogLog estimator of the number of distinct values
+
+    Values are hashed to 64 bits: the first `precision` bits select one of
+    `2 ** precision` registers keeping the highest rank (position of the
+    first set bit) of the remaining bits. The relative error of estimates is
+    about `1.04 / sqrt(2 ** precision)`, 0.8% by default, and small numbers of
+    distinct values are counted almost exactly. Requires `numpy` to be installed.
+
+    # Arguments
+        precision (int): number of bits selecting a register, from 4 to 18
+
+    """
+
+    # Public
+
+    def __init__(self, precision=14):
+        if not 4 <= precision <= 18:
+            raise ValueError('precision must be from 4 to 18')
+        self.__precision = precision
+        self.__registers = numpy.zeros(2 ** precision, dtype='uint8')
+
+    def update(self, values):
+        """Add values to the estimate
+
+        # Arguments
+            values (numpy.ndarray): float or bytes array of values
+
+        """
+        if not len(values):
+            return
+        hashes = _hash_values(values)
+        precision = numpy.uint64(self.__precision)
+        indices = (hashes >> numpy.uint64(64) - precision).astype('intp')
+        # Remaining bits with a sentinel bit so ranks are at most 65 - precision
+        rest = hashes << precision | numpy.uint64(1) << precision - numpy.uint64(1)
+        ranks = (65 - _bit_length(rest)).astype('uint8')
+        numpy.maximum.at(self.__registers, indices, ranks)
+
+    def estimate(self):
+        """Estimate the number of distinct values added
+
+        # Returns
+            int: estimated number of distinct values
+
+        """
+        size = len(self.__registers)
+        alpha = 0.7213 / (1 + 1.079 / size)
+        powers = numpy.ldexp(1.0, -self.__registers.astype('int32'))
+        estimate = alpha * size * size / numpy.sum(powers)
+        zeros = int(numpy.count_nonzero(self.__registers == 0))
+        if estimate <= 2.5 * size and zeros:
+            estimate = size * math.log(size / zeros)
+        return int(round(estimate))
+
+
+# Internal
+
+_MIX_MULTIPLIERS = (0xbf58476d1ce4e5b9, 0x94d049bb133111eb)
+
+
+def _identity(value):
+    return value
+
+
+def _hash_values(values):
+    """Return 64-bit hashes of a float or bytes array.
+    """
+    if values.dtype.kind == 'f':
+        # Add 0 so -0.0 hashes like 0.0
+        return _mix(numpy.ascontiguousarray(values + 0.0, dtype='<f8').view('<u8'))
+    width = values.dtype.itemsize
+    words = -(-width // 8)
+    buffer = numpy.zeros((len(values), words * 8), dtype='uint8')
+    buffer[:, :width] = numpy.ascontiguousarray(values).view('uint8').reshape(len(values), width)
+    buffer = buffer.view('<u8')
+    # Arrays are padded to their longest value, so only words of each value are mixed
+    lengths = numpy.char.str_len(values)
+    hashes = lengths.astype('uint64')
+    for word in range(words):
+        hashes = numpy.where(lengths > word * 8, _mix(hashes ^ buffer[:, word]), hashes)
+    return hashes
+
+
+def _mix(hashes):
+    """Mix bits of 64-bit integers (SplitMix64 finalizer).
+    """
+    first, second = (numpy.uint64(multiplier) for multiplier in _MIX_MULTIPLIERS)
+    hashes = (hashes ^ (hashes >> numpy.uint64(30))) * first
+    hashes = (hashes ^ (hashes >> numpy.uint64(27))) * second
+    return hashes ^ (hashes >> numpy.uint64(31))
+
+
+def _bit_length(values):
+    """Return bit lengths of positive 64-bit integers.
+    """
+    # Halves are exactly representable as floats, whose exponent is the bit length
+    high = numpy.frexp((values >> numpy.uint64(32)).astype('float64'))[1]
+    low = numpy.frexp((values & numpy.uint64(0xffffffff)).astype('float64'))[1]
+    return numpy.where(high > 0, high + 32, low)
@@ -4,13 +4,34 @@ from __future__ import print_function
 from __future__ import absolute_import
 from __future__ import unicode_literals
 
+import io
 import os
-import re
+import csv
 import six
-import datetime
+import copy
+import time
+import ctypes
+import random
+import struct
+import itertools
+import threading
+import collections
+import multiprocessing
 import tableschema
 import savReaderWriter
 from .mapper import Mapper
+from .cache import FileCache
+from .index import CaseIndex, remove_index
+from .predicate import Predicate
+from .stats import ColumnStats
+try:
+    import numpy
+except ImportError:
+    numpy = None
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
 
 
 # Module API
@@ -31,15 +52,43 @@ class Storage(object):
             a valid directory path where .sav files can be created and read.
             If no base_path is provided, the Storage object methods
             will accept file paths rather than bucket names.
+        metrics (func):
+            an optional sink called with a dict for each measured phase of an
+            operation. Dicts have `operation`, `bucket`, `phase` and `seconds` keys,
+            plus `rows`, `bytes` or `buckets` counters where relevant.
+        compression (str):
+            default compression of created buckets (see `create`)
+        index (bool):
+            if True, case indexes of compressed buckets are built and kept when
+            reading from a case other than the first one (see `build_index`).
+            Indexes that can't be saved, e.g. in read-only directories, are only
+            kept in memory.
 
     """
 
     # Public
 
-    def __init__(self, base_path=None):
+    # Descriptors restored from .sav headers, shared by all storages. Configure its
+    # size with `Storage.descriptor_cache.maxsize = N` and invalidate entries with
+    # `Storage.descriptor_cache.invalidate(file_path=None)`.
+    descriptor_cache = FileCache(maxsize=128)
+
+    # File metadata read from .sav headers by `info`, shared by all storages
+    info_cache = FileCache(maxsize=1024)
+
+    # Case indexes loaded from sidecar files, shared by all storages
+    index_cache = FileCache(maxsize=128)
+
+    # Column statistics computed by `stats`, shared by all storages
+    stats_cache = FileCache(maxsize=128)
+
+    def __init__(self, base_path=None, metrics=None, compression=None, index=False):
         self.__descriptors = {}
         self.__buckets = None
         self.__mapper = Mapper()
+        self.__metrics = metrics
+        self.__compression = compression
+        self.__index = index
         if base_path is not None and not os.path.isdir(base_path):
             message = '"{}" is not a directory, or doesn\'t exist'.format(base_path)
             raise tableschema.exceptions.StorageError(message)
@@ -64,7 +113,22 @@ class Storage(object):
         """
         return self.__buckets
 
-    def create(self, bucket, descriptor, force=False):
+    def create(self, bucket, descriptor, force=False, compression=None, row_count=None):
+        """Create buckets
+
+        # Arguments
+            bucket (str/str[]): bucket name or list of names
+            descriptor (dict/dict[]): descriptor or list of descriptors
+            force (bool): overwrite existing buckets
+            compression (str): `none`, `bytecode`, `zlib` or `auto` (see
+                `Mapper.choose_compression`). Defaults to the storage compression,
+                or else to the file extension: zlib for `.zsav`, bytecode otherwise.
+                Rows appended later keep the compression of the file, except that
+                `none` files are write once: the SPSS I/O library can't append to
+                them, so all rows must be written by a single `write` or writer.
+            row_count (int): expected number of rows, used by `auto`
+
+        """
 
         # Make lists
         buckets = bucket
@@ -93,15 +157,17 @@ class Storage(object):
             # Create .sav file
             tableschema.validate(descriptor)
             file_path = self.__get_safe_file_path(bucket)
+            self.descriptor_cache.invalidate(file_path)
+            self.info_cache.invalidate(file_path)
+            self.index_cache.invalidate(file_path)
+            self.stats_cache.invalidate(file_path)
 
             if not force and os.path.exists(file_path):
                 message = 'File "%s" already exists.' % file_path
                 raise tableschema.exceptions.StorageError(message)
 
-            # map descriptor to sav header format so we can use the method below.
-            kwargs = self.__mapper.convert_descriptor(descriptor)
-            writer = savReaderWriter.SavWriter(file_path, ioUtf8=True, **kwargs)
-            writer.close()
+            self.__create_file(bucket, file_path, descriptor,
+                               compression or self.__compression, row_count)
 
         if self.buckets is not None:
             self.__reindex_buckets()
@@ -128,6 +194,11 @@ class Storage(object):
                 del self.__descriptors[bucket]
 
             file_path = self.__get_safe_file_path(bucket)
+            self.descriptor_cache.invalidate(file_path)
+            self.info_cache.invalidate(file_path)
+            self.index_cache.invalidate(file_path)
+            self.stats_cache.invalidate(file_path)
+            remove_index(file_path)
             if os.path.exists(file_path):
                 os.remove(file_path)
             elif not ignore:
@@ -148,72 +219,706 @@ class Storage(object):
             descriptor = self.__descriptors.get(bucket)
             if descriptor is None:
                 file_path = self.__get_safe_file_path(bucket, check_exists=True)
-                with savReaderWriter.SavHeaderReader(file_path, ioUtf8=True) as header:
-                    descriptor = self.__mapper.restore_descriptor(header.all())
+                emit = self.__get_emit('describe', bucket)
+                descriptor = copy.deepcopy(self.descriptor_cache.get(
+                    file_path, lambda path: _restore_descriptor(path, emit=emit)))
 
         return descriptor
 
-    def iter(self, bucket):
+    def count(self, bucket):
+        """Count bucket rows.
 
-        # Prepare
-        descriptor = self.describe(bucket)
-        schema = tableschema.Schema(descriptor)
+        The number of cases is read from the file header, no case is read.
+
+        # Arguments
+            bucket (str): bucket name
+
+        # Returns
+            int: number of rows
+
+        """
         file_path = self.__get_safe_file_path(bucket, check_exists=True)
+        case_count = _read_header_record(file_path)[1]
+        if case_count < 0:
+            # Some writers leave the number of cases unknown (-1)
+            case_count = self.info(bucket)['rows']
+        return case_count
 
-        # Yield rows
-        with savReaderWriter.SavReader(file_path, ioUtf8=False, rawMode=False) as reader:
-            for r in reader:
-                row = []
-                for i, field in enumerate(schema.fields):
-                    value = r[i]
-                    # Fix decimals that should be integers
-                    if field.type == 'integer' and value is not None:
-                        value = int(float(value))
-                    # We need to decode bytes to strings
-                    if isinstance(value, six.binary_type):
-                        value = value.decode(reader.fileEncoding)
-                    # Time values need a decimal, add one if missing.
-                    if field.type == 'time' and not re.search(r'\.\d*', value):
-                        value = '{}.0'.format(value)
-                    row.append(value)
-                yield schema.cast_row(row)
-
-    def read(self, bucket):
-        return list(self.iter(bucket))
+    def info(self, bucket):
+        """Get bucket file metadata.
 
-    def write(self, bucket, rows):
+        Metadata is read from the file header and kept in `Storage.info_cache`,
+        keyed by file identity like descriptors (see `describe`).
+
+        # Arguments
+            bucket (str): bucket name
+
+        # Returns
+            dict: `rows` (number of cases), `vars` (number of variables),
+                `compression` (`none`, `bytecode` or `zlib`), `encoding` (Python
+                codec name of the file encoding) and `file_size` (bytes)
+
+        """
         file_path = self.__get_safe_file_path(bucket, check_exists=True)
+        return dict(self.info_cache.get(file_path, _read_info))
 
-        descriptor = self.describe(bucket)
-        kwargs = self.__mapper.convert_descriptor(descriptor)
+    def stats(self, bucket, fields=None):
+        """Get bucket column statistics.
+
+        Requires `numpy` to be installed. Statistics are computed in one pass over
+        chunks of records, a column at a time on raw values (see
+        `Mapper.restore_raw_keys`) so values are never cast, and kept in
+        `Storage.stats_cache` keyed by file identity like descriptors (see
+        `describe`). Statistics of fields not cached yet are computed together.
+
+        # Arguments
+            bucket (str): bucket name
+            fields (str[]): names of the fields, in the returned order.
+                If None all fields are included.
+
+        # Returns
+            OrderedDict: dict mapping field names to dicts of `count` (number of
+                values not missing), `nulls` (number of missing values), `min`
+                and `max` (cast values), `mean` (float, for integer and number
+                fields only) and `distinct` (HyperLogLog estimate of the number
+                of distinct values, within about 1%)
+
+        """
+        if numpy is None:
+            message = 'Computing statistics requires "numpy" to be installed.'
+            raise tableschema.exceptions.StorageError(message)
+        descriptor, _ = _project_descriptor(self.describe(bucket), fields)
+        names = [field['name'] for field in descriptor['fields']]
+        file_path = self.__get_safe_file_path(bucket, check_exists=True)
+        stats = dict(self.stats_cache.get(file_path) or {})
+        missing = [name for name in names if name not in stats]
+        if missing:
+            emit = self.__get_emit('stats', bucket)
+            missing_descriptor, positions = _project_descriptor(self.describe(bucket), missing)
+            stats.update(_compute_stats(file_path, missing_descriptor, positions, emit))
+            self.stats_cache.set(file_path, stats)
+        return collections.OrderedDict((name, dict(stats[name])) for name in names)
+
+    def iter(self, bucket, fields=None, decode=True, prefetch=0, start=0, stop=None,
+             where=None):
+        """Iterate over bucket rows.
+
+        Reading from a `start` case of a compressed bucket decompresses every case
+        before it, unless the bucket has an up to date case index (see
+        `build_index`) to jump straight to it.
+
+        Rows can be filtered by a `where` expression such as
+        `"salary > 30000 and gender = 'f'"` (see `Predicate` for its syntax).
+        It's evaluated on raw values of batches of records, so rows not matching
+        it are never decoded or cast.
+
+        # Arguments
+            bucket (str): bucket name
+            fields (str[]): names of the fields to read, in the returned order.
+                If None all fields are read. Other variables are never decoded or cast.
+            decode (bool): if False, string values are returned as `bytes` in the
+                file encoding, stripped of padding but not decoded
+            prefetch (int): if not 0, records are read by a background thread up
+                to `prefetch` batches of 1024 records ahead of casting, so file I/O
+                overlaps with decoding and casting
+            start (int): number of the first case to read
+            stop (int): number of the case to stop before, None for the last one
+            where (str): expression rows must match, testing any fields of the bucket
+
+        # Raises
+            StorageError: the `where` expression is invalid, or `start` or `stop`
+                is negative
+
+        # Returns
+            list[]: yields rows of cast values
+
+        """
+        _check_case_range(start, stop)
+        bucket_descriptor = self.describe(bucket)
+        descriptor, positions = _project_descriptor(bucket_descriptor, fields)
+        where = _prepare_where(bucket_descriptor, where)
+        file_path = self.__get_safe_file_path(bucket, check_exists=True)
+        emit = self.__get_emit('iter', bucket)
+        if start:
+            self.__ensure_index(bucket, file_path)
+        for row in _iter_rows(file_path, descriptor, positions, start=start, stop=stop,
+                              emit=emit, decode=decode, prefetch=prefetch, where=where):
+            yield row
+
+    def read(self, bucket, fields=None, decode=True, prefetch=0, start=0, stop=None,
+             where=None):
+        """Read bucket rows.
+
+        # Arguments
+            bucket (str): bucket name
+            fields (str[]): names of the fields to read (see `iter`)
+            decode (bool): if False, string values are returned as `bytes` (see `iter`)
+            prefetch (int): number of batches of records read ahead (see `iter`)
+            start (int): number of the first case to read (see `iter`)
+            stop (int): number of the case to stop before, None for the last one
+            where (str): expression rows must match (see `iter`)
+
+        # Returns
+            list[]: rows of cast values
+
+        """
+        return list(self.iter(bucket, fields=fields, decode=decode, prefetch=prefetch,
+                              start=start, stop=stop, where=where))
+
+    def get_rows(self, bucket, indices, fields=None, decode=True):
+        """Get bucket rows by case number.
+
+        Cases are read in ranges of nearby `indices`, seeking from one range to
+        the next (with the case index of the bucket if any, see `build_index`),
+        and only the selected cases are cast.
+
+        # Arguments
+            bucket (str): bucket name
+            indices (int[]): case numbers, in any order. Negative numbers count
+                from the last case.
+            fields (str[]): names of the fields to read (see `iter`)
+            decode (bool): if False, string values are returned as `bytes` (see `iter`)
+
+        # Raises
+            StorageError: a case number is out of range
+
+        # Returns
+            list[]: rows of cast values, in the order of `indices`
+
+        """
+        descriptor, positions = _project_descriptor(self.describe(bucket), fields)
+        file_path = self.__get_safe_file_path(bucket, check_exists=True)
+        self.__ensure_index(bucket, file_path)
+        return _get_rows(file_path, descriptor, positions, indices, decode)
+
+    def sample(self, bucket, n, seed=None, strata=None, fields=None, decode=True):
+        """Get a random sample of bucket rows.
+
+        Without `strata`, `n` case numbers are drawn uniformly from the case count
+        of the file header. With `strata`, only the values of that field are read,
+        keeping a uniform reservoir of cases for each of its values, and `n` is
+        split between values in proportion to their number of cases. Rows of the
+        drawn cases are then read with `get_rows`.
+
+        # Arguments
+            bucket (str): bucket name
+            n (int): number of rows, all rows if the bucket has fewer
+            seed (int): seed of the random number generator, for repeatable samples
+            strata (str): name of the field to stratify the sample by
+            fields (str[]): names of the fields to read (see `iter`)
+            decode (bool): if False, string values are returned as `bytes` (see `iter`)
+
+        # Raises
+            ValueError: `n` is negative
+
+        # Returns
+            list[]: rows of cast values, in file order
+
+        """
+        if n < 0:
+            raise ValueError('n must not be negative')
+        generator = random.Random(seed)
+        if strata is None:
+            count = self.count(bucket)
+            cases = generator.sample(six.moves.range(count), min(n, count))
+        else:
+            values = (row[0] for row in self.iter(bucket, fields=[strata]))
+            cases = _sample_strata(values, n, generator)
+        return self.get_rows(bucket, sorted(cases), fields=fields, decode=decode)
+
+    def build_index(self, bucket, interval=1000):
+        """Build and keep the case index of a compressed bucket.
+
+        The index records where every `interval`-th case starts in one pass over
+        the file, and is saved next to it as a `.idx` sidecar file. Reads starting
+        from a case other than the first one (`iter(start=N)`, `iter_parallel`,
+        `get_rows`) then decode cases from the nearest indexed case. Indexes are ignored once
+        the file size or modification time changes, e.g. after appending rows.
+
+        # Arguments
+            bucket (str): bucket name
+            interval (int): number of cases between indexed cases
+
+        # Raises
+            StorageError: the bucket is uncompressed (its cases have fixed offsets)
+            IOError: the sidecar file can't be written, the index being kept in
+                `Storage.index_cache` only
+
+        # Returns
+            CaseIndex: case index of the bucket
+
+        """
+        file_path = self.__get_safe_file_path(bucket, check_exists=True)
+        return self.__build_index(bucket, file_path, interval)
+
+    def iter_parallel(self, bucket, workers=None, chunk_size=100000, ordered=True,
+                      fields=None, decode=True):
+        """Iterate over bucket rows decoded and cast by a pool of processes.
+
+        The bucket is split into ranges of `chunk_size` cases, each read in a
+        separate process. Rows are yielded a range at a time.
+
+        # Arguments
+            bucket (str): bucket name
+            workers (int): number of processes, defaults to the number of CPUs
+            chunk_size (int): number of cases read by a process at once
+            ordered (bool): if False, ranges are yielded as soon as they are read
+                rather than in file order
+            fields (str[]): names of the fields to read (see `iter`)
+            decode (bool): if False, string values are returned as `bytes` (see `iter`)
+
+        # Returns
+            list[]: yields rows of cast values
+
+        """
+        descriptor, positions = _project_descriptor(self.describe(bucket), fields)
+        file_path = self.__get_safe_file_path(bucket, check_exists=True)
+        count = self.count(bucket)
+        if count > chunk_size:
+            self.__ensure_index(bucket, file_path)
+        tasks = [(file_path, descriptor, positions, start, start + chunk_size, None, decode)
+                 for start in range(0, count, chunk_size)]
+        for rows in _imap(_read_rows, tasks, workers, ordered=ordered):
+            for row in rows:
+                yield row
+
+    def read_parallel(self, bucket, workers=None, chunk_size=100000, fields=None,
+                      decode=True):
+        """Read bucket rows decoded and cast by a pool of processes.
+
+        # Arguments
+            bucket (str): bucket name
+            workers (int): number of processes (see `iter_parallel`)
+            chunk_size (int): number of cases read by a process at once
+            fields (str[]): names of the fields to read (see `iter`)
+            decode (bool): if False, string values are returned as `bytes` (see `iter`)
 
+        # Returns
+            list[]: rows of cast values in file order
+
+        """
+        return list(self.iter_parallel(
+            bucket, workers=workers, chunk_size=chunk_size, fields=fields, decode=decode))
+
+    def describe_many(self, buckets, workers=None):
+        """Describe buckets concurrently.
+
+        Headers of buckets without a known descriptor are read by a pool of
+        processes. Restored descriptors are stored in `Storage.descriptor_cache`.
+
+        # Arguments
+            buckets (str[]): bucket names
+            workers (int): number of processes, defaults to the number of CPUs
+
+        # Returns
+            (str, dict)[]: yields (bucket, descriptor) pairs as buckets are described
+
+        """
+        tasks = []
+        for bucket in buckets:
+            descriptor, file_path = self.__describe_known(bucket)
+            if descriptor is not None:
+                yield bucket, descriptor
+            else:
+                tasks.append((bucket, file_path))
+        for bucket, file_path, descriptor in _imap(_describe_bucket, tasks, workers):
+            self.descriptor_cache.set(file_path, descriptor)
+            yield bucket, copy.deepcopy(descriptor)
+
+    def read_many(self, buckets, workers=None, fields=None, decode=True):
+        """Read buckets concurrently.
+
+        Each bucket is described (if needed), read and cast by a pool of processes.
+
+        # Arguments
+            buckets (str[]): bucket names
+            workers (int): number of processes, defaults to the number of CPUs
+            fields (str[]): names of the fields to read (see `iter`)
+            decode (bool): if False, string values are returned as `bytes` (see `iter`)
+
+        # Returns
+            (str, list[])[]: yields (bucket, rows) pairs as buckets are read
+
+        """
+        tasks = []
+        for bucket in buckets:
+            descriptor, file_path = self.__describe_known(bucket)
+            tasks.append((bucket, file_path, descriptor, fields, decode))
+        for bucket, file_path, descriptor, rows in _imap(_read_bucket, tasks, workers):
+            if descriptor is not None:
+                self.descriptor_cache.set(file_path, descriptor)
+            yield bucket, rows
+
+    def iter_columns(self, bucket, chunk_size=10000, fields=None, where=None):
+        """Iterate over bucket data as chunks of NumPy columns.
+
+        Requires `numpy` to be installed. Values are converted column by column
+        without creating a Python object per cell (see `read_columns`).
+
+        # Arguments
+            bucket (str): bucket name
+            chunk_size (int): maximum number of rows in a chunk
+            fields (str[]): names of the fields to read (see `iter`)
+            where (str): expression rows must match (see `iter`)
+
+        # Returns
+            OrderedDict[]: yields dicts mapping field names to `numpy.ma.MaskedArray`
+            columns of at most `chunk_size` rows
+
+        """
+        for columns in self.__iter_columns(bucket, chunk_size, fields, where):
+            yield columns
+
+    def read_columns(self, bucket, chunk_size=10000, fields=None, where=None):
+        """Read bucket data as NumPy columns.
+
+        Requires `numpy` to be installed. Missing values are masked. Numeric fields
+        are returned as `int64` or `float64` arrays, date and datetime fields as
+        `datetime64` arrays and time fields as `timedelta64` arrays (time of day).
+        Other fields are returned as object arrays of cast values.
+
+        # Arguments
+            bucket (str): bucket name
+            chunk_size (int): number of rows converted at once
+            fields (str[]): names of the fields to read (see `iter`)
+            where (str): expression rows must match (see `iter`)
+
+        # Returns
+            OrderedDict: dict mapping field names to `numpy.ma.MaskedArray` columns
+
+        """
+        chunks = list(self.__iter_columns(bucket, chunk_size, fields, where, empty=True))
+        return collections.OrderedDict(
+            (name, numpy.ma.concatenate([chunk[name] for chunk in chunks]))
+            for name in chunks[0])
+
+    def read_dataframe(self, bucket, fields=None, chunk_size=65536):
+        """Read bucket data as a pandas DataFrame.
+
+        Requires `numpy` and `pandas` to be installed. Columns are built from
+        `read_columns` without casting rows: integer fields are nullable `Int64`
+        columns, number fields `float64` columns, date and datetime fields
+        `datetime64` columns and time fields `timedelta64` columns. Other fields
+        are object columns of cast values.
+
+        # Arguments
+            bucket (str): bucket name
+            fields (str[]): names of the fields to read (see `iter`)
+            chunk_size (int): number of rows converted at once
+
+        # Returns
+            pandas.DataFrame: bucket data
+
+        """
+        descriptor, _ = _project_descriptor(self.describe(bucket), fields)
+        columns = self.read_columns(bucket, chunk_size, fields)
         schema = tableschema.Schema(descriptor)
+        return self.__mapper.restore_dataframe(schema, columns.values())
+
+    def write_dataframe(self, bucket, dataframe, chunk_size=65536):
+        """Write a pandas DataFrame to bucket.
 
-        with savReaderWriter.SavWriter(file_path, mode=b"ab",
-                                       ioUtf8=True, **kwargs) as writer:
-            for r in rows:
-                row = []
-                for i, field in enumerate(schema.fields):
-                    value = r[i]
-                    if field.type == 'date' and isinstance(value, datetime.date):
-                        value = writer.spssDateTime(
-                            value.strftime(self.__mapper.DATE_FORMAT).encode(),
-                            self.__mapper.DATE_FORMAT)
-                    elif field.type == 'datetime' and isinstance(value, datetime.datetime):
-                        value = writer.spssDateTime(
-                            value.strftime(self.__mapper.DATETIME_FORMAT).encode(),
-                            self.__mapper.DATETIME_FORMAT)
-                    elif field.type == 'time' and isinstance(value, datetime.time):
-                        value = writer.spssDateTime(
-                            value.strftime(self.__mapper.TIME_FORMAT).encode(),
-                            self.__mapper.TIME_FORMAT)
-                    row.append(value)
-                writer.writerow(row)
+        Requires `numpy` and `pandas` to be installed. DataFrame columns are
+        matched to the bucket fields by name and written a column at a time (see
+        `Appender.append_columns`). Missing values (`NaN`, `NaT`, `NA`, None) are
+        written as missing values.
+
+        # Arguments
+            bucket (str): bucket name
+            dataframe (pandas.DataFrame): data to append
+            chunk_size (int): number of rows converted at once
+
+        """
+        names = [field['name'] for field in self.describe(bucket)['fields']]
+        missing = [name for name in names if name not in dataframe.columns]
+        if missing:
+            message = 'DataFrame has no column for fields: %s' % ', '.join(missing)
+            raise tableschema.exceptions.StorageError(message)
+        with self.open_writer(bucket) as writer:
+            for start in range(0, len(dataframe), chunk_size):
+                chunk = dataframe.iloc[start:start + chunk_size]
+                writer.append_columns([_get_series_values(chunk[name]) for name in names])
+
+    def import_csv(self, bucket, csv_path, descriptor, chunk_size=65536, force=False,
+                   encoding='utf-8', compression=None, **options):
+        """Create bucket from a CSV file.
+
+        The CSV file is streamed in chunks of `chunk_size` rows. Cells are converted
+        straight to SPSS values by a plan compiled from the descriptor (see
+        `Mapper.convert_text_converters`) and, with `numpy` installed, chunks are
+        written a column at a time. The first row is a header matching columns to
+        fields by name.
+
+        # Arguments
+            bucket (str): bucket name
+            csv_path (str): CSV file path
+            descriptor (dict): Table Schema descriptor of the bucket
+            chunk_size (int): number of rows converted and written at once
+            force (bool): overwrite an existing bucket (see `create`)
+            encoding (str): CSV file encoding
+            compression (str): bucket compression (see `create`). With `auto`, the
+                number of rows is estimated from the file size and the first chunk.
+            options (dict): `csv.reader` format parameters (e.g. `delimiter`)
+
+        # Raises
+            StorageError: a field has no column or a row doesn't have a cell per column
+            CastError: a cell can't be cast to its field type
+
+        """
+        tableschema.validate(descriptor)
+        schema = tableschema.Schema(descriptor)
+        converters = self.__mapper.convert_text_converters(schema)
+        rows = _iter_csv(csv_path, encoding, **options)
+        header = next(rows, [])
+        positions = []
+        for field in schema.fields:
+            if field.name not in header:
+                message = 'CSV file has no column for field "%s".' % field.name
+                raise tableschema.exceptions.StorageError(message)
+            positions.append(header.index(field.name))
+        # Rows are numbered from the header row, and the bucket is only created
+        # once the first chunk is converted
+        number = 2
+        chunk = list(itertools.islice(rows, chunk_size))
+        columns = _convert_csv_chunk(chunk, number, len(header), positions, converters)
+        row_count = None
+        if (compression or self.__compression) == 'auto':
+            row_count = _estimate_csv_rows(csv_path, chunk, chunk_size)
+        self.create(bucket, descriptor, force=force,
+                    compression=compression, row_count=row_count)
+        with self.open_writer(bucket) as writer:
+            while chunk:
+                if numpy is not None:
+                    writer.append_columns(columns, raw=True)
+                else:
+                    writer.append(zip(*columns))
+                number += len(chunk)
+                chunk = list(itertools.islice(rows, chunk_size))
+                columns = _convert_csv_chunk(chunk, number, len(header),
+                                             positions, converters)
+
+    def export_csv(self, bucket, csv_path, fields=None, encoding='utf-8', **options):
+        """Write bucket data to a CSV file.
+
+        Rows are streamed from `iter` with a header row of field names. Missing
+        values are written as empty cells and temporal values in their field format.
+
+        # Arguments
+            bucket (str): bucket name
+            csv_path (str): CSV file path
+            fields (str[]): names of the fields to write (see `iter`)
+            encoding (str): CSV file encoding
+            options (dict): `csv.writer` format parameters (e.g. `delimiter`)
+
+        """
+        descriptor, _ = _project_descriptor(self.describe(bucket), fields)
+        schema = tableschema.Schema(descriptor)
+        formatters = self.__mapper.restore_text_formatters(schema)
+        plan = [(index, format_value) for index, format_value in enumerate(formatters)
+                if format_value is not None]
+        rows = self.iter(bucket, fields=fields)
+        if plan:
+            rows = _format_rows(rows, plan)
+        _write_csv(csv_path, encoding, schema.field_names, rows, **options)
+
+    def iter_batches(self, bucket, batch_size=65536, fields=None, dictionary=None):
+        """Iterate over bucket data as Arrow record batches.
+
+        Requires `numpy` and `pyarrow` to be installed. The Arrow schema is restored
+        from the bucket descriptor: integer and number fields are `int64` and
+        `float64`, date fields `date32`, datetime fields `timestamp[s]`, time fields
+        `time64[us]` and other fields strings.
+
+        # Arguments
+            bucket (str): bucket name
+            batch_size (int): maximum number of rows per batch
+            fields (str[]): names of the fields to read (see `iter`)
+            dictionary (str[]): names of string fields to dictionary encode, by
+                default those with an SPSS format up to `A8`
+
+        # Returns
+            pyarrow.RecordBatch[]: yields record batches
+
+        """
+        arrow_schema = self.__restore_arrow_schema(bucket, fields, dictionary)
+        for columns in self.__iter_columns(bucket, batch_size, fields):
+            arrays = [self.__mapper.restore_arrow_array(column, arrow_field.type)
+                      for column, arrow_field in zip(columns.values(), arrow_schema)]
+            yield pyarrow.RecordBatch.from_arrays(arrays, schema=arrow_schema)
+
+    def write_parquet(self, bucket, path, batch_size=65536, fields=None,
+                      dictionary=None, **options):
+        """Write bucket data to a Parquet file.
+
+        Batches from `iter_batches` are written as they are read, so memory use is
+        bounded by `batch_size`.
+
+        # Arguments
+            bucket (str): bucket name
+            path (str): Parquet file path
+            batch_size (int): maximum number of rows per batch (and row group)
+            fields (str[]): names of the fields to write (see `iter`)
+            dictionary (str[]): names of string fields to dictionary encode
+                (see `iter_batches`)
+            options (dict): `pyarrow.parquet.ParquetWriter` options
+
+        """
+        arrow_schema = self.__restore_arrow_schema(bucket, fields, dictionary)
+        import pyarrow.parquet
+        writer = pyarrow.parquet.ParquetWriter(path, arrow_schema, **options)
+        try:
+            for batch in self.iter_batches(bucket, batch_size, fields, dictionary):
+                writer.write_table(pyarrow.Table.from_batches([batch]))
+        finally:
+            writer.close()
+
+    def write(self, bucket, rows):
+        with self.open_writer(bucket) as writer:
+            writer.append(rows)
+
+    def open_writer(self, bucket):
+        """Open bucket for repeated appends.
+
+        The file, schema and row converters are prepared once and kept open until
+        the returned appender is closed. Use it as a context manager:
+
+        ```python
+        with storage.open_writer('bucket') as writer:
+            for rows in batches:
+                writer.append(rows)
+        ```
+
+        # Arguments
+            bucket (str): bucket name
+
+        # Returns
+            Appender: appender with an `append(rows)` method
+
+        """
+        file_path = self.__get_safe_file_path(bucket, check_exists=True)
+        descriptor = self.describe(bucket)
+        emit = self.__get_emit('write', bucket)
+        return Appender(file_path, descriptor, mapper=self.__mapper, emit=emit)
 
     # Private
 
+    def __describe_known(self, bucket):
+        """Return bucket descriptor if set or cached (else None) and file path
+        """
+        file_path = self.__get_safe_file_path(bucket, check_exists=True)
+        descriptor = self.__descriptors.get(bucket)
+        if descriptor is None:
+            descriptor = copy.deepcopy(self.descriptor_cache.get(file_path))
+        return descriptor, file_path
+
+    def __iter_columns(self, bucket, chunk_size, fields, where=None, empty=False):
+
+        # Prepare
+        if numpy is None:
+            message = 'Reading columns requires "numpy" to be installed.'
+            raise tableschema.exceptions.StorageError(message)
+        bucket_descriptor = self.describe(bucket)
+        descriptor, positions = _project_descriptor(bucket_descriptor, fields)
+        where = _prepare_where(bucket_descriptor, where)
+        schema = tableschema.Schema(descriptor)
+        file_path = self.__get_safe_file_path(bucket, check_exists=True)
+        emit = self.__get_emit('iter_columns', bucket)
+
+        # Yield chunks (an empty one for a bucket without rows if requested)
+        with savReaderWriter.SavReader(file_path, ioUtf8=False, rawMode=True) as reader:
+            var_names = [reader.varNames[position] for position in positions]
+            converters = self.__mapper.restore_column_converters(schema, reader, var_names)
+            select = _compile_where(reader, where) if where else list
+            records = _iter_records(reader)
+            while True:
+                start = _timer()
+                fetched_chunk = list(itertools.islice(records, chunk_size))
+                chunk = select(fetched_chunk)
+                last = len(fetched_chunk) < chunk_size
+                if not chunk and not (empty and last):
+                    if last:
+                        break
+                    continue
+                fetched = _timer()
+                values = list(zip(*chunk)) or [()] * len(reader.varNames)
+                columns = collections.OrderedDict(
+                    (field.name, convert(values[position]))
+                    for field, convert, position in zip(schema.fields, converters, positions))
+                if emit:
+                    emit('fetch', fetched - start, rows=len(fetched_chunk),
+                         bytes=len(fetched_chunk) * ctypes.sizeof(reader.caseBuffer))
+                    emit('cast', _timer() - fetched, rows=len(chunk))
+                yield columns
+                if last:
+                    break
+                empty = False
+
+    def __restore_arrow_schema(self, bucket, fields, dictionary):
+        if pyarrow is None or numpy is None:
+            message = 'Reading batches requires "numpy" and "pyarrow" to be installed.'
+            raise tableschema.exceptions.StorageError(message)
+        descriptor, _ = _project_descriptor(self.describe(bucket), fields)
+        schema = tableschema.Schema(descriptor)
+        return self.__mapper.restore_arrow_schema(schema, dictionary)
+
+    def __create_file(self, bucket, file_path, descriptor, compression, row_count):
+        # map descriptor to sav header format so we can use the method below.
+        emit = self.__get_emit('create', bucket)
+        start = _timer()
+        kwargs = self.__mapper.convert_descriptor(descriptor)
+        compression = self.__mapper.convert_compression(compression, descriptor, row_count)
+        converted = _timer()
+        writer = _SavWriter(file_path, ioUtf8=True, compression=compression, **kwargs)
+        writer.close()
+        if emit:
+            emit('convert_descriptor', converted - start)
+            emit('header', _timer() - converted, bytes=os.path.getsize(file_path))
+
+    def __ensure_index(self, bucket, file_path):
+        """Build the case index of a compressed bucket if enabled and missing
+        """
+        if (self.__index and _find_index(file_path) is None and
+                _read_header_record(file_path)[0] != _UNCOMPRESSED):
+            self.__build_index(bucket, file_path, save_errors=False)
+
+    def __build_index(self, bucket, file_path, interval=1000, save_errors=True):
+        """Build, cache and save the case index of a bucket (see `build_index`)
+        """
+        start = _timer()
+        index = CaseIndex.build(file_path, interval=interval)
+        self.index_cache.set(file_path, index)
+        try:
+            index.save()
+        except (IOError, OSError):
+            # e.g. read-only directories, the index is then only kept in the cache
+            if save_errors:
+                raise
+        emit = self.__get_emit('build_index', bucket)
+        if emit:
+            emit('index', _timer() - start, rows=len(index))
+        return index
+
     def __reindex_buckets(self):
+        start = _timer()
         self.__buckets = sorted(self.__list_bucket_filenames())
+        emit = self.__get_emit('reindex', None)
+        if emit:
+            emit('reindex', _timer() - start, buckets=len(self.__buckets))
+
+    def __get_emit(self, operation, bucket):
+        """Return a function sending phase measures to the metrics sink, or None
+        """
+        metrics = self.__metrics
+        if metrics is None:
+            return None
+
+        def emit(phase, seconds, **counters):
+            event = {'operation': operation, 'bucket': bucket,
+                     'phase': phase, 'seconds': seconds}
+            event.update(counters)
+            metrics(event)
+
+        return emit
 
     def __list_bucket_filenames(self):
         """Find .sav files at base_path and return bucket filenames
@@ -241,3 +946,679 @@ class Storage(object):
             raise tableschema.exceptions.StorageError(message)
 
         return norm_file_path
+
+
+class Appender(object):
+    """Long-lived appender of rows to a .sav file
+
+    Returned by `Storage.open_writer`.
+
+    # Arguments
+        file_path (str): path of an existing .sav file
+        descriptor (dict): Table Schema descriptor of the file
+        mapper (Mapper): mapper to use, a new one by default
+        emit (func): optional function called with a phase name, its duration in
+            seconds and counters (see `Storage` metrics)
+
+    """
+
+    # Public
+
+    def __init__(self, file_path, descriptor, mapper=None, emit=None):
+        mapper = mapper or Mapper()
+        start = _timer()
+        kwargs = mapper.convert_descriptor(descriptor)
+        schema = tableschema.Schema(descriptor)
+        self.__converters = mapper.convert_converters(schema)
+        self.__mapper = mapper
+        self.__schema = schema
+        converted = _timer()
+        mode, compression = b"ab", None
+        file_compression, case_count = _read_header_record(file_path)
+        if file_compression == _UNCOMPRESSED:
+            # The SPSS I/O library corrupts uncompressed files opened for appending
+            # (it writes a second header), so empty ones are written anew
+            if case_count != 0:
+                message = 'Rows can\'t be appended to the uncompressed file "%s".' % file_path
+                raise tableschema.exceptions.StorageError(message)
+            mode, compression = b"wb", b"uncompressed"
+        self.__writer = _SavWriter(
+            file_path, mode=mode, ioUtf8=True, compression=compression, **kwargs)
+        self.__file_path = file_path
+        self.__emit = emit
+        if emit:
+            self.__size = os.path.getsize(file_path)
+            emit('convert_descriptor', converted - start)
+            emit('open', _timer() - converted)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def append(self, rows):
+        """Append rows
+
+        # Arguments
+            rows (list[]): rows of values matching the descriptor fields
+
+        """
+        if self.__emit:
+            return self.__append_measured(rows)
+        converters = self.__converters
+        writerow = self.__writer.writerow
+        for r in rows:
+            writerow([convert(value) for convert, value in zip(converters, r)])
+
+    def append_columns(self, columns, raw=False):
+        """Append rows given as columns
+
+        Requires `numpy` to be installed. Columns are converted to SPSS records
+        a column at a time and records are written as whole cases.
+
+        # Arguments
+            columns (list[]): one sequence of values per descriptor field, NumPy
+                arrays and pandas series (with `NaN`/`NaT` missing values) included
+            raw (bool): if True, temporal values are already seconds since the
+                SPSS epoch (see `Mapper.convert_text_converters`)
+
+        """
+        start = _timer()
+        records = self.__mapper.convert_records(
+            self.__schema, self.__writer, columns, raw=raw)
+        converted = _timer()
+        _write_records(self.__writer, records)
+        if self.__emit:
+            self.__emit('convert', converted - start, rows=len(records))
+            self.__emit('writerow', _timer() - converted, rows=len(records),
+                        bytes=records.nbytes)
+
+    def close(self):
+        """Close the file
+        """
+        if self.__writer is not None:
+            start = _timer()
+            self.__writer.close()
+            self.__writer = None
+            if self.__emit:
+                size = os.path.getsize(self.__file_path)
+                self.__emit('close', _timer() - start, bytes=size - self.__size)
+
+    # Private
+
+    def __append_measured(self, rows):
+        converters = self.__converters
+        writerow = self.__writer.writerow
+        convert_seconds = writerow_seconds = 0
+        count = 0
+        for r in rows:
+            start = _timer()
+            row = [convert(value) for convert, value in zip(converters, r)]
+            converted = _timer()
+            writerow(row)
+            writerow_seconds += _timer() - converted
+            convert_seconds += converted - start
+            count += 1
+        self.__emit('convert', convert_seconds, rows=count)
+        self.__emit('writerow', writerow_seconds, rows=count,
+                    bytes=count * ctypes.sizeof(self.__writer.caseBuffer))
+
+
+# Internal
+
+class _SavWriter(savReaderWriter.SavWriter):
+    """SavWriter compressing new files as asked rather than by file extension
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.__compression = kwargs.pop('compression', None)
+        super(_SavWriter, self).__init__(*args, **kwargs)
+
+    def _openWrite(self, savFileName, overwrite):
+        super(_SavWriter, self)._openWrite(savFileName, overwrite)
+        if self.__compression is not None:
+            self.fileCompression = self.__compression
+
+
+def _read_header_record(file_path):
+    """Return the compression code and number of cases (-1 if unknown) of a .sav file
+    """
+    with io.open(file_path, 'rb') as file:
+        record = file.read(84)
+    if len(record) < 84 or record[:4] not in (b'$FL2', b'$FL3'):
+        message = 'File "%s" is not a SPSS data file.' % file_path
+        raise tableschema.exceptions.StorageError(message)
+    byte_order = '<'
+    if struct.unpack('<i', record[64:68])[0] not in (2, 3):
+        byte_order = '>'
+    return struct.unpack(byte_order + 'i4xi', record[72:84])
+
+
+_timer = getattr(time, 'perf_counter', time.time)
+_UNCOMPRESSED = 0
+_BATCH_SIZE = 1024
+_STATS_CHUNK_SIZE = 16384
+_RANGE_GAP = 16
+_COMPRESSED_RANGE_GAP = 4096
+_END = object()
+
+
+def _iter_records(reader, start=0, stop=None, index=None):
+    """Yield raw records of cases `start` to `stop` of a `SavReader`.
+
+    The reader seeks the start case once and then reads cases sequentially,
+    unless the case `index` of its file is passed to decode them from there.
+    """
+    stop = len(reader) if stop is None else min(stop, len(reader))
+    if start >= stop:
+        return
+    if start and index is not None and _is_indexable(reader, index):
+        for record in index.iter_records(reader.unpack_from, start, stop):
+            yield record
+        return
+    if start:
+        _seek_case(reader, start)
+    for _ in six.moves.range(start, stop):
+        yield reader.record
+
+
+def _seek_case(reader, case):
+    """Seek `case` so it's the next case read by a `SavReader`
+    """
+    retcode = reader.seekNextCase(ctypes.c_int(reader.fh), ctypes.c_long(case))
+    if retcode:
+        message = 'Problem seeking case {} (retcode {}).'.format(case, retcode)
+        raise tableschema.exceptions.StorageError(message)
+
+
+def _find_index(file_path):
+    """Return the up to date case index of a file, or None
+    """
+    index = Storage.index_cache.get(file_path)
+    if index is None:
+        index = CaseIndex.load(file_path)
+        if index is not None:
+            Storage.index_cache.set(file_path, index)
+    return index
+
+
+def _is_indexable(reader, index):
+    """Tell whether indexed cases are laid out like the cases of a reader
+    """
+    # Strings longer than 255 bytes are stored in segments with padding
+    return (len(index) == len(reader) and
+            reader.myStruct.size == ctypes.sizeof(reader.caseBuffer) and
+            max(reader.varTypes.values() or [0]) <= 255)
+
+
+def _iter_rows(file_path, descriptor, positions, start=0, stop=None, emit=None,
+               decode=True, prefetch=0, where=None):
+    """Yield cast rows of cases `start` to `stop` for variables at `positions`.
+
+    If `prefetch`, batches of records are read by a background thread up to
+    `prefetch` batches ahead of casting. Records not matching a prepared
+    `where` predicate (see `_prepare_where`) are dropped from batches first.
+    """
+    schema = tableschema.Schema(descriptor)
+    mapper = Mapper()
+    with savReaderWriter.SavReader(file_path, ioUtf8=False, rawMode=True) as reader:
+        var_names = [reader.varNames[position] for position in positions]
+        records = _iter_records(reader, start, stop, _find_index(file_path) if start else None)
+        batches = iter(lambda: list(itertools.islice(records, _BATCH_SIZE)), [])
+        if where:
+            select = _compile_where(reader, where)
+            batches = (batch for batch in six.moves.map(select, batches) if batch)
+        if prefetch:
+            batches = _prefetch(batches, prefetch)
+        try:
+            converters = mapper.restore_batch_converters(schema, reader, var_names, decode)
+            if emit:
+                rows = _iter_measured_rows(reader, batches, var_names, positions,
+                                           converters, emit)
+            else:
+                rows = _cast_batches(batches, positions, converters)
+            for row in rows:
+                yield row
+        finally:
+            # Stop reading before the reader is closed
+            if prefetch:
+                batches.close()
+
+
+def _get_rows(file_path, descriptor, positions, indices, decode=True):
+    """Return cast rows of cases at `indices` for variables at `positions`.
+    """
+    if not indices:
+        return []
+    schema = tableschema.Schema(descriptor)
+    with savReaderWriter.SavReader(file_path, ioUtf8=False, rawMode=True) as reader:
+        count = len(reader)
+        indices = [_normalize_case(index, count) for index in indices]
+        cases = sorted(set(indices))
+        index = _find_index(file_path)
+        if index is not None and not _is_indexable(reader, index):
+            index = None
+        records = dict(_iter_selected_records(reader, cases, index))
+        var_names = [reader.varNames[position] for position in positions]
+        converters = Mapper().restore_batch_converters(schema, reader, var_names, decode)
+        batch = [records[case] for case in cases]
+        rows = dict(zip(cases, _cast_batches([batch], positions, converters)))
+    return [list(rows[index]) for index in indices]
+
+
+def _check_case_range(start, stop):
+    """Check the bounds of a range of cases, which can't count from the end
+    """
+    for name, case in (('start', start), ('stop', stop)):
+        if case is not None and case < 0:
+            message = 'Case range {} {} is negative.'.format(name, case)
+            raise tableschema.exceptions.StorageError(message)
+
+
+def _normalize_case(index, count):
+    """Return a case number for a (negative) index, checking its range
+    """
+    case = index + count if index < 0 else index
+    if not 0 <= case < count:
+        message = 'Case {} is out of range ({} cases).'.format(index, count)
+        raise tableschema.exceptions.StorageError(message)
+    return case
+
+
+def _iter_selected_records(reader, cases, index=None):
+    """Yield (case, raw record) pairs of sorted unique `cases` of a `SavReader`.
+
+    Nearby cases are read in ranges, in one pass with the case `index` of the file
+    if passed. Otherwise the reader seeks each range. Seeking a compressed file
+    decodes its cases again from the start of a compressed buffer, so ranges of
+    compressed files merge cases further apart and skip unselected cases unread.
+    """
+    selected = set(cases)
+    if index is not None:
+        ranges = _group_cases(cases, _RANGE_GAP)
+        for case, record in index.iter_ranges(reader.unpack_from, ranges):
+            if case in selected:
+                yield case, record
+        return
+    gap = _RANGE_GAP
+    if reader.fileCompression != b'uncompressed':
+        gap = _COMPRESSED_RANGE_GAP
+    fh, buffer = ctypes.c_int(reader.fh), ctypes.byref(reader.caseBuffer)
+    position = 0
+    for start, stop in _group_cases(cases, gap):
+        if start != position:
+            _seek_case(reader, start)
+        for case in six.moves.range(start, stop):
+            retcode = reader.wholeCaseIn(fh, buffer)
+            if retcode:
+                message = 'Problem reading case {} (retcode {}).'.format(case, retcode)
+                raise tableschema.exceptions.StorageError(message)
+            if case in selected:
+                yield case, list(reader.unpack_from(reader.caseBuffer))
+        position = stop
+
+
+def _group_cases(cases, gap):
+    """Return (start, stop) ranges of sorted `cases`, merging cases up to `gap` apart
+    """
+    ranges = []
+    for case in cases:
+        if ranges and case - ranges[-1][1] < gap:
+            ranges[-1][1] = case + 1
+        else:
+            ranges.append([case, case + 1])
+    return [tuple(item) for item in ranges]
+
+
+def _sample_strata(values, n, generator):
+    """Return case numbers of a sample of `n` cases stratified by their `values`.
+    """
+    reservoirs = collections.OrderedDict()
+    sizes = collections.Counter()
+    for case, value in enumerate(values):
+        sizes[value] += 1
+        reservoir = reservoirs.setdefault(value, [])
+        if len(reservoir) < n:
+            reservoir.append(case)
+        else:
+            slot = int(generator.random() * sizes[value])
+            if slot < n:
+                reservoir[slot] = case
+    quotas = _allocate_sample([sizes[value] for value in reservoirs], n)
+    cases = []
+    for reservoir, quota in zip(reservoirs.values(), quotas):
+        cases.extend(generator.sample(reservoir, quota))
+    return cases
+
+
+def _allocate_sample(sizes, n):
+    """Split a sample of `n` cases in proportion to stratum `sizes` (largest remainders)
+    """
+    total = sum(sizes)
+    n = min(n, total)
+    quotas = [n * size // total for size in sizes]
+    remainders = sorted(range(len(sizes)), key=lambda item: -(n * sizes[item] % total))
+    for item in remainders[:n - sum(quotas)]:
+        quotas[item] += 1
+    return quotas
+
+
+def _cast_batches(batches, positions, converters):
+    """Yield rows of batches of raw records cast a column at a time.
+    """
+    plan = list(zip(positions, converters))
+    for batch in batches:
+        if not plan:
+            for _ in batch:
+                yield []
+            continue
+        values = list(zip(*batch))
+        for row in zip(*[convert(values[position]) for position, convert in plan]):
+            yield list(row)
+
+
+def _produce(iterator, queue, stopped):
+    """Put (item, error) pairs of `iterator` to `queue` until exhausted or stopped.
+    """
+    try:
+        for item in iterator:
+            if stopped.is_set():
+                return
+            queue.put((item, None))
+        if not stopped.is_set():
+            queue.put((_END, None))
+    except Exception as exception:
+        if not stopped.is_set():
+            queue.put((None, exception))
+
+
+def _prefetch(iterator, size):
+    """Yield items of `iterator` consumed by a background thread up to `size` ahead.
+
+    Closing the returned generator stops and joins the thread.
+    """
+    queue = six.moves.queue.Queue(maxsize=size)
+    stopped = threading.Event()
+    thread = threading.Thread(target=_produce, args=(iterator, queue, stopped))
+    thread.daemon = True
+    thread.start()
+    try:
+        while True:
+            item, error = queue.get()
+            if error is not None:
+                raise error
+            if item is _END:
+                break
+            yield item
+    finally:
+        # Free the queue so a blocked producer notices it's stopped
+        stopped.set()
+        while thread.is_alive():
+            try:
+                queue.get(timeout=0.1)
+            except six.moves.queue.Empty:
+                pass
+        thread.join()
+
+
+def _iter_measured_rows(reader, batches, var_names, positions, converters, emit):
+    """Yield rows of batches cast like `_cast_batches`, timing record fetch,
+    string decoding and casting separately.
+    """
+    decode_plan = []
+    cast_plan = []
+    for index, (var_name, position, convert) in enumerate(
+            zip(var_names, positions, converters)):
+        plan = decode_plan if reader.varTypes[var_name] > 0 else cast_plan
+        plan.append((index, position, convert))
+    fetch_seconds = decode_seconds = cast_seconds = 0
+    count = 0
+    try:
+        while True:
+            start = _timer()
+            batch = next(batches, None)
+            if batch is None:
+                break
+            values = list(zip(*batch))
+            fetched = _timer()
+            columns = [None] * len(converters)
+            for index, position, convert in decode_plan:
+                columns[index] = convert(values[position])
+            decoded = _timer()
+            for index, position, convert in cast_plan:
+                columns[index] = convert(values[position])
+            cast = _timer()
+            fetch_seconds += fetched - start
+            decode_seconds += decoded - fetched
+            cast_seconds += cast - decoded
+            count += len(batch)
+            for row in (zip(*columns) if columns else [()] * len(batch)):
+                yield list(row)
+    finally:
+        emit('fetch', fetch_seconds, rows=count,
+             bytes=count * ctypes.sizeof(reader.caseBuffer))
+        emit('decode', decode_seconds, rows=count)
+        emit('cast', cast_seconds, rows=count)
+
+
+def _write_records(writer, records):
+    """Write a structured array of records as whole cases.
+    """
+    write = writer.wholeCaseOut
+    write.argtypes = [ctypes.c_int, ctypes.c_char_p]
+    data = records.tobytes()
+    size = records.dtype.itemsize
+    for offset in range(0, len(data), size):
+        retcode = write(writer.fh, data[offset:offset + size])
+        if retcode:
+            savReaderWriter.checkErrsWarns('Problem writing row', retcode)
+
+
+def _get_series_values(series):
+    """Return values of a pandas series with missing values as NaN, NaT or None.
+    """
+    if series.dtype.kind in 'biuf':
+        return series.to_numpy(dtype='float64', na_value=numpy.nan)
+    if series.dtype.kind in 'mM':
+        return series.to_numpy()
+    return series.astype(object).where(series.notna(), None).to_numpy()
+
+
+def _iter_csv(csv_path, encoding, **options):
+    """Yield rows of text values of a CSV file.
+    """
+    if six.PY2:
+        with io.open(csv_path, 'rb') as file:
+            for row in csv.reader(file, **options):
+                yield [value.decode(encoding) for value in row]
+    else:
+        with io.open(csv_path, encoding=encoding, newline='') as file:
+            for row in csv.reader(file, **options):
+                yield row
+
+
+def _write_csv(csv_path, encoding, header, rows, **options):
+    """Write a header and rows to a CSV file, None values as empty cells.
+    """
+    if six.PY2:
+        with io.open(csv_path, 'wb') as file:
+            writer = csv.writer(file, **options)
+            for row in itertools.chain([header], rows):
+                writer.writerow([value.encode(encoding) if isinstance(value, six.text_type)
+                                 else value for value in row])
+    else:
+        with io.open(csv_path, 'w', encoding=encoding, newline='') as file:
+            writer = csv.writer(file, **options)
+            writer.writerow(header)
+            writer.writerows(rows)
+
+
+def _convert_csv_chunk(chunk, number, width, positions, converters):
+    """Return columns of SPSS values of a chunk of CSV rows, the first being row `number`.
+    """
+    for offset, row in enumerate(chunk):
+        if len(row) != width:
+            message = 'CSV file row %s has %s cells but the header has %s.' % (
+                number + offset, len(row), width)
+            raise tableschema.exceptions.StorageError(message)
+    values = list(zip(*chunk))
+    return [list(map(convert, values[position])) if values else []
+            for position, convert in zip(positions, converters)]
+
+
+def _estimate_csv_rows(csv_path, chunk, chunk_size):
+    """Estimate the number of rows of a CSV file from its size and first chunk
+    """
+    if len(chunk) < chunk_size:
+        return len(chunk)
+    chunk_bytes = sum(len(cell) + 1 for row in chunk for cell in row)
+    return int(os.path.getsize(csv_path) / max(chunk_bytes, 1) * len(chunk))
+
+
+def _format_rows(rows, plan):
+    """Yield rows with values at plan indexes formatted as text.
+    """
+    for row in rows:
+        for index, format_value in plan:
+            value = row[index]
+            if value is not None:
+                row[index] = format_value(value)
+        yield row
+
+
+def _read_rows(args):
+    """Read cast rows in a worker process (see `_iter_rows`).
+    """
+    return list(_iter_rows(*args))
+
+
+def _restore_descriptor(file_path, emit=None):
+    """Restore descriptor from .sav header.
+    """
+    start = _timer()
+    with savReaderWriter.SavHeaderReader(file_path, ioUtf8=True) as header:
+        metadata = header.all()
+    parsed = _timer()
+    descriptor = Mapper().restore_descriptor(metadata)
+    if emit:
+        emit('header', parsed - start)
+        emit('restore_descriptor', _timer() - parsed)
+    return descriptor
+
+
+def _read_info(file_path):
+    """Read file metadata from .sav header (see `Storage.info`).
+    """
+    with savReaderWriter.SavHeaderReader(file_path, ioUtf8=True) as header:
+        return {
+            'rows': header.nCases,
+            'vars': header.numVars,
+            'compression': Mapper().restore_compression(header.fileCompression),
+            'encoding': header.fileEncoding,
+            'file_size': os.path.getsize(file_path),
+        }
+
+
+def _compute_stats(file_path, descriptor, positions, emit=None):
+    """Compute statistics of variables at `positions` in one pass (see `Storage.stats`).
+    """
+    schema = tableschema.Schema(descriptor)
+    mapper = Mapper()
+    with savReaderWriter.SavReader(file_path, ioUtf8=False, rawMode=True) as reader:
+        var_names = [reader.varNames[position] for position in positions]
+        keys = mapper.restore_raw_keys(schema, reader, var_names)
+        converters = mapper.restore_converters(schema, reader, var_names)
+        columns = [ColumnStats(field, key, convert)
+                   for field, key, convert in zip(schema.fields, keys, converters)]
+        records = _iter_records(reader)
+        fetch_seconds = stats_seconds = count = 0
+        while True:
+            start = _timer()
+            chunk = list(itertools.islice(records, _STATS_CHUNK_SIZE))
+            fetched = _timer()
+            for position, column in zip(positions, columns):
+                column.update([record[position] for record in chunk])
+            fetch_seconds += fetched - start
+            stats_seconds += _timer() - fetched
+            count += len(chunk)
+            if len(chunk) < _STATS_CHUNK_SIZE:
+                break
+        if emit:
+            emit('fetch', fetch_seconds, rows=count,
+                 bytes=count * ctypes.sizeof(reader.caseBuffer))
+            emit('stats', stats_seconds, rows=count)
+    return {field.name: column.result() for field, column in zip(schema.fields, columns)}
+
+
+def _prepare_where(descriptor, where):
+    """Return a parsed `where` predicate, the descriptor of its fields and their positions
+    """
+    if where is None:
+        return None
+    predicate = Predicate(where)
+    descriptor, positions = _project_descriptor(descriptor, predicate.fields)
+    return predicate, descriptor, positions
+
+
+def _compile_where(reader, where):
+    """Return a function selecting records of a `SavReader` matching a prepared predicate
+    """
+    predicate, descriptor, positions = where
+    var_names = [reader.varNames[position] for position in positions]
+    keys = Mapper().restore_raw_keys(tableschema.Schema(descriptor), reader, var_names)
+    return predicate.compile(positions, keys)
+
+
+def _project_descriptor(descriptor, fields):
+    """Return descriptor for `fields` and positions of their variables in a record.
+    """
+    positions = list(range(len(descriptor['fields'])))
+    if fields is None:
+        return descriptor, positions
+    index = {field['name']: position for position, field in enumerate(descriptor['fields'])}
+    for name in fields:
+        if name not in index:
+            message = 'Field "{}" doesn\'t exist.'.format(name)
+            raise tableschema.exceptions.StorageError(message)
+    positions = [index[name] for name in fields]
+    descriptor = dict(descriptor, fields=[descriptor['fields'][p] for p in positions])
+    # Keys may reference fields not projected
+    descriptor.pop('primaryKey', None)
+    descriptor.pop('foreignKeys', None)
+    return descriptor, positions
+
+
+def _describe_bucket(args):
+    """Restore bucket descriptor in a worker process.
+    """
+    bucket, file_path = args
+    return bucket, file_path, _restore_descriptor(file_path)
+
+
+def _read_bucket(args):
+    """Read bucket rows in a worker process, restoring its descriptor if not passed.
+    """
+    bucket, file_path, descriptor, fields, decode = args
+    restored = None
+    if descriptor is None:
+        descriptor = restored = _restore_descriptor(file_path)
+    descriptor, positions = _project_descriptor(descriptor, fields)
+    rows = list(_iter_rows(file_path, descriptor, positions, decode=decode))
+    return bucket, file_path, restored, rows
+
+
+def _imap(func, tasks, workers, ordered=False):
+    """Yield results of `func` applied to `tasks` by a pool of processes.
+    """
+    if not tasks:
+        return
+    pool = multiprocessing.Pool(workers)
+    try:
+        imap = pool.imap if ordered else pool.imap_unordered
+        for result in imap(func, tasks):
+            yield result
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
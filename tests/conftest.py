@@ -0,0 +1,6 @@
+import sys
+
+# Asyncio tests use syntax unavailable before Python 3.6
+collect_ignore = []
+if sys.version_info < (3, 6):
+    collect_ignore.append('test_async_storage.py')
@@ -0,0 +1,91 @@
+import io
+import json
+import pytest
+import asyncio
+import datetime
+import tableschema
+from decimal import Decimal
+from tableschema_spss import AsyncStorage, Storage
+
+
+# Tests
+
+def test_async_storage_read():
+    storage = AsyncStorage(base_path='data')
+    rows = run(storage.read('Employee data.sav', fields=['id', 'gender']))
+    run(storage.close())
+    assert rows[:2] == [[1, 'm'], [2, 'm']]
+    assert len(rows) == 474
+
+
+def test_async_storage_iter():
+    storage = AsyncStorage(base_path='data', prefetch=1, batch_size=100)
+
+    async def collect():
+        return [row async for row in storage.iter('Employee data.sav')]
+
+    assert run(collect()) == Storage(base_path='data').read('Employee data.sav')
+    run(storage.close())
+
+
+def test_async_storage_iter_closed_early():
+    storage = AsyncStorage(base_path='data', workers=1, prefetch=1, batch_size=10)
+
+    async def first():
+        rows = storage.iter('Employee data.sav')
+        row = await rows.__anext__()
+        await rows.aclose()
+        return row
+
+    assert run(first()) == [1, 'm', datetime.date(1952, 2, 3), 15, 3, Decimal('57000'),
+                            Decimal('27000'), 98, 144, 0]
+    # The only worker thread is free again
+    assert run(storage.describe('Employee data.sav'))['fields'][0]['name'] == 'id'
+    run(storage.close())
+
+
+def test_async_storage_iter_error():
+    storage = AsyncStorage(base_path='data')
+
+    async def collect():
+        return [row async for row in storage.iter('Employee data.sav', fields=['none'])]
+
+    try:
+        run(collect())
+        assert False, 'StorageError not raised'
+    except tableschema.exceptions.StorageError:
+        pass
+    run(storage.close())
+
+
+def test_async_storage_write(tmpdir):
+    descriptor = json.load(io.open('data/simple.json', encoding='utf-8'))
+    rows = [[1, 'fred', Decimal('57000'), datetime.date(1952, 2, 3),
+             datetime.datetime(2010, 8, 11, 0, 0, 0), datetime.time(0, 0)]]
+
+    async def create_write_read():
+        async with AsyncStorage(base_path=str(tmpdir)) as storage:
+            await storage.create('bucket', descriptor)
+            await storage.write('bucket', rows)
+            assert await storage.buckets() == ['bucket.sav']
+            assert await storage.count('bucket') == 1
+            assert await storage.get_rows('bucket', [0]) == await storage.read('bucket')
+            assert await storage.sample('bucket', 5) == await storage.read('bucket')
+            return await storage.read('bucket')
+
+    assert run(create_write_read()) == rows
+
+
+def test_async_storage_stats():
+    pytest.importorskip('numpy')
+    storage = AsyncStorage(base_path='data')
+    stats = run(storage.stats('Employee data.sav', fields=['id']))
+    run(storage.close())
+    assert stats['id']['count'] == 474
+    assert stats['id']['max'] == 474
+
+
+# Helpers
+
+def run(coroutine):
+    return asyncio.get_event_loop().run_until_complete(coroutine)
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import io
+import mock
+from tableschema_spss.cache import FileCache, get_file_identity
+
+
+# Tests
+
+def test_file_cache_get(tmpdir):
+    path = str(tmpdir.join('file.sav'))
+    io.open(path, 'wb').write(b'data')
+    compute = mock.Mock(return_value='value')
+    cache = FileCache()
+    assert cache.get(path, compute) == 'value'
+    assert cache.get(path, compute) == 'value'
+    assert compute.call_count == 1
+
+
+def test_file_cache_get_file_changed(tmpdir):
+    path = str(tmpdir.join('file.sav'))
+    io.open(path, 'wb').write(b'data')
+    compute = mock.Mock(return_value='value')
+    cache = FileCache()
+    cache.get(path, compute)
+    io.open(path, 'wb').write(b'more data')
+    cache.get(path, compute)
+    assert compute.call_count == 2
+    assert len(cache) == 1
+
+
+def test_file_cache_maxsize(tmpdir):
+    paths = [str(tmpdir.join('file%s.sav' % index)) for index in range(3)]
+    for path in paths:
+        io.open(path, 'wb').write(b'data')
+    compute = mock.Mock(return_value='value')
+    cache = FileCache(maxsize=2)
+    for path in paths:
+        cache.get(path, compute)
+    assert len(cache) == 2
+    cache.get(paths[0], compute)
+    assert compute.call_count == 4
+    cache.maxsize = 0
+    assert len(cache) == 0
+
+
+def test_file_cache_invalidate(tmpdir):
+    paths = [str(tmpdir.join('file%s.sav' % index)) for index in range(2)]
+    for path in paths:
+        io.open(path, 'wb').write(b'data')
+    compute = mock.Mock(return_value='value')
+    cache = FileCache()
+    for path in paths:
+        cache.get(path, compute)
+    cache.invalidate(paths[0])
+    assert len(cache) == 1
+    cache.invalidate()
+    assert len(cache) == 0
+
+
+def test_get_file_identity(tmpdir):
+    path = str(tmpdir.join('file.sav'))
+    io.open(path, 'wb').write(b'data')
+    real_path, (size, mtime_ns, inode) = get_file_identity(path)
+    assert real_path == os.path.realpath(path)
+    assert size == 4
+    assert inode == os.stat(path).st_ino
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import io
+import shutil
+import pytest
+import tableschema
+import savReaderWriter
+from tableschema_spss.storage import _SavWriter
+from tableschema_spss.index import CaseIndex, get_index_path, remove_index
+
+
+# Tests
+
+def test_case_index_iter_records(tmpdir):
+    path = copy_file(tmpdir, 'Employee data.sav')
+    index = CaseIndex.build(path, interval=7)
+    assert len(index) == 474
+    with savReaderWriter.SavReader(path, ioUtf8=False, rawMode=True) as reader:
+        records = [reader.record for _ in range(len(reader))]
+        for start in [0, 1, 6, 7, 8, 100, 473, 474]:
+            assert list(index.iter_records(reader.unpack_from, start, start + 10)) == \
+                records[start:start + 10]
+        assert list(index.iter_records(reader.unpack_from)) == records
+
+
+def test_case_index_iter_records_zlib(tmpdir):
+    path = str(tmpdir.join('file.zsav'))
+    rows = [[index % 300, 'row %s' % index if index % 5 else ''] for index in range(5000)]
+    with _SavWriter(path, [b'number', b'text'], {b'number': 0, b'text': 12},
+                    ioUtf8=True, compression=b'zlib') as writer:
+        for row in rows:
+            writer.writerow(row)
+    index = CaseIndex.build(path, interval=100)
+    with savReaderWriter.SavReader(path, ioUtf8=False, rawMode=True) as reader:
+        records = list(index.iter_records(reader.unpack_from, 4321, 4323))
+    assert records == [[121.0, b'row 4321'.ljust(16)], [122.0, b'row 4322'.ljust(16)]]
+
+
+def test_case_index_iter_ranges(tmpdir):
+    path = copy_file(tmpdir, 'Employee data.sav')
+    index = CaseIndex.build(path, interval=10)
+    with savReaderWriter.SavReader(path, ioUtf8=False, rawMode=True) as reader:
+        records = [reader.record for _ in range(len(reader))]
+        ranges = [(3, 5), (8, 12), (95, 96), (450, 474)]
+        assert list(index.iter_ranges(reader.unpack_from, ranges)) == \
+            [(case, records[case]) for start, stop in ranges for case in range(start, stop)]
+
+
+def test_case_index_save_load(tmpdir):
+    path = copy_file(tmpdir, 'Employee data.sav')
+    assert CaseIndex.load(path) is None
+    index = CaseIndex.build(path, interval=100)
+    assert index.save() == get_index_path(path)
+    loaded = CaseIndex.load(path)
+    assert (len(loaded), loaded.interval) == (474, 100)
+    io.open(path, 'ab').write(b'changed')
+    assert CaseIndex.load(path) is None
+    remove_index(path)
+    assert not os.path.exists(get_index_path(path))
+
+
+def test_case_index_uncompressed(tmpdir):
+    path = str(tmpdir.join('file.sav'))
+    _SavWriter(path, [b'number'], {b'number': 0}, compression=b'uncompressed').close()
+    with pytest.raises(tableschema.exceptions.StorageError):
+        CaseIndex.build(path)
+
+
+# Helpers
+
+def copy_file(tmpdir, name):
+    path = str(tmpdir.join(name))
+    shutil.copy(os.path.join('data', name), path)
+    return path
@@ -1,7 +1,12 @@
 import io
 import json
+import mock
+import pytest
+import datetime
 import unittest
 import tableschema
+import savReaderWriter
+from decimal import Decimal
 from tableschema_spss.mapper import Mapper
 
 
@@ -14,6 +19,33 @@ def test_mapper_convert_bucket():
     assert mapper.convert_bucket('bucket.zsav') == 'bucket.zsav'
 
 
+
+def test_mapper_convert_compression():
+    mapper = Mapper()
+    assert mapper.convert_compression(None) is None
+    assert mapper.convert_compression('none') == b'uncompressed'
+    assert mapper.convert_compression('bytecode') == b'standard'
+    assert mapper.convert_compression('zlib') == b'zlib'
+    with pytest.raises(tableschema.exceptions.StorageError):
+        mapper.convert_compression('gzip')
+
+
+def test_mapper_choose_compression():
+    mapper = Mapper()
+    strings = {'fields': [
+        {'name': 'id', 'type': 'integer', 'spss:format': 'F8.0'},
+        {'name': 'text', 'type': 'string', 'spss:format': 'A40'}]}
+    codes = {'fields': [
+        {'name': 'q%s' % index, 'type': 'integer', 'spss:format': 'F1.0'}
+        for index in range(3)] + [{'name': 'weight', 'type': 'number'}]}
+    numbers = {'fields': [{'name': 'weight', 'type': 'number'}]}
+    assert mapper.choose_compression(strings) == 'zlib'
+    assert mapper.choose_compression(strings, row_count=1000) == 'bytecode'
+    assert mapper.convert_compression('auto', strings, row_count=10 ** 6) == b'zlib'
+    assert mapper.choose_compression(codes) == 'bytecode'
+    assert mapper.choose_compression(numbers) == 'zlib'
+
+
 class TestMapperConvertDescriptor(unittest.TestCase):
 
     def test_convert_descriptor_simple_descriptor(self):
@@ -72,6 +104,37 @@ class TestMapperConvertDescriptor(unittest.TestCase):
         with self.assertRaises(tableschema.exceptions.StorageError):
             mapper.convert_descriptor(simple_descriptor)
 
+    def test_convert_descriptor_memoised(self):
+        '''Memoised results are not shared with callers.'''
+        mapper = Mapper()
+        simple_descriptor = json.load(io.open('data/simple.json', encoding='utf-8'))
+        kwargs = mapper.convert_descriptor(simple_descriptor)
+        kwargs['varNames'].append('extra')
+        kwargs['formats'].clear()
+        self.assertEqual(mapper.convert_descriptor(simple_descriptor),
+                         Mapper().convert_descriptor(simple_descriptor))
+
+    def test_convert_descriptor_not_json(self):
+        '''Descriptors JSON can't encode are converted without memoising them.'''
+        mapper = Mapper()
+        simple_descriptor = json.load(io.open('data/simple.json', encoding='utf-8'))
+        expected = mapper.convert_descriptor(simple_descriptor)
+        simple_descriptor['fields'][2]['constraints'] = {'minimum': Decimal('0')}
+        simple_descriptor['fields'][3]['default'] = datetime.date(1952, 2, 3)
+        for _ in range(2):
+            self.assertEqual(mapper.convert_descriptor(simple_descriptor), expected)
+
+    def test_convert_descriptor_wide(self):
+        '''Wide descriptors are converted in field order.'''
+        mapper = Mapper()
+        descriptor = {'fields': [{'name': 'var%s' % index, 'type': 'string',
+                                  'spss:format': 'A%s' % (index % 100 + 1)}
+                                 for index in range(5000)]}
+        kwargs = mapper.convert_descriptor(descriptor)
+        self.assertEqual(kwargs['varNames'], ['var%s' % index for index in range(5000)])
+        self.assertEqual(kwargs['varTypes']['var4999'], 100)
+        self.assertEqual(kwargs['formats']['var4999'], 'A100')
+
 
 class TestMapperRestoreType(unittest.TestCase):
 
@@ -145,3 +208,183 @@ class TestMapperRestoreType(unittest.TestCase):
     def test_restore_type_time(self):
         mapper = Mapper()
         self.assertEqual(mapper.restore_type('TIME8'), 'time')
+
+    def test_restore_type_cached(self):
+        '''Repeated formats resolve to the same type.'''
+        mapper = Mapper()
+        for _ in range(2):
+            self.assertEqual(mapper.restore_type('F8.2'), 'number')
+            self.assertEqual(mapper.restore_type('F8'), 'integer')
+            self.assertEqual(mapper.restore_type('WKDAY10'), 'string')
+
+
+class TestMapperConvertConverters(unittest.TestCase):
+
+    def test_convert_converters(self):
+        '''Temporal values are converted to seconds since the SPSS epoch.'''
+        mapper = Mapper()
+        simple_descriptor = json.load(io.open('data/simple.json', encoding='utf-8'))
+        converters = mapper.convert_converters(tableschema.Schema(simple_descriptor))
+        row = [1, 'fred', Decimal('57000'), datetime.date(1952, 2, 3),
+               datetime.datetime(2010, 8, 11, 0, 0, 1), datetime.time(16, 0, 0, 500000)]
+        self.assertEqual([convert(value) for convert, value in zip(converters, row)],
+                         [1, 'fred', Decimal('57000'), 11654150400.0, 13500864001.0,
+                          57600.5])
+
+    def test_convert_converters_none(self):
+        '''Missing values are left unchanged.'''
+        mapper = Mapper()
+        simple_descriptor = json.load(io.open('data/simple.json', encoding='utf-8'))
+        converters = mapper.convert_converters(tableschema.Schema(simple_descriptor))
+        self.assertEqual([convert(None) for convert in converters], [None] * 6)
+
+    def test_convert_column(self):
+        '''Columns are converted in a batch.'''
+        mapper = Mapper()
+        field = tableschema.Field({'name': 'bdate', 'type': 'date'})
+        self.assertEqual(mapper.convert_column(field, [datetime.date(1952, 2, 3), None]),
+                         [11654150400.0, None])
+
+    def test_convert_column_numpy(self):
+        '''NumPy temporal columns are converted in a vectorised way.'''
+        numpy = pytest.importorskip('numpy')
+        mapper = Mapper()
+        field = tableschema.Field({'name': 'bdate', 'type': 'date'})
+        values = numpy.array(['1952-02-03', 'NaT'], dtype='datetime64[D]')
+        self.assertEqual(mapper.convert_column(field, values), [11654150400.0, None])
+        field = tableschema.Field({'name': 'var_datetime', 'type': 'datetime'})
+        values = numpy.array(['2010-08-11T00:00:01'], dtype='datetime64[s]')
+        self.assertEqual(mapper.convert_column(field, values), [13500864001.0])
+        values = numpy.array(['2010-08-11T00:00:01'], dtype='datetime64[ns]')
+        self.assertEqual(mapper.convert_column(field, values), [13500864001.0])
+        field = tableschema.Field({'name': 'var_time', 'type': 'time'})
+        values = numpy.array([57600500], dtype='timedelta64[ms]')
+        self.assertEqual(mapper.convert_column(field, values), [57600.5])
+
+    def test_convert_text_converters(self):
+        '''Text values are converted straight to SPSS values.'''
+        mapper = Mapper()
+        simple_descriptor = json.load(io.open('data/simple.json', encoding='utf-8'))
+        simple_descriptor['fields'][2]['groupChar'] = ','
+        converters = mapper.convert_text_converters(tableschema.Schema(simple_descriptor))
+        row = ['1', 'fred', '57,000', '1952-02-03', '2010-08-11 00:00:01', '16:00:00.5']
+        for _ in range(2):
+            self.assertEqual([convert(value) for convert, value in zip(converters, row)],
+                             [1.0, 'fred', Decimal('57000'), 11654150400.0, 13500864001.0,
+                              57600.5])
+        self.assertEqual([convert('') for convert in converters],
+                         ['' if index == 1 else None for index in range(6)])
+        with self.assertRaises(tableschema.exceptions.CastError):
+            converters[3]('03/02/1952')
+        # Integer fields reject non integral values, like field.cast_value
+        with self.assertRaises(tableschema.exceptions.CastError):
+            converters[0]('1.7')
+
+    def test_convert_records(self):
+        '''Columns are converted to records laid out as the writer case buffer.'''
+        pytest.importorskip('numpy')
+        mapper = Mapper()
+        simple_descriptor = json.load(io.open('data/simple.json', encoding='utf-8'))
+        schema = tableschema.Schema(simple_descriptor)
+        writer = mock.Mock(sysmis=-1e300)
+        writer.myStruct.format = '<d16sdddd'
+        columns = [[1, 2], ['fred', None], [Decimal('57000'), None],
+                   [datetime.date(1952, 2, 3), None], [None, None],
+                   [datetime.time(16, 0, 0, 500000), None]]
+        records = mapper.convert_records(schema, writer, columns)
+        self.assertEqual(records.dtype.itemsize, 56)
+        self.assertEqual(records[0].tolist(), (1.0, b'fred            ', 57000.0,
+                                               11654150400.0, -1e300, 57600.5))
+        self.assertEqual(records[1].tolist(), (2.0, b' ' * 16, -1e300, -1e300,
+                                               -1e300, -1e300))
+
+
+class TestMapperRestoreConverters(unittest.TestCase):
+
+    def test_restore_converters(self):
+        '''Converters cast a raw record to the restored field types.'''
+        mapper = Mapper()
+        with savReaderWriter.SavHeaderReader('data/Employee data.sav', ioUtf8=True) as header:
+            schema = tableschema.Schema(mapper.restore_descriptor(header.all()))
+        with savReaderWriter.SavReader('data/Employee data.sav', rawMode=True) as reader:
+            converters = mapper.restore_converters(schema, reader)
+            row = [convert(value) for convert, value in zip(converters, reader[0])]
+
+        self.assertEqual(row, [1, 'm', datetime.date(1952, 2, 3), 15, 3, Decimal('57000'),
+                               Decimal('27000'), 98, 144, 0])
+
+    def test_restore_converters_bytes(self):
+        '''String values are not decoded when `decode` is False.'''
+        mapper = Mapper()
+        with savReaderWriter.SavHeaderReader('data/Employee data.sav', ioUtf8=True) as header:
+            schema = tableschema.Schema(mapper.restore_descriptor(header.all()))
+        with savReaderWriter.SavReader('data/Employee data.sav', rawMode=True) as reader:
+            converters = mapper.restore_converters(schema, reader, decode=False)
+            row = [convert(value) for convert, value in zip(converters, reader[0])]
+
+        self.assertEqual(row[:3], [1, b'm', datetime.date(1952, 2, 3)])
+
+    def test_restore_batch_converters(self):
+        '''Batch converters cast columns of raw values as row converters do.'''
+        mapper = Mapper()
+        with savReaderWriter.SavHeaderReader('data/Employee data.sav', ioUtf8=True) as header:
+            schema = tableschema.Schema(mapper.restore_descriptor(header.all()))
+        with savReaderWriter.SavReader('data/Employee data.sav', rawMode=True) as reader:
+            records = reader[:20]
+            converters = mapper.restore_converters(schema, reader)
+            batch_converters = mapper.restore_batch_converters(schema, reader)
+            columns = [convert(values) for convert, values in
+                       zip(batch_converters, zip(*records))]
+
+        self.assertEqual([list(row) for row in zip(*columns)],
+                         [[convert(value) for convert, value in zip(converters, r)]
+                          for r in records])
+        self.assertEqual(batch_converters[1](()), [])
+
+    def test_restore_converters_generic_fallback(self):
+        '''Fields not matching their SPSS format are cast from the formatted value.'''
+        mapper = Mapper()
+        descriptor = {'fields': [
+            {'name': 'vehicle', 'type': 'any'},
+            {'name': 'Colour', 'type': 'integer', 'constraints': {'required': True}},
+            {'name': 'hour', 'type': 'string'},
+            {'name': 'helmet', 'type': 'number'},
+            {'name': 'Distance_from_kerb', 'type': 'number'},
+            {'name': 'Passing_distance', 'type': 'any'},
+        ]}
+        schema = tableschema.Schema(descriptor)
+        with savReaderWriter.SavReader('data/test_time_no_decimal.sav', rawMode=True) as reader:
+            converters = mapper.restore_converters(schema, reader)
+            row = [convert(value) for convert, value in zip(converters, reader[0])]
+
+        self.assertEqual(row, [1.0, 1, '16:00:00', Decimal('0'), Decimal('0.5'),
+                               1.8639999999999999])
+
+
+def test_mapper_restore_raw_keys():
+    descriptor = json.load(io.open('data/Employee_expected_descriptor.json', encoding='utf-8'))
+    schema = tableschema.Schema(descriptor)
+    with savReaderWriter.SavReader('data/Employee data.sav', ioUtf8=False,
+                                   rawMode=True) as reader:
+        keys = Mapper().restore_raw_keys(schema, reader)
+        records = [reader.record for _ in range(len(reader))]
+    id, gender, bdate, salary = keys[0], keys[1], keys[2], keys[5]
+    assert [gender(record[1]) for record in records[:2]] == [b'm', b'm']
+    assert gender.literal('f') == b'f'
+    assert bdate(records[0][2]) == bdate.literal('1952-02-03')
+    assert bdate(records[0][2]) < bdate.literal('1952-02-04')
+    assert salary(records[0][5]) == salary.literal(57000) == 57000.0
+    assert id(reader.sysmis) is None
+
+
+def test_mapper_restore_raw_keys_column():
+    pytest.importorskip('numpy')
+    descriptor = json.load(io.open('data/Employee_expected_descriptor.json', encoding='utf-8'))
+    schema = tableschema.Schema(descriptor)
+    with savReaderWriter.SavReader('data/Employee data.sav', ioUtf8=False,
+                                   rawMode=True) as reader:
+        bdate = Mapper().restore_raw_keys(schema, reader)[2]
+        records = [reader.record for _ in range(len(reader))]
+    values, mask = bdate.column([record[2] for record in records])
+    assert values[0] == bdate.literal('1952-02-03')
+    assert mask.sum() == 1
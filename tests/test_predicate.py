@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import pytest
+import tableschema
+try:
+    import numpy
+except ImportError:
+    numpy = None
+from tableschema_spss import predicate
+from tableschema_spss.predicate import Predicate
+
+
+# Tests
+
+def test_predicate_fields():
+    where = Predicate("a > 1 AND (b in ('x', 'it''s') or not `a b` is null) or a < -2.5e1")
+    assert where.fields == ['a', 'b', 'a b']
+
+
+@pytest.mark.parametrize('expression, expected', [
+    ('a = 2', [[2, 'y']]),
+    ('a != 2', [[1, 'x'], [3, '']]),
+    ('a <> 2 and a >= 3', [[3, '']]),
+    ("b in ('x', 'y')", [[1, 'x'], [2, 'y']]),
+    ("b not in ('x')", [[2, 'y'], [3, '']]),
+    ('b is null or a <= 1', [[1, 'x'], [3, '']]),
+    ('not (b is not null)', [[3, '']]),
+    ("b < 'y'", [[1, 'x']]),
+])
+@pytest.mark.parametrize('columns', [True, False])
+def test_predicate_compile(monkeypatch, expression, expected, columns):
+    if not columns:
+        monkeypatch.setattr(predicate, 'numpy', None)
+    elif predicate.numpy is None:
+        pytest.skip('numpy is not installed')
+    where = Predicate(expression)
+    keys = {'a': (0, make_key(int)), 'b': (1, make_key(str))}
+    select = where.compile(*zip(*[keys[name] for name in where.fields]))
+    assert select([[1, 'x'], [2, 'y'], [3, '']]) == expected
+    assert select([]) == []
+
+
+@pytest.mark.parametrize('expression', [
+    '', 'a', 'a >', 'a ~ 1', 'a = b', '(a = 1', 'a = 1 b', 'a is 1', 'a in ()', "a = 'x",
+])
+def test_predicate_invalid(expression):
+    with pytest.raises(tableschema.exceptions.StorageError):
+        Predicate(expression)
+
+
+def test_predicate_invalid_literal():
+    key = make_key(int)
+    with pytest.raises(tableschema.exceptions.StorageError):
+        Predicate("a = 'x'").compile([0], [key])
+
+
+# Helpers
+
+def make_key(type):
+    """Return a raw key of values of `type`, empty strings being missing values
+    """
+    def key(value):
+        return None if value == '' else value
+
+    def column(values):
+        return numpy.array(values), numpy.array([value == '' for value in values])
+
+    key.literal = type
+    if numpy is not None:
+        key.column = column
+    return key
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import pytest
+numpy = pytest.importorskip('numpy')
+from tableschema_spss.stats import HyperLogLog
+
+
+# Tests
+
+def test_hyperloglog_small():
+    hyperloglog = HyperLogLog()
+    assert hyperloglog.estimate() == 0
+    hyperloglog.update(numpy.array([1.0, 2.0, 2.0, 0.0, -0.0]))
+    hyperloglog.update(numpy.array([], dtype='float64'))
+    assert hyperloglog.estimate() == 3
+
+
+def test_hyperloglog_bytes():
+    hyperloglog = HyperLogLog()
+    hyperloglog.update(numpy.array([b'a', b'b', b'a longer value']))
+    hyperloglog.update(numpy.array([b'a', b'b']))
+    assert hyperloglog.estimate() == 3
+
+
+@pytest.mark.parametrize('count', [1000, 100000])
+def test_hyperloglog_estimate(count):
+    hyperloglog = HyperLogLog()
+    values = numpy.arange(count, dtype='float64') / 7
+    for chunk in numpy.array_split(numpy.concatenate([values, values[::3]]), 10):
+        hyperloglog.update(chunk)
+    assert abs(hyperloglog.estimate() - count) < count * 0.03
+
+
+def test_hyperloglog_precision():
+    assert HyperLogLog(precision=4).estimate() == 0
+    with pytest.raises(ValueError):
+        HyperLogLog(precision=20)
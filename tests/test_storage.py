@@ -8,14 +8,19 @@ import os
 import io
 import six
 import json
+import shutil
+import tempfile
+import mock
 import pytest
 import logging
+import threading
 import datetime
 import unittest
 import tableschema
 import savReaderWriter
 from decimal import Decimal
 from tableschema_spss import Storage
+from tableschema_spss.storage import _prefetch
 log = logging.getLogger(__name__)
 
 
@@ -375,6 +380,250 @@ class TestStorageWrite(BaseTestClass):
 
         self.assertEqual(storage.read(self.TEST_FILE_PATH), rows)
 
+    def test_write_read_nul_strings(self):
+        descriptor = {'fields': [
+            {'name': 'i', 'type': 'integer', 'spss:format': 'F8'},
+            {'name': 's', 'type': 'string', 'spss:format': 'A10'}]}
+        rows = [[1, 'a\x00b'], [2, 'c'], [3, 'd']]
+        storage = Storage(base_path=self.TEST_BASE_PATH)
+        storage.create(self.TEST_FILE_NAME, descriptor)
+        storage.write(self.TEST_FILE_NAME, rows)
+        self.assertEqual(storage.read(self.TEST_FILE_NAME), rows)
+        self.assertEqual(storage.read(self.TEST_FILE_NAME, fields=['s']),
+                         [[row[1]] for row in rows])
+
+    def test_write_temporal_values(self):
+        '''Temporal values are written as SPSS seconds and read back.'''
+        simple_descriptor = json.load(io.open('data/simple.json', encoding='utf-8'))
+
+        storage = Storage(base_path=self.TEST_BASE_PATH)
+        storage.create(self.TEST_FILE_NAME, simple_descriptor)
+
+        rows = [[1, 'fred', Decimal('57000'), datetime.date(1582, 10, 15),
+                 datetime.datetime(2010, 8, 11, 13, 14, 15), datetime.time(16, 30, 15, 500000)],
+                [2, 'bob', None, None, None, None]]
+        storage.write(self.TEST_FILE_NAME, rows)
+
+        self.assertEqual(storage.read(self.TEST_FILE_NAME), rows)
+
+    def test_open_writer_appends(self):
+        '''Rows appended in batches through an open writer are all written.'''
+        simple_descriptor = json.load(io.open('data/simple.json', encoding='utf-8'))
+
+        storage = Storage(base_path=self.TEST_BASE_PATH)
+        storage.create(self.TEST_FILE_NAME, simple_descriptor)
+
+        rows = [[index, 'fred', Decimal('57000'), datetime.date(1952, 2, 3),
+                 datetime.datetime(2010, 8, 11, 0, 0, 0), datetime.time(0, 0)]
+                for index in range(1, 7)]
+        with storage.open_writer(self.TEST_FILE_NAME) as writer:
+            writer.append(rows[:2])
+            writer.append(rows[2:5])
+            writer.append(rows[5:])
+
+        self.assertEqual(storage.read(self.TEST_FILE_NAME), rows)
+
+    def test_write_dataframe(self):
+        '''DataFrames are written and read back column by column.'''
+        pandas = pytest.importorskip('pandas')
+        simple_descriptor = json.load(io.open('data/simple.json', encoding='utf-8'))
+        dataframe = pandas.DataFrame({
+            'name': ['fred', None],
+            'person_id': [1, 2],
+            'salary': [57000.5, float('nan')],
+            'bdate': pandas.to_datetime(['1952-02-03', None]),
+            'var_datetime': pandas.to_datetime(['2010-08-11 00:00:01', None]),
+            'var_time': pandas.to_timedelta(['16:00:00.5', None]),
+        })
+
+        storage = Storage(base_path=self.TEST_BASE_PATH)
+        storage.create(self.TEST_FILE_NAME, simple_descriptor)
+        storage.write_dataframe(self.TEST_FILE_NAME, dataframe)
+
+        self.assertEqual(storage.read(self.TEST_FILE_NAME), [
+            [1, 'fred', Decimal('57000.5'), datetime.date(1952, 2, 3),
+             datetime.datetime(2010, 8, 11, 0, 0, 1), datetime.time(16, 0, 0, 500000)],
+            [2, None, None, None, None, None],
+        ])
+        restored = storage.read_dataframe(self.TEST_FILE_NAME)
+        self.assertEqual(list(restored.columns), [
+            'person_id', 'name', 'salary', 'bdate', 'var_datetime', 'var_time'])
+        self.assertEqual(str(restored['person_id'].dtype), 'Int64')
+        self.assertEqual(restored['name'].dtype, object)
+        self.assertEqual(restored['name'].tolist(), ['fred', None])
+        self.assertTrue(restored['bdate'].isna().tolist() == [False, True])
+        self.assertEqual(restored['var_time'][0], pandas.Timedelta('16:00:00.5'))
+
+    def test_read_columns_constraints(self):
+        '''Constrained fields are restored as typed columns and checked.'''
+        pytest.importorskip('numpy')
+        descriptor = {'fields': [
+            {'name': 'person_id', 'type': 'integer', 'spss:format': 'F8',
+             'constraints': {'required': True, 'minimum': 1}},
+            {'name': 'salary', 'type': 'number', 'constraints': {'maximum': 60000}},
+        ]}
+        storage = Storage(base_path=self.TEST_BASE_PATH)
+        storage.create(self.TEST_FILE_NAME, descriptor)
+        storage.write(self.TEST_FILE_NAME, [[1, Decimal('57000')], [2, None]])
+
+        columns = storage.read_columns(self.TEST_FILE_NAME)
+        self.assertEqual(columns['person_id'].dtype, 'int64')
+        self.assertEqual(columns['salary'].dtype, 'float64')
+        self.assertEqual(columns['salary'].tolist(), [57000.0, None])
+        for index, name, constraint in [(0, 'minimum', 2), (0, 'maximum', 1),
+                                        (1, 'required', True), (1, 'minimum', 60000)]:
+            fields = [dict(field, constraints={}) for field in descriptor['fields']]
+            fields[index]['constraints'] = {name: constraint}
+            storage.describe(self.TEST_FILE_NAME, {'fields': fields})
+            with self.assertRaises(tableschema.exceptions.CastError) as context:
+                storage.read_columns(self.TEST_FILE_NAME)
+            self.assertIn('"%s"' % name, str(context.exception))
+        # Other constraints are checked on cast values
+        storage.describe(self.TEST_FILE_NAME, {'fields': [
+            dict(descriptor['fields'][0], constraints={'enum': [1, 2]}),
+            descriptor['fields'][1]]})
+        columns = storage.read_columns(self.TEST_FILE_NAME)
+        self.assertEqual(columns['person_id'].dtype, object)
+        self.assertEqual(columns['person_id'].tolist(), [1, 2])
+
+    def test_write_dataframe_missing_column(self):
+        pandas = pytest.importorskip('pandas')
+        simple_descriptor = json.load(io.open('data/simple.json', encoding='utf-8'))
+        storage = Storage(base_path=self.TEST_BASE_PATH)
+        storage.create(self.TEST_FILE_NAME, simple_descriptor)
+        with self.assertRaises(tableschema.exceptions.StorageError):
+            storage.write_dataframe(self.TEST_FILE_NAME, pandas.DataFrame({'name': ['fred']}))
+
+    def test_import_export_csv(self):
+        '''CSV files are imported and exported without going through Table.'''
+        simple_descriptor = json.load(io.open('data/simple.json', encoding='utf-8'))
+        csv_path = os.path.join(self.TEST_BASE_PATH, 'simple.csv')
+        with io.open(csv_path, 'w', encoding='utf-8') as file:
+            file.write('name,person_id,salary,bdate,var_datetime,var_time,extra\n'
+                       'fred,1,57000.5,1952-02-03,2010-08-11 00:00:01,16:00:00.5,x\n'
+                       ',2,,,,,\n')
+        rows = [
+            [1, 'fred', Decimal('57000.5'), datetime.date(1952, 2, 3),
+             datetime.datetime(2010, 8, 11, 0, 0, 1), datetime.time(16, 0, 0, 500000)],
+            [2, None, None, None, None, None],
+        ]
+
+        storage = Storage(base_path=self.TEST_BASE_PATH)
+        storage.import_csv(self.TEST_FILE_NAME, csv_path, simple_descriptor, chunk_size=1)
+        self.assertEqual(storage.read(self.TEST_FILE_NAME), rows)
+        with mock.patch('tableschema_spss.storage.numpy', None):
+            storage.import_csv(self.TEST_FILE_NAME, csv_path, simple_descriptor, force=True)
+        self.assertEqual(storage.read(self.TEST_FILE_NAME), rows)
+
+        storage.export_csv(self.TEST_FILE_NAME, csv_path, fields=['bdate', 'var_time', 'name'])
+        with io.open(csv_path, encoding='utf-8') as file:
+            self.assertEqual(file.read().splitlines(), [
+                'bdate,var_time,name', '1952-02-03,16:00:00.500000,fred', ',,'])
+
+    def test_import_csv_invalid(self):
+        simple_descriptor = json.load(io.open('data/simple.json', encoding='utf-8'))
+        csv_path = os.path.join(self.TEST_BASE_PATH, 'simple.csv')
+        with io.open(csv_path, 'w', encoding='utf-8') as file:
+            file.write('name,person_id,salary,bdate,var_datetime,var_time\n'
+                       'fred,1,57000,03/02/1952,2010-08-11 00:00:01,16:00:00.5\n')
+
+        storage = Storage(base_path=self.TEST_BASE_PATH)
+        with self.assertRaises(tableschema.exceptions.CastError):
+            storage.import_csv(self.TEST_FILE_NAME, csv_path, simple_descriptor)
+        self.assertFalse(os.path.exists(self.TEST_FILE_PATH))
+        with self.assertRaises(tableschema.exceptions.StorageError):
+            storage.import_csv(self.TEST_FILE_NAME, csv_path, {'fields': [
+                {'name': 'nocolumn', 'type': 'integer'}]}, force=True)
+
+    def test_import_csv_short_row(self):
+        '''Rows without a cell per column are reported with their number.'''
+        descriptor = {'fields': [{'name': 'i', 'type': 'integer'},
+                                 {'name': 's', 'type': 'string', 'spss:format': 'A8'}]}
+        csv_path = os.path.join(self.TEST_BASE_PATH, 'short.csv')
+        with io.open(csv_path, 'w', encoding='utf-8') as file:
+            file.write('i,s\n1,a\n2\n3,c\n')
+
+        storage = Storage(base_path=self.TEST_BASE_PATH)
+        with self.assertRaises(tableschema.exceptions.StorageError) as context:
+            storage.import_csv(self.TEST_FILE_NAME, csv_path, descriptor)
+        self.assertIn('row 3 has 1 cells', str(context.exception))
+        self.assertFalse(os.path.exists(self.TEST_FILE_PATH))
+        with self.assertRaises(tableschema.exceptions.StorageError) as context:
+            storage.import_csv(self.TEST_FILE_NAME, csv_path, descriptor, chunk_size=1)
+        self.assertIn('row 3 has 1 cells', str(context.exception))
+
+    def test_create_compression(self):
+        '''Buckets are compressed as asked, whatever their extension.'''
+        simple_descriptor = json.load(io.open('data/simple.json', encoding='utf-8'))
+        rows = [[1, 'fred', Decimal('57000'), datetime.date(1952, 2, 3),
+                 datetime.datetime(2010, 8, 11, 0, 0, 0), datetime.time(0, 0)]] * 3
+
+        storage = Storage(base_path=self.TEST_BASE_PATH, compression='zlib')
+        for compression, expected in [(None, b'zlib'), ('none', b'uncompressed'),
+                                      ('bytecode', b'standard'), ('zlib', b'zlib')]:
+            storage.create(self.TEST_FILE_NAME, simple_descriptor, force=True,
+                           compression=compression)
+            storage.write(self.TEST_FILE_NAME, rows)
+            if expected == b'uncompressed':
+                with self.assertRaises(tableschema.exceptions.StorageError):
+                    storage.write(self.TEST_FILE_NAME, rows)
+            else:
+                storage.write(self.TEST_FILE_NAME, rows)
+            with savReaderWriter.SavReader(self.TEST_FILE_PATH) as reader:
+                self.assertEqual(reader.fileCompression, expected)
+            self.assertEqual(storage.read(self.TEST_FILE_NAME)[-1][1], 'fred')
+            self.assertEqual(storage.info(self.TEST_FILE_NAME)['compression'],
+                             compression or 'zlib')
+            self.assertEqual(storage.count(self.TEST_FILE_NAME),
+                             3 if compression == 'none' else 6)
+
+    def test_create_compression_invalid(self):
+        simple_descriptor = json.load(io.open('data/simple.json', encoding='utf-8'))
+        storage = Storage(base_path=self.TEST_BASE_PATH)
+        with self.assertRaises(tableschema.exceptions.StorageError):
+            storage.create(self.TEST_FILE_NAME, simple_descriptor, compression='gzip')
+
+    def test_import_csv_compression_auto(self):
+        simple_descriptor = json.load(io.open('data/simple.json', encoding='utf-8'))
+        csv_path = os.path.join(self.TEST_BASE_PATH, 'simple.csv')
+        with io.open(csv_path, 'w', encoding='utf-8') as file:
+            file.write('name,person_id,salary,bdate,var_datetime,var_time\n'
+                       'fred,1,57000,1952-02-03,2010-08-11 00:00:01,16:00:00.5\n')
+
+        storage = Storage(base_path=self.TEST_BASE_PATH)
+        storage.import_csv(self.TEST_FILE_NAME, csv_path, simple_descriptor,
+                           compression='auto')
+        with savReaderWriter.SavReader(self.TEST_FILE_PATH) as reader:
+            self.assertEqual(reader.fileCompression, b'standard')
+        # Small files are compressed too, so rows can be appended to them
+        storage.write(self.TEST_FILE_NAME, storage.read(self.TEST_FILE_NAME))
+        self.assertEqual(len(storage.read(self.TEST_FILE_NAME)), 2)
+
+    def test_write_metrics(self):
+        '''Create and write phases are reported to the metrics sink.'''
+        simple_descriptor = json.load(io.open('data/simple.json', encoding='utf-8'))
+        events = []
+
+        storage = Storage(base_path=self.TEST_BASE_PATH, metrics=events.append)
+        storage.create(self.TEST_FILE_NAME, simple_descriptor)
+        rows = [[1, 'fred', Decimal('57000'), datetime.date(1952, 2, 3),
+                 datetime.datetime(2010, 8, 11, 0, 0, 0), datetime.time(0, 0)]] * 3
+        storage.write(self.TEST_FILE_NAME, rows)
+
+        phases = [(event['operation'], event['phase']) for event in events]
+        self.assertEqual(phases, [
+            ('reindex', 'reindex'),
+            ('create', 'convert_descriptor'), ('create', 'header'),
+            ('reindex', 'reindex'),
+            ('write', 'convert_descriptor'), ('write', 'open'),
+            ('write', 'convert'), ('write', 'writerow'), ('write', 'close'),
+        ])
+        writerow = events[-2]
+        self.assertEqual(writerow['bucket'], self.TEST_FILE_NAME)
+        self.assertEqual(writerow['rows'], 3)
+        self.assertTrue(writerow['bytes'] > 0)
+        self.assertTrue(all(event['seconds'] >= 0 for event in events))
+
     def test_write_file_doesnot_exist(self):
         '''Trying to write to a file that does not exist raises exception.'''
         simple_descriptor = json.load(io.open('data/simple.json', encoding='utf-8'))
@@ -433,6 +682,16 @@ class TestStorageDescribe(BaseTestClass):
         schema = storage.describe('data/Employee data.sav')
         self.assertEqual(expected_schema, schema)
 
+    def test_describe_cached(self):
+        '''Descriptors restored from headers are cached across storages.'''
+        Storage.descriptor_cache.invalidate()
+        expected_schema = Storage().describe('data/Employee data.sav')
+        with mock.patch('savReaderWriter.SavHeaderReader') as header_reader:
+            schema = Storage(base_path='data').describe('Employee data.sav')
+            schema['fields'].pop()
+            self.assertEqual(Storage().describe('data/Employee data.sav'), expected_schema)
+        self.assertFalse(header_reader.called)
+
     def test_describe_no_base_path_invalid(self):
         '''Attempting to describe an invalid file raises exception.'''
         storage = Storage()
@@ -483,6 +742,176 @@ class TestStorageIter_Read(BaseTestClass):
         storage = Storage()
         self._assert_rows(storage.iter('data/Employee data.sav'))
 
+    def test_read_start_stop(self):
+        storage = Storage(base_path=self.READ_TEST_BASE_PATH)
+        rows = storage.read('Employee data.sav')
+        self.assertEqual(storage.read('Employee data.sav', start=5, stop=8), rows[5:8])
+        self.assertEqual(storage.read('Employee data.sav', start=470), rows[470:])
+        self.assertEqual(storage.read('Employee data.sav', start=474), [])
+        self.assertEqual(storage.read('Employee data.sav', start=1000), [])
+        self.assertEqual(storage.read('Employee data.sav', start=472, stop=1000), rows[472:])
+        self.assertEqual(storage.read('Employee data.sav', start=8, stop=5), [])
+        for start, stop in [(-2, None), (-2, 3), (0, -1)]:
+            with self.assertRaises(tableschema.exceptions.StorageError):
+                storage.read('Employee data.sav', start=start, stop=stop)
+
+    def test_read_start_index(self):
+        base_path = tempfile.mkdtemp()
+        try:
+            shutil.copy('data/Employee data.sav', base_path)
+            rows = Storage(base_path=base_path).read('Employee data.sav')
+            storage = Storage(base_path=base_path, index=True)
+            self.assertEqual(storage.read('Employee data.sav', start=300, stop=310),
+                             rows[300:310])
+            index_path = os.path.join(base_path, 'Employee data.sav.idx')
+            self.assertTrue(os.path.exists(index_path))
+            self.assertEqual(storage.build_index('Employee data.sav', interval=50).interval, 50)
+            self.assertEqual(storage.read('Employee data.sav', start=101), rows[101:])
+            self.assertEqual(storage.buckets, ['Employee data.sav'])
+            storage.delete('Employee data.sav')
+            self.assertFalse(os.path.exists(index_path))
+        finally:
+            shutil.rmtree(base_path)
+
+    def test_read_start_index_read_only(self):
+        '''Indexes that can't be saved are kept in memory.'''
+        base_path = tempfile.mkdtemp()
+        try:
+            shutil.copy('data/Employee data.sav', base_path)
+            rows = Storage(base_path=base_path).read('Employee data.sav')
+            storage = Storage(base_path=base_path, index=True)
+            error = IOError(13, 'Permission denied')
+            with mock.patch('tableschema_spss.storage.CaseIndex.save', side_effect=error):
+                self.assertEqual(storage.read('Employee data.sav', start=300, stop=310),
+                                 rows[300:310])
+                with self.assertRaises(IOError):
+                    storage.build_index('Employee data.sav')
+            self.assertFalse(os.path.exists(
+                os.path.join(base_path, 'Employee data.sav.idx')))
+            file_path = os.path.join(base_path, 'Employee data.sav')
+            self.assertIsNotNone(Storage.index_cache.get(file_path))
+            Storage.index_cache.invalidate(file_path)
+        finally:
+            shutil.rmtree(base_path)
+
+    def test_read_where(self):
+        storage = Storage(base_path=self.READ_TEST_BASE_PATH)
+        rows = storage.read('Employee data.sav')
+        self.assertEqual(
+            storage.read('Employee data.sav', where="salary > 30000 and gender = 'f'"),
+            [row for row in rows if row[5] > 30000 and row[1] == 'f'])
+        self.assertEqual(
+            storage.read('Employee data.sav', fields=['id'],
+                         where="bdate is null or bdate >= '1965-01-01'", prefetch=2),
+            [row[:1] for row in rows if row[2] is None or row[2] >= datetime.date(1965, 1, 1)])
+        self.assertEqual(storage.read('Employee data.sav', where='id in (3, 1)', start=1),
+                         [rows[2]])
+        with pytest.raises(tableschema.exceptions.StorageError):
+            storage.read('Employee data.sav', where='salary >')
+        with pytest.raises(tableschema.exceptions.StorageError):
+            storage.read('Employee data.sav', where='missing = 1')
+
+    def test_read_where_metrics(self):
+        events = []
+        storage = Storage(base_path=self.READ_TEST_BASE_PATH, metrics=events.append)
+        rows = storage.read('Employee data.sav', where='jobcat = 2')
+        self.assertEqual(len(rows), 27)
+        self.assertEqual([event['rows'] for event in events if event['phase'] == 'cast'], [27])
+
+    def test_get_rows(self):
+        storage = Storage(base_path=self.READ_TEST_BASE_PATH)
+        rows = storage.read('Employee data.sav')
+        indices = [473, 0, 5, 5, 200, -1, 1]
+        self.assertEqual(storage.get_rows('Employee data.sav', indices),
+                         [rows[index] for index in indices])
+        # No case is read for empty indices
+        with mock.patch('tableschema_spss.storage.savReaderWriter.SavReader') as reader:
+            self.assertEqual(storage.get_rows('Employee data.sav', []), [])
+            self.assertEqual(storage.get_rows('Employee data.sav', [], fields=['id']), [])
+        self.assertFalse(reader.called)
+        self.assertEqual(storage.get_rows('Employee data.sav', [2], fields=['id', 'gender']),
+                         [rows[2][:2]])
+        with pytest.raises(tableschema.exceptions.StorageError):
+            storage.get_rows('Employee data.sav', [474])
+
+    def test_get_rows_index(self):
+        base_path = tempfile.mkdtemp()
+        try:
+            shutil.copy('data/Employee data.sav', base_path)
+            storage = Storage(base_path=base_path)
+            rows = storage.read('Employee data.sav')
+            storage.build_index('Employee data.sav', interval=20)
+            indices = [400, 3, 21, 20, 19, 401, 473]
+            self.assertEqual(storage.get_rows('Employee data.sav', indices),
+                             [rows[index] for index in indices])
+        finally:
+            shutil.rmtree(base_path)
+
+    def test_sample(self):
+        storage = Storage(base_path=self.READ_TEST_BASE_PATH)
+        rows = storage.read('Employee data.sav')
+        sample = storage.sample('Employee data.sav', 20, seed=1)
+        self.assertEqual(sample, storage.sample('Employee data.sav', 20, seed=1))
+        self.assertEqual(len(sample), 20)
+        self.assertEqual(sample, sorted(sample, key=rows.index))
+        self.assertTrue(all(row in rows for row in sample))
+        self.assertEqual(storage.sample('Employee data.sav', 1000), rows)
+        self.assertEqual(storage.sample('Employee data.sav', 20, seed=1, fields=['id']),
+                         [row[:1] for row in sample])
+
+    def test_sample_strata(self):
+        storage = Storage(base_path=self.READ_TEST_BASE_PATH)
+        sample = storage.sample('Employee data.sav', 100, seed=1, strata='gender')
+        genders = [row[1] for row in sample]
+        self.assertEqual((genders.count('f'), genders.count('m')), (46, 54))
+        sample = storage.sample('Employee data.sav', 3, strata='minority')
+        self.assertEqual(sorted(row[9] for row in sample), [0, 0, 1])
+
+    def test_count(self):
+        storage = Storage(base_path=self.READ_TEST_BASE_PATH)
+        self.assertEqual(storage.count('Employee data.sav'), 474)
+
+    def test_info(self):
+        storage = Storage(base_path=self.READ_TEST_BASE_PATH)
+        self.assertEqual(storage.info('Employee data.sav'), {
+            'rows': 474, 'vars': 10, 'compression': 'bytecode',
+            'encoding': 'utf_8', 'file_size': 24903})
+        self.assertEqual(storage.info('test_time_no_decimal.sav')['encoding'], 'cp1252')
+
+    def test_stats(self):
+        pytest.importorskip('numpy')
+        storage = Storage(base_path=self.READ_TEST_BASE_PATH)
+        Storage.stats_cache.invalidate()
+        stats = storage.stats('Employee data.sav', fields=['gender', 'bdate', 'salary'])
+        self.assertEqual(list(stats), ['gender', 'bdate', 'salary'])
+        self.assertEqual(stats['gender'], {
+            'count': 474, 'nulls': 0, 'min': 'f', 'max': 'm', 'mean': None, 'distinct': 2})
+        self.assertEqual(
+            [stats['bdate'][key] for key in ['count', 'nulls', 'min', 'max', 'mean']],
+            [473, 1, datetime.date(1929, 2, 10), datetime.date(1971, 2, 10), None])
+        self.assertEqual(
+            [stats['salary'][key] for key in ['min', 'max']],
+            [Decimal('15750.0'), Decimal('135000.0')])
+        self.assertAlmostEqual(stats['salary']['mean'], 34419.5675105)
+        self.assertAlmostEqual(stats['salary']['distinct'], 221, delta=5)
+        self.assertEqual(list(storage.stats('Employee data.sav'))[:2], ['id', 'gender'])
+
+    def test_stats_cache(self):
+        pytest.importorskip('numpy')
+        base_path = tempfile.mkdtemp()
+        try:
+            storage = Storage(base_path=base_path)
+            storage.create('bucket', json.load(io.open('data/simple.json', encoding='utf-8')))
+            storage.write('bucket', [[1, 'fred', Decimal('57000'), None, None, None]])
+            self.assertEqual(storage.stats('bucket', fields=['person_id'])['person_id']['max'], 1)
+            with storage.open_writer('bucket') as writer:
+                writer.append([[3, 'bob', Decimal('1000'), None, None, None]])
+            stats = storage.stats('bucket')
+            self.assertEqual((stats['person_id']['max'], stats['person_id']['mean']), (3, 2.0))
+            self.assertEqual(stats['name']['distinct'], 2)
+        finally:
+            shutil.rmtree(base_path)
+
     def test_read(self):
         storage = Storage(base_path=self.READ_TEST_BASE_PATH)
         self._assert_rows(storage.read('Employee data.sav'))
@@ -491,11 +920,190 @@ class TestStorageIter_Read(BaseTestClass):
         storage = Storage()
         self._assert_rows(storage.read('data/Employee data.sav'))
 
+    def test_iter_metrics(self):
+        events = []
+        storage = Storage(base_path=self.READ_TEST_BASE_PATH, metrics=events.append)
+        Storage.descriptor_cache.invalidate()
+        rows = list(storage.iter('Employee data.sav'))
+        self.assertEqual(rows[:10], self.EXPECTED_DATA)
+        phases = [(event['operation'], event['phase']) for event in events]
+        self.assertEqual(phases[-5:], [
+            ('describe', 'header'), ('describe', 'restore_descriptor'),
+            ('iter', 'fetch'), ('iter', 'decode'), ('iter', 'cast'),
+        ])
+        fetch = events[-3]
+        self.assertEqual(fetch['bucket'], 'Employee data.sav')
+        self.assertEqual(fetch['rows'], 474)
+        self.assertEqual(fetch['bytes'], 474 * 80)
+        unmeasured = Storage(base_path=self.READ_TEST_BASE_PATH)
+        self.assertEqual(rows, unmeasured.read('Employee data.sav'))
+        for options in [{'fields': []}, {'decode': False, 'where': 'id > 400'}]:
+            self.assertEqual(storage.read('Employee data.sav', **options),
+                             unmeasured.read('Employee data.sav', **options))
+
     def test_read_no_base_path_invalid(self):
         storage = Storage()
         with self.assertRaises(tableschema.exceptions.StorageError):
             storage.read('data/no-file-here.sav')
 
+    def test_read_fields(self):
+        storage = Storage(base_path=self.READ_TEST_BASE_PATH)
+        rows = storage.read('Employee data.sav', fields=['salary', 'id'])
+        self.assertEqual(rows[:10], [[row[5], row[0]] for row in self.EXPECTED_DATA])
+
+    def test_read_bytes(self):
+        storage = Storage(base_path=self.READ_TEST_BASE_PATH)
+        rows = storage.read('Employee data.sav', fields=['gender', 'id'], decode=False)
+        self.assertEqual(rows[:3], [[b'm', 1], [b'm', 2], [b'f', 3]])
+
+    def test_read_batches(self):
+        '''Rows are the same whatever the number of records cast at once.'''
+        storage = Storage(base_path=self.READ_TEST_BASE_PATH)
+        rows = storage.read('Employee data.sav')
+        with mock.patch('tableschema_spss.storage._BATCH_SIZE', 100):
+            self.assertEqual(storage.read('Employee data.sav'), rows)
+        self.assertEqual(len(rows), 474)
+
+    def test_read_prefetch(self):
+        storage = Storage(base_path=self.READ_TEST_BASE_PATH)
+        with mock.patch('tableschema_spss.storage._BATCH_SIZE', 100):
+            rows = storage.read('Employee data.sav', prefetch=2)
+        self.assertEqual(rows, storage.read('Employee data.sav'))
+
+    def test_iter_prefetch_closed_early(self):
+        storage = Storage(base_path=self.READ_TEST_BASE_PATH)
+        threads = threading.active_count()
+        with mock.patch('tableschema_spss.storage._BATCH_SIZE', 10):
+            rows = storage.iter('Employee data.sav', prefetch=1)
+            self.assertEqual(six.next(rows), self.EXPECTED_DATA[0])
+            self.assertEqual(threading.active_count(), threads + 1)
+            rows.close()
+        self.assertEqual(threading.active_count(), threads)
+
+    def test_iter_fields(self):
+        storage = Storage(base_path=self.READ_TEST_BASE_PATH)
+        row = six.next(storage.iter('Employee data.sav', fields=['bdate']))
+        self.assertEqual(row, [datetime.date(1952, 2, 3)])
+
+    def test_read_fields_invalid(self):
+        storage = Storage(base_path=self.READ_TEST_BASE_PATH)
+        with self.assertRaises(tableschema.exceptions.StorageError):
+            storage.read('Employee data.sav', fields=['id', 'no-field-here'])
+
+    def test_read_parallel(self):
+        storage = Storage(base_path=self.READ_TEST_BASE_PATH)
+        rows = storage.read_parallel('Employee data.sav', workers=2, chunk_size=100)
+        self.assertEqual(rows, storage.read('Employee data.sav'))
+
+    def test_iter_parallel_unordered_fields(self):
+        storage = Storage(base_path=self.READ_TEST_BASE_PATH)
+        rows = list(storage.iter_parallel('Employee data.sav', workers=2, chunk_size=100,
+                                          ordered=False, fields=['id']))
+        self.assertEqual(sorted(rows), [[index] for index in range(1, 475)])
+
+    def test_read_many(self):
+        storage = Storage(base_path=self.READ_TEST_BASE_PATH)
+        buckets = ['Employee data.sav', 'test_time_no_decimal.sav']
+        results = dict(storage.read_many(buckets, workers=2))
+        self.assertEqual(sorted(results), buckets)
+        for bucket in buckets:
+            self.assertEqual(results[bucket], storage.read(bucket))
+
+    def test_describe_many(self):
+        Storage.descriptor_cache.invalidate()
+        storage = Storage(base_path=self.READ_TEST_BASE_PATH)
+        buckets = ['Employee data.sav', 'test_time_no_decimal.sav']
+        results = dict(storage.describe_many(buckets, workers=2))
+        self.assertEqual(len(Storage.descriptor_cache), 2)
+        for bucket in buckets:
+            self.assertEqual(results[bucket], storage.describe(bucket))
+
+    def test_read_columns_fields(self):
+        pytest.importorskip('numpy')
+        storage = Storage(base_path=self.READ_TEST_BASE_PATH)
+        columns = storage.read_columns('Employee data.sav', fields=['salary', 'id'])
+        self.assertEqual(list(columns), ['salary', 'id'])
+        self.assertEqual(columns['id'][:10].tolist(), [row[0] for row in self.EXPECTED_DATA])
+
+    def test_read_columns(self):
+        numpy = pytest.importorskip('numpy')
+        storage = Storage(base_path=self.READ_TEST_BASE_PATH)
+        columns = storage.read_columns('Employee data.sav', chunk_size=100)
+        rows = storage.read('Employee data.sav')
+        self.assertEqual(list(columns), [field['name'] for field in
+                                         storage.describe('Employee data.sav')['fields']])
+        self.assertEqual(columns['id'].dtype, numpy.int64)
+        self.assertEqual(columns['salary'].dtype, numpy.float64)
+        self.assertEqual(columns['bdate'].dtype, numpy.dtype('datetime64[D]'))
+        self.assertEqual(columns['id'].tolist(), [row[0] for row in rows])
+        self.assertEqual(columns['gender'].tolist(), [row[1] for row in rows])
+        self.assertEqual(columns['bdate'].tolist(), [row[2] for row in rows])
+        self.assertEqual(columns['salary'].tolist(), [row[5] for row in rows])
+
+    def test_read_columns_where(self):
+        pytest.importorskip('numpy')
+        storage = Storage(base_path=self.READ_TEST_BASE_PATH)
+        columns = storage.read_columns('Employee data.sav', chunk_size=100,
+                                       fields=['id'], where='id >= 150 and id < 250')
+        self.assertEqual(columns['id'].tolist(), list(range(150, 250)))
+        chunks = list(storage.iter_columns('Employee data.sav', chunk_size=100,
+                                           where='id > 450'))
+        self.assertEqual([len(chunk['id']) for chunk in chunks], [24])
+        columns = storage.read_columns('Employee data.sav', where='id > 1000')
+        self.assertEqual(len(columns['id']), 0)
+        # The bucket is described once per read
+        with mock.patch.object(storage, 'describe', wraps=storage.describe) as describe:
+            storage.read_columns('Employee data.sav', fields=['id'], where='id = 1')
+            storage.read('Employee data.sav', fields=['id'], where='id = 1')
+        self.assertEqual(describe.call_count, 2)
+
+    def test_iter_columns(self):
+        pytest.importorskip('numpy')
+        storage = Storage(base_path=self.READ_TEST_BASE_PATH)
+        chunks = list(storage.iter_columns('Employee data.sav', chunk_size=100))
+        self.assertEqual([len(chunk['id']) for chunk in chunks], [100, 100, 100, 100, 74])
+
+
+    def test_read_dataframe(self):
+        pandas = pytest.importorskip('pandas')
+        storage = Storage(base_path=self.READ_TEST_BASE_PATH)
+        dataframe = storage.read_dataframe('Employee data.sav', fields=['id', 'bdate', 'salary'])
+        self.assertEqual(len(dataframe), 474)
+        self.assertEqual([str(dtype) for dtype in dataframe.dtypes],
+                         ['Int64', str(dataframe['bdate'].dtype), 'float64'])
+        self.assertEqual(dataframe['bdate'].dtype.kind, 'M')
+        self.assertEqual(dataframe.iloc[0].tolist(),
+                         [1, pandas.Timestamp('1952-02-03'), 57000.0])
+
+    def test_iter_batches(self):
+        pyarrow = pytest.importorskip('pyarrow')
+        storage = Storage(base_path=self.READ_TEST_BASE_PATH)
+        batches = list(storage.iter_batches('Employee data.sav', batch_size=200))
+        self.assertEqual([batch.num_rows for batch in batches], [200, 200, 74])
+        schema = batches[0].schema
+        self.assertEqual(schema.field('id').type, pyarrow.int64())
+        self.assertEqual(schema.field('gender').type,
+                         pyarrow.dictionary(pyarrow.int32(), pyarrow.string()))
+        self.assertEqual(schema.field('bdate').type, pyarrow.date32())
+        self.assertEqual(schema.field('salary').type, pyarrow.float64())
+        self.assertEqual(schema.field('bdate').metadata, {b'spss:format': b'ADATE10'})
+        rows = pyarrow.Table.from_batches(batches).to_pylist()
+        self.assertEqual([list(row.values()) for row in rows[:10]],
+                         [[float(value) if isinstance(value, Decimal) else value
+                           for value in row] for row in self.EXPECTED_DATA])
+
+    def test_write_parquet(self):
+        pytest.importorskip('pyarrow')
+        parquet = pytest.importorskip('pyarrow.parquet')
+        storage = Storage(base_path=self.READ_TEST_BASE_PATH)
+        path = os.path.join(BaseTestClass.get_base_path(), 'employee.parquet')
+        storage.write_parquet('Employee data.sav', path, batch_size=100,
+                              fields=['id', 'gender'], dictionary=[])
+        table = parquet.read_table(path)
+        self.assertEqual(table.column_names, ['id', 'gender'])
+        self.assertEqual(table.num_rows, 474)
+        self.assertEqual(table.column('gender').to_pylist()[:3], ['m', 'm', 'f'])
+
 
 class TestStorageRead_Dates(BaseTestClass):
 
@@ -515,6 +1123,16 @@ class TestStorageRead_Dates(BaseTestClass):
         row = six.next(storage.iter('test_dates.sav'))
         self.assertEqual(row, self.EXPECTED_FIRST_ROW)
 
+    def test_iter_batches_dates(self):
+        pyarrow = pytest.importorskip('pyarrow')
+        storage = Storage(base_path=self.READ_TEST_BASE_PATH)
+        batch, = storage.iter_batches('test_dates.sav')
+        self.assertEqual(batch.schema.field('var_datetime').type, pyarrow.timestamp('s'))
+        self.assertEqual(batch.schema.field('var_time').type, pyarrow.time64('us'))
+        self.assertEqual(batch.column(batch.schema.get_field_index('var_datetime')).to_pylist(),
+                         [datetime.datetime(2010, 8, 11), datetime.datetime(1910, 1, 12),
+                          None, None])
+
     def test_read_time_with_no_decimal(self):
         '''Test file containing time field with no decimals.'''
         storage = Storage(base_path=self.READ_TEST_BASE_PATH)
@@ -522,6 +1140,17 @@ class TestStorageRead_Dates(BaseTestClass):
         row = six.next(storage.iter('test_time_no_decimal.sav'))
         self.assertEqual(row[2], expected_time)
 
+    def test_read_columns_dates(self):
+        numpy = pytest.importorskip('numpy')
+        storage = Storage(base_path=self.READ_TEST_BASE_PATH)
+        columns = storage.read_columns('test_dates.sav')
+        self.assertEqual(columns['var_datetime'][0], numpy.datetime64('2010-08-11T00:00:00'))
+        self.assertEqual(columns['var_date'][0], numpy.datetime64('2010-08-11'))
+        self.assertEqual(columns['var_time'][0], numpy.timedelta64(0, 'us'))
+        self.assertEqual(columns['var_qyr'][0], '3 Q 2010')
+        columns = storage.read_columns('test_time_no_decimal.sav')
+        self.assertEqual(columns['hour'][0], numpy.timedelta64(16, 'h'))
+
 
 class TestStorageDelete(BaseTestClass):
 
@@ -684,6 +1313,18 @@ class TestSafeFilePath(BaseTestClass):
             storage.create('../../delme', self.SIMPLE_DESCRIPTOR)
 
 
+def test_prefetch_error():
+    def iterator():
+        yield 1
+        raise ValueError('failed')
+
+    items = []
+    with pytest.raises(ValueError):
+        for item in _prefetch(iterator(), 1):
+            items.append(item)
+    assert items == [1]
+
+
 # Helpers
 
 def cast(resource, skip=[]):